@@ -48,6 +48,7 @@ def interactive_add_product():
             print("Пожалуйста, введите корректное число.")
     
     image_url = input("Введите URL изображения товара (или оставьте пустым): ")
+    category = input("Введите категорию товара (или оставьте пустым): ").strip()
     
     # Получаем валюты с проверкой
     print(f"Доступные валюты: {', '.join(SUPPORTED_CURRENCIES)}")
@@ -65,6 +66,7 @@ def interactive_add_product():
     print(f"Описание: {description}")
     print(f"Цена: {price_rub} ₽")
     print(f"URL изображения: {image_url or 'Не указан'}")
+    print(f"Категория: {category or 'Не указана'}")
     print(f"Валюты: {', '.join(valid_currencies)}")
     
     confirm = input("\nДобавить товар? (y/n): ").lower()
@@ -74,7 +76,7 @@ def interactive_add_product():
     
     # Добавляем товар в базу данных
     try:
-        product_id = db.add_product(name, description, price_rub, image_url, valid_currencies)
+        product_id = db.add_product(name, description, price_rub, image_url, valid_currencies, category or None)
         print(f"Товар успешно добавлен с ID: {product_id}")
     except Exception as e:
         print(f"Ошибка при добавлении товара: {e}")
@@ -95,7 +97,8 @@ def add_product_from_args(args):
             args.description,
             args.price,
             args.image_url,
-            valid_currencies
+            valid_currencies,
+            args.category
         )
         logging.info(f"Product added successfully with ID: {product_id}")
     except Exception as e:
@@ -116,6 +119,7 @@ def main():
     parser.add_argument('--price', '-p', type=float, help='Product price in RUB')
     parser.add_argument('--image-url', '-img', help='Product image URL')
     parser.add_argument('--currencies', '-c', help='Comma-separated list of supported currencies')
+    parser.add_argument('--category', '-cat', help='Product category')
     
     args = parser.parse_args()
     
@@ -124,7 +128,7 @@ def main():
     elif all([args.name, args.description, args.price]):
         add_product_from_args(args)
     else:
-        if not any([args.name, args.description, args.price, args.image_url, args.currencies]):
+        if not any([args.name, args.description, args.price, args.image_url, args.currencies, args.category]):
             interactive_add_product()
         else:
             parser.error("If not using interactive mode, --name, --description, and --price are required")
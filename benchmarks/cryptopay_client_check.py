@@ -0,0 +1,198 @@
+"""
+Проверка клиента Crypto Pay API (bot/services/cryptopay_client.py) на
+локальном aiohttp-сервере, который отвечает как Crypto Pay
+
+Проверяются формы запросов и ответов createInvoice, getInvoices (в том
+числе пачкой по списку ID) и getBalance, ответ API с ошибкой и HTTP 400,
+HTTP 500 с телом не в JSON и таймаут запроса. Для ошибок проверяется и
+счетчик store_invoice_api_errors_total. При любом расхождении скрипт
+завершается с кодом 1.
+
+Запуск:
+    python benchmarks/cryptopay_client_check.py
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from typing import Any, Callable, Dict, List
+
+from aiohttp import web
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.services import http_client, metrics
+from bot.services.cryptopay_client import CryptoPayClient
+from bot.utils import latency
+
+TOKEN = "12345:CHECK-TOKEN"
+INVOICE = {
+    "invoice_id": 42,
+    "status": "active",
+    "hash": "IVcheck",
+    "asset": "USDT",
+    "amount": "1.5",
+    "pay_url": "https://t.me/CryptoTestnetBot?start=IVcheck",
+    "created_at": "2026-01-01T00:00:00.000Z",
+}
+
+
+class StandIn:
+    """
+    Сервер, отвечающий как Crypto Pay
+
+    Режим ответа задается первым сегментом пути, поэтому для каждого
+    сценария клиент создается со своим base_url: /ok/api, /error/api,
+    /broken/api, /slow/api.
+    """
+
+    def __init__(self, slow_delay: float):
+        self.slow_delay = slow_delay
+        # Полученные запросы: (режим, метод, заголовок токена, JSON тела)
+        self.requests: List[tuple] = []
+        self._runner = None
+        self.base_url = ""
+
+    async def handle(self, request: web.Request) -> web.Response:
+        mode, method = request.match_info["mode"], request.match_info["method"]
+        params = await request.json()
+        self.requests.append((mode, method, request.headers.get("Crypto-Pay-API-Token"), params))
+
+        if mode == "error":
+            return web.json_response({"ok": False, "error": {"code": 400, "name": "AMOUNT_TOO_SMALL"}}, status=400)
+        if mode == "broken":
+            return web.Response(status=500, text="<html>Internal Server Error</html>", content_type="text/html")
+        if mode == "slow":
+            await asyncio.sleep(self.slow_delay)
+
+        if method == "createInvoice":
+            result: Any = {**INVOICE, "asset": params["asset"], "amount": params["amount"]}
+        elif method == "getInvoices":
+            ids = [int(i) for i in params.get("invoice_ids", "").split(",") if i]
+            result = {"items": [{**INVOICE, "invoice_id": i, "status": "paid"} for i in ids]}
+        elif method == "getBalance":
+            result = [{"currency_code": "USDT", "available": "10.5", "onhold": "0"}]
+        else:
+            return web.json_response({"ok": False, "error": {"code": 405, "name": "METHOD_NOT_FOUND"}}, status=405)
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post("/{mode}/api/{method}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", 0).start()
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        await self._runner.cleanup()
+
+
+class Checker:
+    def __init__(self):
+        self.failures = 0
+
+    def check(self, name: str, condition: bool, details: Any = "") -> None:
+        print(f"{'ok  ' if condition else 'FAIL'} {name}" + (f": {details}" if not condition and details else ""))
+        if not condition:
+            self.failures += 1
+
+
+async def check_responses(checker: Checker, stand_in: StandIn) -> None:
+    client = CryptoPayClient(TOKEN, base_url=f"{stand_in.base_url}/ok/api/")
+
+    data = await client.create_invoice("USDT", "1.5", description="Товар", payload="order_7")
+    mode, method, token, params = stand_in.requests[-1]
+    checker.check("createInvoice posts to base_url/createInvoice", (mode, method) == ("ok", "createInvoice"))
+    checker.check("createInvoice sends the API token header", token == TOKEN, token)
+    checker.check("createInvoice sends asset, amount and extra params as JSON",
+                  params == {"asset": "USDT", "amount": "1.5", "description": "Товар", "payload": "order_7"}, params)
+    checker.check("createInvoice returns the raw API response",
+                  data.get("ok") is True and data["result"]["invoice_id"] == 42
+                  and data["result"]["pay_url"] == INVOICE["pay_url"], data)
+
+    data = await client.get_invoices([1, 2, 3])
+    params = stand_in.requests[-1][3]
+    checker.check("getInvoices joins invoice_ids with commas", params == {"invoice_ids": "1,2,3"}, params)
+    checker.check("getInvoices returns result.items",
+                  [item["invoice_id"] for item in data["result"]["items"]] == [1, 2, 3], data)
+
+    data = await client.get_invoices(status="paid")
+    params = stand_in.requests[-1][3]
+    checker.check("getInvoices without IDs passes filters as is", params == {"status": "paid"}, params)
+
+    data = await client.get_balance()
+    mode, method, token, params = stand_in.requests[-1]
+    checker.check("getBalance sends an empty JSON object", (method, params) == ("getBalance", {}), params)
+    checker.check("getBalance returns the balance list",
+                  data.get("ok") is True and data["result"][0]["currency_code"] == "USDT", data)
+
+
+async def check_errors(checker: Checker, stand_in: StandIn) -> None:
+    client = CryptoPayClient(TOKEN, base_url=f"{stand_in.base_url}/error/api")
+    errors_before = metrics.INVOICE_API_ERRORS.get("createInvoice", "AMOUNT_TOO_SMALL")
+    data = await client.create_invoice("USDT", "0.0001")
+    checker.check("HTTP 400 API error is returned, not raised",
+                  data.get("ok") is False and data["error"]["name"] == "AMOUNT_TOO_SMALL", data)
+    checker.check("HTTP 400 API error is counted by error name",
+                  metrics.INVOICE_API_ERRORS.get("createInvoice", "AMOUNT_TOO_SMALL") == errors_before + 1)
+
+    await expect_raise(checker, "HTTP 500 with a non-JSON body", Exception,
+                       CryptoPayClient(TOKEN, base_url=f"{stand_in.base_url}/broken/api").get_balance)
+
+
+async def check_timeout(checker: Checker, stand_in: StandIn, timeout: float) -> None:
+    client = CryptoPayClient(TOKEN, base_url=f"{stand_in.base_url}/slow/api", timeout=timeout)
+    latency.reset()
+    await expect_raise(checker, "request slower than the timeout", asyncio.TimeoutError,
+                       lambda: client.get_invoices([1]))
+    histogram = latency.get_histogram("cryptopay.getInvoices")
+    checker.check("timed out request is recorded in cryptopay.getInvoices",
+                  histogram is not None and histogram.count == 1)
+    checker.check("timed out request is cut at the timeout",
+                  histogram is not None and histogram.max / 1_000_000 < stand_in.slow_delay,
+                  histogram and histogram.summary())
+
+
+async def expect_raise(checker: Checker, name: str, exception: type, call: Callable) -> None:
+    """Проверить, что запрос завершается исключением и попадает в счетчик ошибок по его типу"""
+    before = sum(metrics.INVOICE_API_ERRORS.values.values())
+    try:
+        data: Dict[str, Any] = await call()
+    except exception as e:
+        checker.check(f"{name} raises {type(e).__name__}", True)
+        key_found = any(labels[1] == type(e).__name__ for labels in metrics.INVOICE_API_ERRORS.values)
+        checker.check(f"{name} is counted by exception type",
+                      key_found and sum(metrics.INVOICE_API_ERRORS.values.values()) == before + 1,
+                      metrics.INVOICE_API_ERRORS.values)
+    else:
+        checker.check(f"{name} raises {exception.__name__}", False, data)
+
+
+async def run(args) -> int:
+    stand_in = StandIn(args.slow_delay)
+    await stand_in.start()
+    checker = Checker()
+    try:
+        await check_responses(checker, stand_in)
+        await check_errors(checker, stand_in)
+        await check_timeout(checker, stand_in, args.timeout)
+    finally:
+        await http_client.close()
+        await stand_in.stop()
+    print(f"\n{checker.failures} failed" if checker.failures else "\nall checks passed")
+    return 1 if checker.failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the Crypto Pay client against a local stand-in server')
+    parser.add_argument('--timeout', type=float, default=0.2, help='Client timeout for the slow request, seconds')
+    parser.add_argument('--slow-delay', type=float, default=1.0, help='Stand-in delay for the slow request, seconds')
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
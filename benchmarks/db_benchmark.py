@@ -0,0 +1,89 @@
+"""
+Бенчмарк слоя базы данных: соединение на каждый запрос против
+долгоживущего соединения с WAL
+
+Запуск:
+    python benchmarks/db_benchmark.py --iterations 5000
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.database import db
+
+
+def legacy_purchase(path: str, user_id: int) -> None:
+    """Покупка в старом стиле: отдельное соединение на каждый запрос"""
+    conn = sqlite3.connect(path)
+    conn.execute('SELECT * FROM products WHERE id = ?', (1,)).fetchone()
+    conn.close()
+
+    conn = sqlite3.connect(path)
+    cursor = conn.execute(
+        'INSERT INTO orders (user_id, product_id, currency, amount) VALUES (?, ?, ?, ?)',
+        (user_id, 1, "TON", 1.0)
+    )
+    order_id = cursor.lastrowid
+    conn.commit()
+    conn.close()
+
+    conn = sqlite3.connect(path)
+    conn.execute('UPDATE orders SET invoice_id = ? WHERE id = ?', (order_id, order_id))
+    conn.commit()
+    conn.close()
+
+
+def pooled_purchase(user_id: int) -> None:
+    """Та же покупка через функции bot.database.db"""
+    db.get_product_by_id(1)
+    order_id = db.create_order(user_id, 1, "TON", 1.0)
+    db.update_order_invoice(order_id, order_id)
+
+
+def run(label: str, func, iterations: int) -> float:
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    elapsed = time.perf_counter() - start
+    # Каждая покупка выполняет три запроса
+    qps = iterations * 3 / elapsed
+    print(f"{label:<10} {iterations} purchases in {elapsed:.2f}s -> {qps:,.0f} queries/s")
+    return qps
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark SQLite access patterns')
+    parser.add_argument('--iterations', '-n', type=int, default=2000, help='Number of simulated purchases')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.db")
+        pooled_path = os.path.join(tmp, "pooled.db")
+
+        for path in (legacy_path, pooled_path):
+            db.DATABASE_FILE = path
+            db.init_db()
+        db.close_connections()
+
+        # Старая схема работает в режиме rollback-журнала, как до изменений
+        conn = sqlite3.connect(legacy_path)
+        conn.execute("PRAGMA journal_mode = DELETE")
+        conn.close()
+
+        before = run("before", lambda i: legacy_purchase(legacy_path, i), args.iterations)
+
+        db.DATABASE_FILE = pooled_path
+        after = run("after", pooled_purchase, args.iterations)
+        db.close_connections()
+
+    print(f"speedup: x{after / before:.1f}")
+
+
+if __name__ == "__main__":
+    main()
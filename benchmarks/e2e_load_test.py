@@ -0,0 +1,321 @@
+"""
+Сквозной нагрузочный тест покупки: тысячи симулированных пользователей
+проходят путь /start -> catalog -> product_ -> buy_ -> currency_ -> check_
+через настоящие router и support_router с middleware бота, базой SQLite
+(во временном файле), очередью доставки и FSM-хранилищем
+
+Внешние сервисы заменены локальными заглушками (benchmarks/fake_services.py)
+с задержкой --latency и долей ошибок --error-rate. Пользователь нажимает
+кнопки из последнего сообщения бота, которое запомнила заглушка Telegram;
+доля --support-ratio пользователей вместо покупки пишет в поддержку.
+
+В отчете: пропускная способность (обновления и завершенные покупки в
+секунду), перцентили задержки каждого шага, заказы и доставки по
+статусам, запросы к заглушкам и нагрузка на базу (самые дорогие запросы
+по суммарному времени, включая ожидание свободного потока пула). С
+--min-throughput, --max-p99 и --max-failure-rate тест завершается с кодом
+1 при нарушении порога и может служить проверкой на регрессию.
+
+Запуск:
+    python benchmarks/e2e_load_test.py --users 2000 --concurrency 200 --latency 0.02 --error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from benchmarks.fake_services import BOT_USER, FakeServices
+from bot.config import DB_EXECUTOR_WORKERS, SUPPORTED_CURRENCIES
+from bot.database import async_db, catalog, db
+from bot.database.fsm_storage import SQLiteStorage
+from bot.handlers import support_handlers
+from bot.handlers.handlers import router
+from bot.handlers.support_handlers import support_router
+from bot.middlewares import throttling, timing
+from bot.services import crypto_service, delivery_queue, http_client, price_table
+from bot.utils import latency
+
+BOT_TOKEN = f"{BOT_USER['id']}:E2E-LOAD-TEST-TOKEN"
+SUPPORT_CHAT_ID = -1000000000001
+# Шаги пути покупки: префикс кнопки, которую нажимает пользователь
+PURCHASE_STEPS = ("catalog", "product_", "buy_", "currency_", "check_")
+
+
+class ErrorCounter(logging.Handler):
+    """Считает ошибки, записанные ботом в лог, по тексту сообщения"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages: Counter = Counter()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # Шаблон сообщения без аргументов, чтобы ошибки разных обновлений попадали в одну строку
+        message = record.msg if isinstance(record.msg, str) else record.getMessage()
+        self.messages[message.split("\n")[0].split(":")[0][:80]] += 1
+
+
+class Simulation:
+    def __init__(self, args, services: FakeServices, dp: Dispatcher, bot: Bot):
+        self.args = args
+        self.services = services
+        self.dp = dp
+        self.bot = bot
+        self.random = random.Random(args.seed)
+        self.update_ids = itertools.count(1)
+        self.steps: Dict[str, latency.Histogram] = {}
+        self.flows: Counter = Counter()
+        self.updates = 0
+
+    async def _feed(self, step: str, update: dict) -> None:
+        start = time.perf_counter()
+        try:
+            await self.dp.feed_raw_update(self.bot, update)
+        finally:
+            self.updates += 1
+            self.steps.setdefault(step, latency.Histogram()).record(time.perf_counter() - start)
+
+    async def send_text(self, user_id: int, text: str, step: str) -> None:
+        user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+        await self._feed(step, {
+            "update_id": next(self.update_ids),
+            "message": {
+                "message_id": next(self.update_ids), "date": int(time.time()), "text": text, "from": user,
+                "chat": {"id": user_id, "type": "private"},
+                **({"entities": [{"type": "bot_command", "offset": 0, "length": len(text)}]}
+                   if text.startswith("/") else {}),
+            },
+        })
+
+    async def click(self, user_id: int, prefix: str) -> Optional[int]:
+        """Нажать случайную кнопку с префиксом в последнем сообщении бота; ID сообщения или None - кнопки нет"""
+        buttons = [data for data in self.services.get_buttons(user_id) if data.startswith(prefix)]
+        if not buttons:
+            return None
+        message = self.services.chats[user_id]
+        user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+        await self._feed(prefix.rstrip("_"), {
+            "update_id": next(self.update_ids),
+            "callback_query": {
+                "id": str(next(self.update_ids)), "from": user, "chat_instance": str(user_id),
+                "data": self.random.choice(buttons),
+                "message": {
+                    "message_id": message["message_id"], "date": int(time.time()), "text": message["text"],
+                    "from": BOT_USER, "chat": {"id": user_id, "type": "private"},
+                },
+            },
+        })
+        return message["message_id"]
+
+    async def think(self) -> None:
+        if self.args.think_time:
+            await asyncio.sleep(self.random.uniform(0.5, 1.5) * self.args.think_time)
+
+    async def purchase(self, user_id: int) -> str:
+        await self.send_text(user_id, "/start", "start")
+        for prefix in PURCHASE_STEPS:
+            await self.think()
+            message_id = await self.click(user_id, prefix)
+            if message_id is None:
+                return f"failed_before_{prefix.rstrip('_')}"
+        # Сообщение со счетом заменяется подтверждением оплаты; доставка приходит отдельным сообщением
+        if "Оплата успешно получена" not in self.services.texts.get((user_id, message_id), ""):
+            return "not_paid"
+        return "purchased"
+
+    async def support(self, user_id: int) -> str:
+        await self.send_text(user_id, "/start", "start")
+        await self.think()
+        if await self.click(user_id, "support") is None:
+            return "failed_before_support"
+        await self.think()
+        await self.send_text(user_id, "Не пришел товар, помогите", "support_message")
+        return "support_sent" if "catalog" in self.services.get_buttons(user_id) else "support_failed"
+
+    async def run(self) -> float:
+        slots = asyncio.Semaphore(self.args.concurrency)
+
+        async def user(index: int) -> None:
+            async with slots:
+                user_id = 1_000_000 + index
+                flow = self.support if self.random.random() < self.args.support_ratio else self.purchase
+                try:
+                    self.flows[await flow(user_id)] += 1
+                except Exception:
+                    # Обработчик упал (ошибку уже записал aiogram), пользователь не получил ответа
+                    self.flows["handler_error"] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user(index) for index in range(self.args.users)))
+        return time.perf_counter() - start
+
+
+def print_histograms(title: str, histograms, limit: Optional[int] = None) -> None:
+    print(f"\n{title:<36}{'count':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+    for name, histogram in histograms[:limit]:
+        summary = histogram.summary()
+        print(f"{name:<36}{summary['count']:>8}" + "".join(
+            f"{summary[key] * 1000:>9.1f}" for key in ("p50", "p95", "p99", "max")
+        ))
+
+
+async def wait_for_deliveries(timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        scheduled, due, _ = await async_db.get_delivery_queue_stats(time.time())
+        if not scheduled and not due:
+            return
+        await asyncio.sleep(0.2)
+
+
+async def run(args) -> int:
+    services = FakeServices(args.latency, args.error_rate, args.paid_ratio, seed=args.seed)
+    base_url = await services.start(port=args.port)
+
+    # Бот обращается к заглушкам вместо настоящих сервисов
+    crypto_service.crypto.base_url = f"{base_url}/cryptopay/api"
+    crypto_service.EXCHANGE_RATE_API_URL = f"{base_url}/exchangerate/latest/RUB"
+    crypto_service.CRYPTO_PRICE_API_URL = f"{base_url}/coingecko/simple/price"
+    support_handlers.SUPPORT_CHAT_ID = SUPPORT_CHAT_ID
+    bot = Bot(token=BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(base_url)))
+
+    dp = Dispatcher(storage=SQLiteStorage())
+    timing.setup(dp, bot, router, support_router)
+    throttler = throttling.setup(dp) if args.throttling else None
+    dp.include_router(router)
+    dp.include_router(support_router)
+
+    await http_client.start()
+    await crypto_service.ensure_bot_username(bot)
+    await crypto_service.initialize_exchange_rates()
+    price_table.load_products(await catalog.get_products())
+    delivery_queue.start(bot)
+
+    simulation = Simulation(args, services, dp, bot)
+    try:
+        elapsed = await simulation.run()
+        await wait_for_deliveries(args.delivery_timeout)
+    finally:
+        await delivery_queue.stop()
+        await dp.storage.close()
+        await bot.session.close()
+        await http_client.close()
+        await services.stop()
+
+    purchased = simulation.flows["purchased"]
+    completed = purchased + simulation.flows["support_sent"]
+    failure_rate = 1 - completed / args.users
+    print(f"{args.users} users ({args.concurrency} at a time) in {elapsed:.2f}s")
+    print(f"throughput: {simulation.updates / elapsed:,.0f} updates/s, {purchased / elapsed:,.1f} purchases/s")
+    print("flows:      " + ", ".join(f"{name}={count}" for name, count in sorted(simulation.flows.items())))
+    print(f"failure rate: {failure_rate:.2%}")
+    if throttler is not None and throttler.rejected:
+        # Отклоненные нажатия не доходят до обработчика, и пользователь не видит следующую кнопку
+        print("shed by throttling: " + ", ".join(
+            f"{route} ({reason})={count}" for (route, reason), count in sorted(throttler.rejected.items())
+        ))
+
+    step_order = ["start", *(prefix.rstrip("_") for prefix in PURCHASE_STEPS), "support", "support_message"]
+    print_histograms("step", [(step, simulation.steps[step]) for step in step_order if step in simulation.steps])
+
+    conn = db.get_connection()
+    orders = conn.execute("SELECT status, COUNT(*) FROM orders GROUP BY status").fetchall()
+    delivered = conn.execute("SELECT COUNT(*) FROM deliveries WHERE delivered_at IS NOT NULL").fetchone()[0]
+    print("\norders:     " + ", ".join(f"{status}={count}" for status, count in orders) + f", delivered={delivered}")
+
+    print("\nfake services (requests / injected errors):")
+    for (service, method), count in sorted(services.requests.items()):
+        print(f"  {service}.{method}: {count} / {services.errors[(service, method)]}")
+
+    # Время db.* включает ожидание потока пула: рост p99 при той же p50 - признак конкуренции за базу
+    db_histograms = [(name, h) for name, h in latency.get_histograms() if name.startswith("db.")]
+    db_histograms.sort(key=lambda item: item[1].total, reverse=True)
+    db_time = sum(h.total for _, h in db_histograms) / 1_000_000
+    print(f"\ndatabase: {sum(h.count for _, h in db_histograms)} queries, {db_time:.2f}s total, "
+          f"{db_time / elapsed / DB_EXECUTOR_WORKERS:.0%} of {DB_EXECUTOR_WORKERS} pool threads busy")
+    print_histograms("heaviest queries", db_histograms, limit=8)
+
+    external = [
+        (name, h) for name, h in latency.get_histograms() if name.split(".")[0] in ("bot_api", "cryptopay", "rates")
+    ]
+    print_histograms("external calls", external)
+
+    if args.error_counter.messages:
+        print("\nlogged errors:")
+        for message, count in args.error_counter.messages.most_common(10):
+            print(f"  {count:>6}  {message}")
+
+    # Проверка на регрессию
+    failed = []
+    purchase_p99 = max(
+        (simulation.steps[step].percentile(99) for step in ("currency", "check") if step in simulation.steps), default=0
+    )
+    if args.min_throughput and purchased / elapsed < args.min_throughput:
+        failed.append(f"throughput {purchased / elapsed:.1f} < {args.min_throughput} purchases/s")
+    if args.max_p99 and purchase_p99 * 1000 > args.max_p99:
+        failed.append(f"purchase step p99 {purchase_p99 * 1000:.1f} > {args.max_p99} ms")
+    if args.max_failure_rate is not None and failure_rate > args.max_failure_rate:
+        failed.append(f"failure rate {failure_rate:.2%} > {args.max_failure_rate:.2%}")
+    for reason in failed:
+        print(f"FAIL: {reason}")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end load test of the purchase flow against local stand-ins')
+    parser.add_argument('--users', '-u', type=int, default=2000, help='Number of simulated users')
+    parser.add_argument('--concurrency', '-c', type=int, default=200, help='Users active at the same time')
+    parser.add_argument('--products', type=int, default=50, help='Products in the test catalog')
+    parser.add_argument('--latency', type=float, default=0.02, help='Mean latency of the fake services, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of fake service requests that fail')
+    parser.add_argument('--paid-ratio', type=float, default=1.0, help='Fraction of invoices paid before the check')
+    parser.add_argument('--support-ratio', type=float, default=0.05, help='Fraction of users writing to support')
+    parser.add_argument('--think-time', type=float, default=0.0, help='Mean pause between user actions, seconds')
+    parser.add_argument('--no-throttling', dest='throttling', action='store_false',
+                        help='Do not install the throttling middleware')
+    parser.add_argument('--delivery-timeout', type=float, default=60, help='How long to wait for deliveries, seconds')
+    parser.add_argument('--port', type=int, default=8089, help='Port for the fake services')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Print bot warnings and errors as they happen')
+    parser.add_argument('--min-throughput', type=float, default=0, help='Fail below this many purchases/s')
+    parser.add_argument('--max-p99', type=float, default=0, help='Fail if currency_/check_ p99 exceeds this, ms')
+    parser.add_argument('--max-failure-rate', type=float, default=None, help='Fail above this fraction of failed users')
+    args = parser.parse_args()
+
+    # Бот пишет INFO на каждый шаг покупки, а внедренные ошибки - с трассировкой;
+    # по умолчанию ошибки только подсчитываются и выводятся в отчете
+    if args.verbose:
+        logging.basicConfig(level=logging.WARNING)
+    else:
+        logging.getLogger().setLevel(logging.ERROR)
+    args.error_counter = ErrorCounter()
+    logging.getLogger().addHandler(args.error_counter)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DATABASE_FILE = os.path.join(tmp, "e2e.db")
+        db.init_db()
+        for index in range(1, args.products + 1):
+            db.add_product(f"Товар {index}", f"Описание товара {index}", 100.0 + index * 10, None,
+                           SUPPORTED_CURRENCIES)
+        try:
+            code = asyncio.run(run(args))
+        finally:
+            async_db.shutdown()
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
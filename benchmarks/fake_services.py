@@ -0,0 +1,232 @@
+"""
+Локальные заглушки внешних сервисов для нагрузочных тестов: Telegram Bot
+API, Crypto Pay, exchangerate-api и CoinGecko на одном aiohttp-сервере
+
+Каждый ответ задерживается на случайное время вокруг --latency, а доля
+запросов --error-rate получает ошибку сервиса (HTTP 500 / ok=false).
+Заглушка Telegram запоминает последнее сообщение бота в каждом чате
+вместе с клавиатурой, поэтому симулированный пользователь нажимает те же
+кнопки, что увидел бы в клиенте. Счета Crypto Pay оплачиваются с
+вероятностью paid_ratio к моменту первой проверки.
+
+Пути:
+    POST /bot<токен>/<метод>        - Telegram Bot API
+    POST /cryptopay/api/<метод>     - Crypto Pay API
+    GET  /exchangerate/latest/RUB   - exchangerate-api
+    GET  /coingecko/simple/price    - CoinGecko
+
+Запуск отдельно (например, для ручной проверки бота):
+    python benchmarks/fake_services.py --port 8081 --latency 0.05 --error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+
+from aiohttp import web
+
+# Курс RUB -> USD и цены криптовалют в USD, которые отдают заглушки курсов
+USD_RATE = 0.011
+CRYPTO_PRICES = {"the-open-network": 5.2, "bitcoin": 65000.0, "ethereum": 3200.0, "tether": 1.0, "usd-coin": 1.0}
+BOT_USER = {"id": 100000, "is_bot": True, "first_name": "Load Test", "username": "load_test_bot"}
+
+# Методы Bot API, которые возвращают отправленное или измененное сообщение
+_MESSAGE_METHODS = {
+    "sendMessage", "editMessageText", "sendPhoto", "sendDocument", "editMessageMedia", "editMessageCaption",
+    "editMessageReplyMarkup"
+}
+
+
+class FakeServices:
+    """Заглушки Telegram, Crypto Pay и API курсов с задержкой и внедрением ошибок"""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, paid_ratio: float = 1.0,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.paid_ratio = paid_ratio
+        self.random = random.Random(seed)
+        # (сервис, метод) -> число запросов и внедренных ошибок
+        self.requests: Counter = Counter()
+        self.errors: Counter = Counter()
+        # ID чата -> последнее сообщение бота {"message_id", "text", "reply_markup"}
+        self.chats: Dict[int, Dict[str, Any]] = {}
+        # (ID чата, ID сообщения) -> текущий текст сообщения (с учетом редактирования)
+        self.texts: Dict[Tuple[int, int], str] = {}
+        self.invoices: Dict[int, Dict[str, Any]] = {}
+        self._message_ids = itertools.count(1)
+        self._invoice_ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+    async def _simulate(self, service: str, method: str) -> bool:
+        """Задержка ответа; True - этот запрос должен завершиться ошибкой"""
+        self.requests[(service, method)] += 1
+        if self.latency:
+            await asyncio.sleep(self.random.uniform(0.5, 1.5) * self.latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors[(service, method)] += 1
+            return True
+        return False
+
+    def get_buttons(self, chat_id: int) -> list:
+        """callback_data кнопок последнего сообщения бота в чате"""
+        message = self.chats.get(chat_id)
+        if not message or not message.get("reply_markup"):
+            return []
+        return [
+            button["callback_data"]
+            for row in message["reply_markup"].get("inline_keyboard", [])
+            for button in row
+            if button.get("callback_data")
+        ]
+
+    # Telegram Bot API
+
+    def _message(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        chat_id = int(params["chat_id"])
+        message_id = int(params["message_id"]) if "message_id" in params else next(self._message_ids)
+        reply_markup = json.loads(params["reply_markup"]) if params.get("reply_markup") else None
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text") or params.get("caption") or "",
+        }
+        if reply_markup:
+            message["reply_markup"] = reply_markup
+        if method == "sendDocument":
+            message["document"] = {"file_id": f"document-{message_id}", "file_unique_id": f"document-{message_id}"}
+        elif method == "sendPhoto":
+            message["photo"] = [{"file_id": f"photo-{message_id}", "file_unique_id": f"photo-{message_id}",
+                                 "width": 1, "height": 1}]
+        self.chats[chat_id] = {"message_id": message_id, "text": message["text"], "reply_markup": reply_markup}
+        self.texts[(chat_id, message_id)] = message["text"]
+        return message
+
+    async def handle_telegram(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await request.json() if request.content_type == "application/json" else dict(await request.post())
+        if await self._simulate("telegram", method):
+            return web.json_response(
+                {"ok": False, "error_code": 500, "description": "Internal Server Error: injected"}, status=500
+            )
+        if method == "getMe":
+            result: Any = BOT_USER
+        elif method == "getUpdates":
+            # Обновления заглушке никто не присылает: отвечаем пустым списком, не держа запрос долго
+            await asyncio.sleep(min(float(params.get("timeout") or 0), 1))
+            result = []
+        elif method in _MESSAGE_METHODS:
+            result = self._message(method, params)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    # Crypto Pay API
+
+    async def handle_cryptopay(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await request.json()
+        if await self._simulate("cryptopay", method):
+            return web.json_response({"ok": False, "error": {"code": 500, "name": "INJECTED_ERROR"}}, status=500)
+
+        if method == "createInvoice":
+            invoice_id = next(self._invoice_ids)
+            invoice = {
+                "invoice_id": invoice_id,
+                "status": "active",
+                "asset": params.get("asset"),
+                "amount": params.get("amount"),
+                "payload": params.get("payload"),
+                "pay_url": f"https://t.me/CryptoTestnetBot?start=IV{invoice_id}",
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+            }
+            self.invoices[invoice_id] = invoice
+            response = web.json_response({"ok": True, "result": invoice})
+            # Пользователь оплачивает счет до того, как нажмет "Проверить оплату"
+            if self.random.random() < self.paid_ratio:
+                invoice["status"] = "paid"
+            return response
+
+        if method == "getInvoices":
+            ids = [int(i) for i in str(params.get("invoice_ids", "")).split(",") if i]
+            items = [self.invoices[i] for i in ids if i in self.invoices]
+            return web.json_response({"ok": True, "result": {"items": items}})
+
+        if method == "getBalance":
+            return web.json_response({"ok": True, "result": [{"currency_code": "USDT", "available": "0"}]})
+
+        return web.json_response({"ok": False, "error": {"code": 405, "name": "METHOD_NOT_FOUND"}}, status=405)
+
+    # API курсов
+
+    async def handle_exchangerate(self, request: web.Request) -> web.Response:
+        if await self._simulate("exchangerate", "latest"):
+            return web.json_response({"error": "injected"}, status=500)
+        return web.json_response({"base": "RUB", "rates": {"USD": USD_RATE}})
+
+    async def handle_coingecko(self, request: web.Request) -> web.Response:
+        if await self._simulate("coingecko", "simple_price"):
+            return web.json_response({"error": "injected"}, status=500)
+        ids = request.query.get("ids", "").split(",")
+        prices = {crypto_id: {"usd": CRYPTO_PRICES.get(crypto_id, 1.0)} for crypto_id in ids if crypto_id}
+        return web.json_response(prices)
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle_telegram)
+        app.router.add_post("/cryptopay/api/{method}", self.handle_cryptopay)
+        app.router.add_get("/exchangerate/latest/RUB", self.handle_exchangerate)
+        app.router.add_get("/coingecko/simple/price", self.handle_coingecko)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081) -> str:
+        """Запустить сервер; возвращает его базовый URL"""
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def serve(args) -> None:
+    services = FakeServices(args.latency, args.error_rate, args.paid_ratio)
+    base_url = await services.start(args.host, args.port)
+    print(f"Telegram Bot API:  {base_url}/bot<token>/<method>")
+    print(f"Crypto Pay API:    {base_url}/cryptopay/api")
+    print(f"Exchange rate API: {base_url}/exchangerate/latest/RUB")
+    print(f"Crypto price API:  {base_url}/coingecko/simple/price")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await services.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run local stand-ins for Telegram, Crypto Pay and rate APIs')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', '-p', type=int, default=8081, help='Port to listen on')
+    parser.add_argument('--latency', type=float, default=0.0, help='Mean response latency, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests failing with an error')
+    parser.add_argument('--paid-ratio', type=float, default=1.0, help='Fraction of invoices paid before the check')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
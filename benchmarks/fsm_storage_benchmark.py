@@ -0,0 +1,74 @@
+"""
+Бенчмарк FSM-хранилищ: MemoryStorage aiogram против SQLiteStorage с
+записью на каждое изменение и с отложенной записью (write-behind)
+
+Каждый диалог повторяет обращение в поддержку: set_state, несколько
+update_data, чтения состояния и сброс.
+
+Запуск:
+    python benchmarks/fsm_storage_benchmark.py --dialogs 2000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from bot.database import async_db, db
+from bot.database.fsm_storage import SQLiteStorage
+
+# Обращений к хранилищу в одном диалоге
+OPS_PER_DIALOG = 9
+
+
+async def dialog(storage, user_id: int) -> None:
+    key = StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+    await storage.set_state(key, "SupportStates:waiting_for_message")
+    for step in range(3):
+        await storage.update_data(key, {f"step_{step}": step})
+        await storage.get_state(key)
+    await storage.get_data(key)
+    await storage.set_state(key, None)
+
+
+async def run(label: str, storage, dialogs: int, concurrency: int) -> float:
+    start = time.perf_counter()
+    for offset in range(0, dialogs, concurrency):
+        await asyncio.gather(*(dialog(storage, user_id) for user_id in range(offset, min(offset + concurrency, dialogs))))
+    await storage.close()
+    elapsed = time.perf_counter() - start
+    ops = dialogs * OPS_PER_DIALOG / elapsed
+    print(f"{label:<14} {dialogs} dialogs in {elapsed:.2f}s -> {ops:,.0f} ops/s")
+    return ops
+
+
+async def main_async(dialogs: int, concurrency: int) -> None:
+    memory = await run("memory", MemoryStorage(), dialogs, concurrency)
+    write_through = await run("sqlite", SQLiteStorage(flush_interval=0), dialogs, concurrency)
+    write_behind = await run("sqlite+buffer", SQLiteStorage(flush_interval=1), dialogs, concurrency)
+    print(f"write-behind vs write-through: x{write_behind / write_through:.1f}, "
+          f"vs memory: x{write_behind / memory:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark FSM storages')
+    parser.add_argument('--dialogs', '-n', type=int, default=2000, help='Number of simulated support dialogs')
+    parser.add_argument('--concurrency', '-c', type=int, default=50, help='Dialogs running at the same time')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DATABASE_FILE = os.path.join(tmp, "fsm.db")
+        db.init_db()
+        asyncio.run(main_async(args.dialogs, args.concurrency))
+        async_db.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Бенчмарк замера задержек: стоимость записи в гистограмму, точность
+перцентилей и накладные расходы middleware на обработку обновлений
+
+Обновления подаются в диспетчер через feed_raw_update с обработчиком,
+отвечающим через фиктивную сессию Bot API, - без замеров и с подключенным
+timing.setup.
+
+Запуск:
+    python benchmarks/latency_benchmark.py --samples 1000000 --updates 5000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.types import CallbackQuery
+
+from benchmarks.sharding_benchmark import BOT_TOKEN, FakeSession, make_update
+from bot.middlewares import timing
+from bot.utils import latency
+
+
+def bench_record(samples: int) -> None:
+    values = [random.lognormvariate(-5, 1) for _ in range(samples)]
+    histogram = latency.Histogram()
+    start = time.perf_counter()
+    for value in values:
+        histogram.record(value)
+    elapsed = time.perf_counter() - start
+    print(f"record: {elapsed / samples * 1e9:.0f} ns per sample, {len(histogram.counts)} buckets")
+
+    values.sort()
+    for percent in (50, 95, 99):
+        exact = values[int(samples * percent / 100) - 1]
+        estimate = histogram.percentile(percent)
+        print(f"  p{percent}: exact {exact * 1000:.3f} ms, histogram {estimate * 1000:.3f} ms "
+              f"({(estimate - exact) / exact:+.2%})")
+
+
+async def bench_dispatch(updates: int, instrumented: bool) -> float:
+    dp = Dispatcher()
+    router = Router()
+
+    @router.callback_query(F.data == "catalog")
+    async def show_catalog(callback: CallbackQuery):
+        await callback.answer()
+
+    dp.include_router(router)
+    bot = Bot(token=BOT_TOKEN, session=FakeSession(0))
+    if instrumented:
+        timing.setup(dp, bot, router)
+
+    start = time.perf_counter()
+    for update_id in range(updates):
+        await dp.feed_raw_update(bot, make_update(update_id, update_id % 1000 + 1))
+    elapsed = time.perf_counter() - start
+    return elapsed / updates
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark latency histograms and timing middleware')
+    parser.add_argument('--samples', '-s', type=int, default=1000000, help='Samples recorded into one histogram')
+    parser.add_argument('--updates', '-n', type=int, default=5000, help='Updates fed through the dispatcher')
+    args = parser.parse_args()
+
+    bench_record(args.samples)
+
+    # Прогрев: первые обновления платят за ленивую инициализацию aiogram
+    asyncio.run(bench_dispatch(args.updates // 10 or 1, instrumented=False))
+    plain = asyncio.run(bench_dispatch(args.updates, instrumented=False))
+    instrumented = asyncio.run(bench_dispatch(args.updates, instrumented=True))
+    print(f"dispatch: {plain * 1e6:.0f} us/update without timing, {instrumented * 1e6:.0f} us/update with timing "
+          f"({(instrumented - plain) / plain:+.1%})")
+    for name, histogram in latency.get_histograms():
+        summary = histogram.summary()
+        print(f"  {name}: {summary['count']} samples, p50 {summary['p50'] * 1e6:.0f} us, "
+              f"p99 {summary['p99'] * 1e6:.0f} us")
+
+
+if __name__ == "__main__":
+    main()
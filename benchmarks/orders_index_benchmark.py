@@ -0,0 +1,76 @@
+"""
+Бенчмарк индексов таблицы orders: поиск и обновление заказа по ID счета
+на большой таблице до и после миграций схемы
+
+Запуск:
+    python benchmarks/orders_index_benchmark.py --orders 1000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.database import db, migrations
+
+
+def fill_orders(orders: int) -> None:
+    """Заполнить таблицу orders в схеме версии 1 (без индексов)"""
+    conn = db.get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    migrations.MIGRATIONS[0][2][0](conn)
+    conn.executemany(
+        'INSERT INTO orders (user_id, product_id, invoice_id, currency, amount, status) VALUES (?, ?, ?, ?, ?, ?)',
+        ((i % 50000, 1, i, "TON", 1.0, "paid" if i % 10 else "pending") for i in range(1, orders + 1))
+    )
+    conn.commit()
+
+
+def run(label: str, orders: int, lookups: int) -> float:
+    rng = random.Random(42)
+    invoice_ids = [rng.randint(1, orders) for _ in range(lookups)]
+    start = time.perf_counter()
+    for invoice_id in invoice_ids:
+        db.get_order_by_invoice_id(invoice_id)
+        db.update_order_status(invoice_id, "paid")
+    elapsed = time.perf_counter() - start
+    # Каждая итерация - поиск и обновление заказа
+    qps = lookups * 2 / elapsed
+    print(f"{label:<10} {lookups} lookups+updates in {elapsed:.2f}s -> {qps:,.0f} queries/s")
+    return qps
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark orders table indexes')
+    parser.add_argument('--orders', '-o', type=int, default=1000000, help='Number of rows in the orders table')
+    parser.add_argument('--lookups', '-n', type=int, default=200, help='Number of lookups by invoice_id')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DATABASE_FILE = os.path.join(tmp, "orders.db")
+        start = time.perf_counter()
+        fill_orders(args.orders)
+        print(f"filled     {args.orders} orders in {time.perf_counter() - start:.1f}s")
+
+        before = run("before", args.orders, args.lookups)
+
+        start = time.perf_counter()
+        db.init_db()
+        print(f"migrate    to version {migrations.LATEST_VERSION} in {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        db.init_db()
+        print(f"startup    with current schema in {(time.perf_counter() - start) * 1000:.3f} ms")
+
+        after = run("after", args.orders, args.lookups)
+        db.close_connections()
+
+    print(f"speedup: x{after / before:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Бенчмарк таблицы цен: расчет суммы на каждый просмотр товара против
+чтения из заранее построенной таблицы
+
+Запуск:
+    python benchmarks/price_table_benchmark.py --products 10000 --views 100000
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.config import SUPPORTED_CURRENCIES
+from bot.database.models import Product
+from bot.services import crypto_service, price_table
+
+
+def setup_rates() -> None:
+    """Подставить фиксированные курсы вместо запроса к API"""
+    crypto_service._usd_rate_cache = 0.011
+    crypto_service._crypto_prices_cache.update(crypto_service.FALLBACK_CRYPTO_PRICES)
+    crypto_service._cache_initialized = True
+    crypto_service._rates_version += 1
+
+
+async def legacy_views(products, views) -> None:
+    """Просмотр товара в старом стиле: calculate_crypto_amount для каждой валюты"""
+    for product_id in views:
+        price_rub = products[product_id]
+        for currency in SUPPORTED_CURRENCIES:
+            await crypto_service.calculate_crypto_amount(price_rub, currency)
+
+
+def table_views(products, views) -> None:
+    """Тот же просмотр через таблицу цен"""
+    for product_id in views:
+        price_table.get_amounts(product_id, products[product_id], SUPPORTED_CURRENCIES)
+
+
+def build(rows, use_numpy: bool) -> float:
+    numpy_module = price_table.np
+    if not use_numpy:
+        price_table.np = None
+    try:
+        start = time.perf_counter()
+        price_table.load_products(rows)
+        return time.perf_counter() - start
+    finally:
+        price_table.np = numpy_module
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the product price table')
+    parser.add_argument('--products', '-p', type=int, default=10000, help='Number of products in the catalog')
+    parser.add_argument('--views', '-n', type=int, default=100000, help='Number of simulated product views')
+    args = parser.parse_args()
+
+    # Предупреждения о минимальной сумме на каждый расчет исказили бы замер
+    logging.basicConfig(level=logging.ERROR)
+    setup_rates()
+
+    rng = random.Random(42)
+    products = {product_id: float(rng.randint(10, 100000)) for product_id in range(1, args.products + 1)}
+    rows = [Product(product_id, f"Product {product_id}", "", price, None, []) for product_id, price in products.items()]
+    views = [rng.randint(1, args.products) for _ in range(args.views)]
+
+    python_build = build(rows, use_numpy=False)
+    print(f"build      {args.products} products, pure Python: {python_build * 1000:.1f} ms")
+    if price_table.np is not None:
+        numpy_build = build(rows, use_numpy=True)
+        print(f"build      {args.products} products, NumPy:       {numpy_build * 1000:.1f} ms")
+    else:
+        print("build      NumPy is not installed, vectorized build skipped")
+
+    start = time.perf_counter()
+    asyncio.run(legacy_views(products, views))
+    before = args.views / (time.perf_counter() - start)
+    print(f"before     {args.views} views -> {before:,.0f} views/s")
+
+    start = time.perf_counter()
+    table_views(products, views)
+    after = args.views / (time.perf_counter() - start)
+    print(f"after      {args.views} views -> {after:,.0f} views/s")
+
+    print(f"speedup: x{after / before:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Бенчмарк записей товаров: кортеж строки sqlite3 с JSON списка валют
+против объекта Product со __slots__ и уже разобранными валютами
+
+Измеряются память на одну запись кэша каталога и стоимость доступа
+к полям так, как это делает обработчик просмотра товара.
+
+Запуск:
+    python benchmarks/records_benchmark.py --products 10000 --reads 1000000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.config import SUPPORTED_CURRENCIES
+from bot.database.models import Product, product_factory
+
+
+def make_rows(products: int):
+    currencies = json.dumps(SUPPORTED_CURRENCIES)
+    return [
+        (product_id, f"Product {product_id}", f"Description {product_id}", float(product_id),
+         f"https://example.com/{product_id}.jpg", currencies, None)
+        for product_id in range(1, products + 1)
+    ]
+
+
+def measure(label: str, build, products: int):
+    """Построить кэш и вернуть его вместе с размером на одну запись"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    cache = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"{label:<8} {size / products:,.0f} bytes per cached product")
+    return cache
+
+
+def legacy_reads(cache, reads: int) -> float:
+    """Старый доступ: индекс кортежа и разбор JSON при каждом просмотре"""
+    start = time.perf_counter()
+    for i in range(reads):
+        row = cache[i % len(cache)]
+        name, price = row[1], row[3]
+        currencies = json.loads(row[5]) if row[5] else []
+    return time.perf_counter() - start
+
+
+def record_reads(cache, reads: int) -> float:
+    """Новый доступ: атрибуты записи, валюты уже разобраны"""
+    start = time.perf_counter()
+    for i in range(reads):
+        product = cache[i % len(cache)]
+        name, price = product.name, product.price_rub
+        currencies = product.currencies
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark product records')
+    parser.add_argument('--products', '-p', type=int, default=10000, help='Number of products in the catalog')
+    parser.add_argument('--reads', '-n', type=int, default=1000000, help='Number of simulated product reads')
+    args = parser.parse_args()
+
+    rows = make_rows(args.products)
+    # Во всех вариантах список валют уже разобран, сравнивается только контейнер записи
+    tuples = measure("tuple", lambda: [row[:5] + (json.loads(row[5]), row[6]) for row in rows], args.products)
+    dicts = measure("dict", lambda: [
+        {"id": row[0], "name": row[1], "description": row[2], "price_rub": row[3],
+         "image_url": row[4], "currencies": json.loads(row[5]), "category_id": row[6]}
+        for row in rows
+    ], args.products)
+    records = measure("Product", lambda: [product_factory(None, row) for row in rows], args.products)
+    assert all(isinstance(product, Product) for product in records)
+    del tuples, dicts
+
+    before = legacy_reads(rows, args.reads)
+    print(f"before   {args.reads} reads -> {args.reads / before:,.0f} reads/s")
+    after = record_reads(records, args.reads)
+    print(f"after    {args.reads} reads -> {args.reads / after:,.0f} reads/s")
+
+    print(f"speedup: x{before / after:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Бенчмарк поиска товаров: LIKE по таблице products против FTS5-индекса
+и кэша результатов по префиксу запроса
+
+Запуск:
+    python benchmarks/search_benchmark.py --products 100000 --queries 500
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.config import SEARCH_RESULTS_LIMIT, SUPPORTED_CURRENCIES
+from bot.database import db
+from bot.services import search
+
+LETTERS = "абвгдеиклмнопрстуabcdekmnoprst"
+
+
+def make_words(rng: random.Random, count: int) -> list:
+    """Словарь из случайных слов: каждое слово встречается в небольшой доле товаров"""
+    return sorted({"".join(rng.choice(LETTERS) for _ in range(rng.randint(5, 9))) for _ in range(count)})
+
+
+def fill_products(products: int, words: list, rng: random.Random) -> None:
+    currencies = json.dumps(SUPPORTED_CURRENCIES)
+    conn = db.get_connection()
+    with conn:
+        conn.executemany(
+            'INSERT INTO products (name, description, price_rub, image_url, available_currencies) VALUES (?, ?, ?, ?, ?)',
+            (
+                (" ".join(rng.sample(words, 3)), " ".join(rng.sample(words, 8)),
+                 float(rng.randint(10, 100000)), None, currencies)
+                for _ in range(products)
+            )
+        )
+
+
+def like_search(text: str) -> list:
+    """Поиск без индекса: LIKE по названию и описанию"""
+    pattern = f"%{text}%"
+    return db.get_connection().execute(
+        'SELECT id FROM products WHERE name LIKE ? OR description LIKE ? LIMIT ?',
+        (pattern, pattern, SEARCH_RESULTS_LIMIT)
+    ).fetchall()
+
+
+def report(label: str, latencies: list) -> float:
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+    print(f"{label:<10} p50 {p50:8.3f} ms   p95 {p95:8.3f} ms")
+    return p50
+
+
+def timed(func, queries) -> list:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        func(query)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def timed_async(func, queries) -> list:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        await func(query)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark product search')
+    parser.add_argument('--products', '-p', type=int, default=100000, help='Number of products in the catalog')
+    parser.add_argument('--queries', '-n', type=int, default=500, help='Number of search queries')
+    parser.add_argument('--words', '-w', type=int, default=5000, help='Size of the product text vocabulary')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DATABASE_FILE = os.path.join(tmp, "search.db")
+        db.init_db()
+        words = make_words(rng, args.words)
+        start = time.perf_counter()
+        fill_products(args.products, words, rng)
+        print(f"filled     {args.products} products in {time.perf_counter() - start:.1f}s")
+
+        # Запросы набираются по буквам, как в inline-режиме: "ку", "кур", "курс"
+        queries = []
+        while len(queries) < args.queries:
+            word = rng.choice(words)
+            queries.extend(word[:length] for length in range(2, len(word) + 1))
+        queries = queries[:args.queries]
+
+        like = report("LIKE", timed(like_search, queries))
+        fts = report("FTS5", timed(db.search_products, queries))
+
+        async def cached():
+            await timed_async(search.search, queries)
+            return await timed_async(search.search, queries)
+
+        report("cached", asyncio.run(cached()))
+        db.close_connections()
+
+    print(f"FTS5 speedup over LIKE: x{like / fts:.1f}")
+
+
+if __name__ == "__main__":
+    main()
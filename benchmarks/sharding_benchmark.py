@@ -0,0 +1,131 @@
+"""
+Бенчмарк многопроцессного режима: пропускная способность обработки
+обновлений при разном числе рабочих процессов
+
+Основной процесс раскладывает сгенерированные обновления (нажатия кнопок
+каталога от разных пользователей) по очередям через ShardRouter, рабочие
+процессы обрабатывают их через sharding.run_worker. Обработчик строит
+клавиатуру страницы каталога и отвечает через Bot API; запросы к API
+перехватывает фиктивная сессия с задержкой --api-latency.
+
+Запуск:
+    python benchmarks/sharding_benchmark.py --updates 20000 --workers 1 2 4 8
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from http import HTTPStatus
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot, Dispatcher, F
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import AnswerCallbackQuery, EditMessageText
+from aiogram.types import CallbackQuery
+
+from bot.database.models import Product
+from bot.keyboards.keyboards import catalog_keyboard
+from bot.services import sharding
+
+# Токен в формате Telegram; запросы к API не выходят за пределы процесса
+BOT_TOKEN = "123456:BENCHMARK-TOKEN"
+PRODUCTS = [Product(i, f"Товар {i}", None, 100.0 + i, None, ["USDT", "TON"]) for i in range(1, 11)]
+
+
+class FakeSession(BaseSession):
+    """Сессия aiogram, отвечающая на запросы заранее заготовленными результатами"""
+
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+
+    async def make_request(self, bot, method, timeout=None):
+        await asyncio.sleep(self.latency)
+        result = True
+        if isinstance(method, EditMessageText):
+            result = {"message_id": method.message_id, "date": 0, "text": method.text,
+                      "chat": {"id": method.chat_id, "type": "private"}}
+        return self.check_response(bot, method, HTTPStatus.OK, json.dumps({"ok": True, "result": result}))
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def make_update(update_id: int, user_id: int) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": "User"}
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id), "from": user, "chat_instance": str(user_id), "data": "catalog",
+            "message": {"message_id": 1, "date": 0, "chat": {"id": user_id, "type": "private"}, "text": "Каталог"},
+        },
+    }
+
+
+def run_worker(queue, ready, api_latency: float) -> None:
+    dp = Dispatcher()
+
+    @dp.callback_query(F.data == "catalog")
+    async def show_catalog(callback: CallbackQuery):
+        await callback.message.edit_text("📋 Каталог товаров:", reply_markup=catalog_keyboard(PRODUCTS, has_next=True))
+        await callback.bot(AnswerCallbackQuery(callback_query_id=callback.id))
+
+    bot = Bot(token=BOT_TOKEN, session=FakeSession(api_latency))
+    ready.set()
+    asyncio.run(sharding.run_worker(dp, bot, queue))
+
+
+async def run(workers: int, updates: int, users: int, api_latency: float) -> float:
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue(1000) for _ in range(workers)]
+    ready = [context.Event() for _ in range(workers)]
+    processes = [
+        context.Process(target=run_worker, args=(queue, event, api_latency)) for queue, event in zip(queues, ready)
+    ]
+    for process in processes:
+        process.start()
+    # Время запуска процессов (импорт aiogram) не учитываем
+    for event in ready:
+        event.wait()
+    router = sharding.ShardRouter(queues)
+
+    start = time.perf_counter()
+    for update_id in range(updates):
+        await router.dispatch(make_update(update_id, update_id % users + 1))
+    await router.close()
+    loop = asyncio.get_running_loop()
+    for process in processes:
+        await loop.run_in_executor(None, process.join)
+    elapsed = time.perf_counter() - start
+
+    rate = updates / elapsed
+    print(f"{workers} worker(s): {updates} updates in {elapsed:.2f}s -> {rate:,.0f} updates/s")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark update processing across worker processes')
+    parser.add_argument('--updates', '-n', type=int, default=20000, help='Number of updates to process')
+    parser.add_argument('--users', '-u', type=int, default=5000, help='Number of distinct users')
+    parser.add_argument('--workers', '-w', type=int, nargs='+', default=[1, 2, 4, 8], help='Worker counts to test')
+    parser.add_argument('--api-latency', type=float, default=0.005, help='Simulated Bot API latency, seconds')
+    args = parser.parse_args()
+
+    print(f"CPU cores: {os.cpu_count()}")
+    baseline = None
+    for workers in args.workers:
+        rate = asyncio.run(run(workers, args.updates, args.users, args.api_latency))
+        baseline = baseline or rate
+        print(f"  speedup vs {args.workers[0]} worker(s): x{rate / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
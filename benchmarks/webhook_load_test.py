@@ -0,0 +1,123 @@
+"""
+Нагрузочный тест режима вебхука: синтетические обновления Telegram
+отправляются на локальный сервер bot.services.telegram_webhook
+
+Хендлер теста не обращается к Telegram, а имитирует работу задержкой
+--handler-latency, поэтому замеряется только прием и разбор очереди.
+В конце сервер останавливается, и тест проверяет, что все принятые
+обновления были обработаны.
+
+Запуск:
+    python benchmarks/webhook_load_test.py --updates 20000 --concurrency 100
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+from aiohttp import web
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.services import telegram_webhook
+
+SECRET = "load-test-secret"
+# Токен в формате Telegram; запросы к API тест не выполняет
+FAKE_TOKEN = "123456:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA"
+
+
+def make_update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": 1000 + update_id % 500, "type": "private"},
+            "from": {"id": 1000 + update_id % 500, "is_bot": False, "first_name": "Load"},
+            "text": "/start"
+        }
+    }
+
+
+async def push(url: str, updates: int, concurrency: int) -> int:
+    """Отправить обновления с заданной параллельностью; возвращает число принятых"""
+    counter = iter(range(updates))
+    accepted = 0
+
+    async def sender(session: aiohttp.ClientSession) -> None:
+        nonlocal accepted
+        for update_id in counter:
+            async with session.post(url, json=make_update(update_id),
+                                    headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as response:
+                if response.status == 200:
+                    accepted += 1
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        await asyncio.gather(*(sender(session) for _ in range(concurrency)))
+    return accepted
+
+
+async def run(args) -> None:
+    processed = 0
+
+    router = Router()
+
+    @router.message()
+    async def handle(message: Message):
+        nonlocal processed
+        await asyncio.sleep(args.handler_latency)
+        processed += 1
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    bot = Bot(token=FAKE_TOKEN)
+
+    app = telegram_webhook.create_app(dp, bot, secret_token=SECRET, path="/webhook",
+                                      workers=args.workers, queue_size=args.queue_size)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+
+    url = f"http://127.0.0.1:{args.port}/webhook"
+    start = time.perf_counter()
+    accepted = await push(url, args.updates, args.concurrency)
+    push_elapsed = time.perf_counter() - start
+
+    # Остановка дожидается обработки всех принятых обновлений
+    await runner.cleanup()
+    total_elapsed = time.perf_counter() - start
+
+    print(f"accepted   {accepted}/{args.updates} updates in {push_elapsed:.2f}s -> {accepted / push_elapsed:,.0f} updates/s")
+    print(f"processed  {processed} updates in {total_elapsed:.2f}s -> {processed / total_elapsed:,.0f} updates/s")
+    print(f"drained:   {'ok' if processed == accepted else f'lost {accepted - processed}'}")
+
+    # Неверный секрет должен отклоняться
+    runner = web.AppRunner(telegram_webhook.create_app(dp, Bot(token=FAKE_TOKEN), secret_token=SECRET, path="/webhook"))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, json=make_update(0), headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}) as response:
+            print(f"wrong secret -> HTTP {response.status}")
+    await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the Telegram webhook runtime')
+    parser.add_argument('--updates', '-n', type=int, default=10000, help='Number of synthetic updates')
+    parser.add_argument('--concurrency', '-c', type=int, default=100, help='Concurrent HTTP senders')
+    parser.add_argument('--workers', '-w', type=int, default=32, help='Webhook worker pool size')
+    parser.add_argument('--queue-size', '-q', type=int, default=1000, help='Webhook queue size')
+    parser.add_argument('--handler-latency', type=float, default=0.005, help='Simulated handler time, seconds')
+    parser.add_argument('--port', '-p', type=int, default=8089, help='Local port for the test server')
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
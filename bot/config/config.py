@@ -3,10 +3,32 @@ from typing import List
 
 # Токен бота
 TELEGRAM_BOT_TOKEN = ""
+TELEGRAM_API_URL = None  # Переопределение адреса Bot API (например, локальный telegram-bot-api или заглушка)
+
+# Режим получения обновлений Telegram: "polling" (long polling) или "webhook"
+TELEGRAM_RUN_MODE = "polling"
+TELEGRAM_WEBHOOK_BASE_URL = ""  # Публичный HTTPS-адрес бота, например "https://bot.example.com"
+TELEGRAM_WEBHOOK_PATH = "/telegram/webhook"  # Путь, на который Telegram отправляет обновления
+TELEGRAM_WEBHOOK_SECRET = ""  # Секрет X-Telegram-Bot-Api-Secret-Token (пусто - генерируется при запуске)
+TELEGRAM_WEBHOOK_HOST = "0.0.0.0"  # Адрес, на котором слушает веб-сервер
+TELEGRAM_WEBHOOK_PORT = 8080  # Порт веб-сервера
+TELEGRAM_WEBHOOK_MAX_CONNECTIONS = 40  # Максимум одновременных соединений от Telegram (1-100)
+TELEGRAM_WEBHOOK_WORKERS = 32  # Число обработчиков, параллельно обрабатывающих обновления
+TELEGRAM_WEBHOOK_QUEUE_SIZE = 1000  # Максимум принятых, но еще не обработанных обновлений
+TELEGRAM_WEBHOOK_DRAIN_TIMEOUT = 30  # Сколько ждать обработки очереди при остановке, в секундах
+
+# Многопроцессный режим: основной процесс получает обновления и распределяет их по ID пользователя
+WORKER_PROCESSES = 1  # Число рабочих процессов (1 - все в одном процессе)
+WORKER_QUEUE_SIZE = 1000  # Максимум обновлений в очереди одного рабочего процесса
+WORKER_CONCURRENCY = 100  # Сколько обновлений рабочий процесс обрабатывает одновременно
+WORKER_STOP_TIMEOUT = 30  # Сколько ждать завершения рабочих процессов при остановке, в секундах
 
 # Токен Crypto Pay API
 CRYPTO_PAY_TOKEN = ''
 TESTNET = True  # Установите False для основной сети
+CRYPTO_PAY_API_URL = None  # Переопределение адреса API (например, для локальной заглушки)
+CRYPTO_PAY_TIMEOUT = 10  # Таймаут одного запроса к Crypto Pay, в секундах
+CRYPTO_PAY_CONNECTION_LIMIT = 20  # Максимум одновременных соединений с Crypto Pay
 
 # Важно: при TESTNET=True доступны только тестовые валюты
 # При работе в тестовой сети доступны: TONCOIN, BTC, ETH, USDT, USDC, BUSD
@@ -14,6 +36,16 @@ TESTNET = True  # Установите False для основной сети
 
 # Настройки базы данных
 DATABASE_FILE = "crypto_store.db"
+DB_EXECUTOR_WORKERS = 4  # Потоки, выполняющие запросы к БД для асинхронных обработчиков
+DB_MAX_PENDING_QUERIES = 256  # Максимум одновременно ожидающих запросов к БД
+CATALOG_CHECK_INTERVAL = 2  # Как часто проверять изменения товаров из других процессов, в секундах
+FSM_STATE_TTL = 86400  # Через сколько секунд без изменений состояние диалога (например, поддержки) сбрасывается
+FSM_FLUSH_INTERVAL = 1  # Как часто записывать изменения состояний в базу, в секундах (0 - сразу)
+CATALOG_PAGE_SIZE = 10  # Товаров на одной странице каталога
+RENDER_CACHE_SIZE = 1024  # Сколько готовых сообщений и клавиатур каталога хранить в памяти
+SEARCH_RESULTS_LIMIT = 20  # Максимум результатов поиска товаров
+SEARCH_CACHE_SIZE = 512  # Сколько запросов поиска хранить в кэше результатов
+SEARCH_INLINE_CACHE_TIME = 60  # Сколько секунд Telegram может кэшировать результаты inline-поиска
 
 # Поддерживаемые криптовалюты
 # Важно: убедитесь, что эти валюты доступны в выбранной сети (тестовой или основной)
@@ -22,12 +54,73 @@ if TESTNET:
 else:
     SUPPORTED_CURRENCIES = ["TON", "BTC", "USDT", "USDC", "BUSD"]
 
+# Настройки исходящих HTTP-запросов (общий пул соединений)
+HTTP_TIMEOUT = 15  # Общий таймаут запроса, в секундах
+HTTP_CONNECT_TIMEOUT = 5  # Таймаут установки соединения, в секундах
+HTTP_CONNECTION_LIMIT = 100  # Максимум соединений в пуле
+HTTP_CONNECTION_LIMIT_PER_HOST = 20  # Максимум соединений к одному хосту
+HTTP_KEEPALIVE_TIMEOUT = 60  # Время жизни простаивающего соединения, в секундах
+HTTP_DNS_CACHE_TTL = 300  # Время кэширования DNS-ответов, в секундах
+
 # URL API обменного курса (для конвертации RUB в USD)
 EXCHANGE_RATE_API_URL = "https://api.exchangerate-api.com/v4/latest/RUB"
 
 # URL API цен на криптовалюты (для конвертации USD в крипту)
 CRYPTO_PRICE_API_URL = "https://api.coingecko.com/api/v3/simple/price"
 
+# Настройки фонового обновления курсов
+RATES_TTL = 300  # Интервал обновления курсов, в секундах
+RATES_REFRESH_JITTER = 30  # Случайная добавка к интервалу, в секундах
+RATES_RETRY_INTERVAL = 30  # Пауза перед повтором после неудачного обновления, в секундах
+RATES_MANUAL_REFRESH_MIN_INTERVAL = 60  # /update_rates не запрашивает API чаще, в секундах
+RATES_MAX_STALENESS = 1800  # Покупка ждет обновления, если курсы старше, в секундах
+PRICE_TABLE_NUMPY_THRESHOLD = 1000  # С какого числа товаров таблица цен считается через NumPy (если установлен)
+RATES_SYNC_INTERVAL = 5  # Как часто рабочие процессы читают общий снимок курсов, в секундах
+
+# Настройки фоновой проверки оплаты счетов
+INVOICE_POLL_ENABLED = True  # Проверять ожидающие счета в фоне, не дожидаясь кнопки "Проверить оплату"
+INVOICE_POLL_INTERVAL = 15  # Интервал между проверками, в секундах
+INVOICE_POLL_BATCH_SIZE = 100  # Число счетов в одном запросе getInvoices (не больше 1000)
+CHECK_PAYMENT_CACHE_TTL = 3  # Сколько секунд повторные нажатия "Проверить оплату" получают прежний ответ API
+
+# Настройки очереди доставки товаров
+DELIVERY_WORKERS = 8  # Число одновременных доставок
+DELIVERY_POLL_INTERVAL = 5  # Как часто проверять очередь без новых оплат, в секундах
+DELIVERY_BATCH_SIZE = 100  # Сколько доставок выбирать из очереди за раз
+DELIVERY_RETRY_BASE_DELAY = 2  # Первая пауза перед повтором, удваивается с каждой попыткой, в секундах
+DELIVERY_RETRY_MAX_DELAY = 300  # Максимальная пауза перед повтором, в секундах
+DELIVERY_MAX_ATTEMPTS = 10  # После стольких неудач доставка прекращается
+DELIVERY_DRAIN_TIMEOUT = 10  # Сколько ждать начатых доставок при остановке, в секундах
+
+# Настройки приема вебхуков Crypto Pay (адрес указывается в настройках приложения в @CryptoBot)
+CRYPTO_PAY_WEBHOOK_ENABLED = False  # Запустить веб-сервер для уведомлений invoice_paid
+CRYPTO_PAY_WEBHOOK_HOST = "0.0.0.0"  # Адрес, на котором слушает веб-сервер
+CRYPTO_PAY_WEBHOOK_PORT = 8081  # Порт веб-сервера
+CRYPTO_PAY_WEBHOOK_PATH = "/cryptopay/webhook"  # Путь, на который Crypto Pay отправляет обновления
+
+# Ограничение частоты запросов пользователей
+# rate - сколько запросов в секунду восполняется, burst - сколько можно сделать подряд,
+# max_in_flight - сколько обработчиков маршрута может выполняться одновременно (всего по всем пользователям)
+THROTTLE_ROUTES = {
+    "currency_": {"rate": 0.1, "burst": 2, "max_in_flight": 20},  # Создание заказа и счета
+    "check_": {"rate": 0.5, "burst": 3, "max_in_flight": 50},  # Проверка оплаты
+    "catalog": {"rate": 5, "burst": 10},
+    "page_": {"rate": 5, "burst": 10},
+    "product_": {"rate": 5, "burst": 10},
+    "inline": {"rate": 5, "burst": 20},  # Inline-поиск отправляет запрос на каждую букву
+}
+THROTTLE_DEFAULT = {"rate": 2, "burst": 5}  # Для остальных колбэков и сообщений
+THROTTLE_MAX_IN_FLIGHT = 200  # Сколько обработчиков может выполняться одновременно всего
+
+# Замер задержек обработчиков, запросов к БД и внешним API (отчет - команда /perf для SUPPORT_ADMIN_IDS)
+LATENCY_METRICS_ENABLED = True
+
+# Метрики в формате Prometheus (рабочие процессы отдают свои на METRICS_PORT + 1, + 2, ...)
+METRICS_ENABLED = False  # Включить сервер метрик
+METRICS_HOST = "127.0.0.1"  # Адрес сервера метрик (не открывайте его наружу)
+METRICS_PORT = 9108  # Порт сервера метрик
+METRICS_PATH = "/metrics"  # Путь, который опрашивает Prometheus
+
 # Соответствие тикеров криптовалют идентификаторам CoinGecko
 CRYPTO_ID_MAPPING = {
     "TON": "the-open-network",
@@ -0,0 +1,212 @@
+"""
+Асинхронные обертки над функциями bot.database.db
+
+Запросы выполняются в выделенном пуле потоков, поэтому fsync при коммите
+не блокирует цикл событий. Каждый поток пула держит собственное
+соединение (см. db.get_connection), а семафор ограничивает число
+одновременно ожидающих запросов.
+"""
+
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from bot.config import DB_EXECUTOR_WORKERS, DB_MAX_PENDING_QUERIES
+from bot.database import db
+from bot.database.models import Order, Product
+from bot.utils import latency
+
+_executor: Optional[ThreadPoolExecutor] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+    return _executor
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(DB_MAX_PENDING_QUERIES)
+    return _semaphore
+
+
+async def run(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Выполнить синхронную функцию БД в пуле потоков"""
+    loop = asyncio.get_running_loop()
+    # Время замеряется вместе с ожиданием свободного потока: столько ждет обработчик
+    start = time.perf_counter()
+    try:
+        async with _get_semaphore():
+            return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+    finally:
+        latency.record(f"db.{func.__name__}", time.perf_counter() - start)
+
+
+def shutdown() -> None:
+    """Остановить пул потоков и закрыть соединения"""
+    global _executor, _semaphore
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    _semaphore = None
+    db.close_connections()
+
+
+async def init_db() -> None:
+    """Инициализирует базу данных с необходимыми таблицами"""
+    await run(db.init_db)
+
+
+async def get_products() -> List[Product]:
+    """Получает все товары из базы данных"""
+    return await run(db.get_products)
+
+
+async def get_catalog_version() -> int:
+    """Получает счетчик изменений товаров"""
+    return await run(db.get_catalog_version)
+
+
+async def get_catalog() -> Tuple[int, List[Product]]:
+    """Получает счетчик изменений и все товары одним согласованным чтением"""
+    return await run(db.get_catalog)
+
+
+async def get_products_page(category_id: Optional[int] = None, after_id: int = 0, before_id: Optional[int] = None,
+                            limit: int = 10) -> Tuple[List[Product], bool]:
+    """Получает страницу товаров по ключу id (keyset-пагинация)"""
+    return await run(db.get_products_page, category_id, after_id, before_id, limit)
+
+
+async def get_categories() -> List[Tuple[int, str]]:
+    """Получает категории, в которых есть товары"""
+    return await run(db.get_categories)
+
+
+async def search_products(text: str, limit: int = 20) -> List[Product]:
+    """Ищет товары по названию и описанию"""
+    return await run(db.search_products, text, limit)
+
+
+async def get_product_by_id(product_id: int) -> Optional[Product]:
+    """Получает товар по его ID"""
+    return await run(db.get_product_by_id, product_id)
+
+
+async def create_order(user_id: int, product_id: int, currency: str, amount: float) -> int:
+    """Создает новый заказ и возвращает его ID"""
+    return await run(db.create_order, user_id, product_id, currency, amount)
+
+
+async def update_order_invoice(order_id: int, invoice_id: int) -> None:
+    """Обновляет заказ, добавляя ID счета"""
+    await run(db.update_order_invoice, order_id, invoice_id)
+
+
+async def update_order_status(invoice_id: int, status: str) -> None:
+    """Обновляет статус заказа по ID счета"""
+    await run(db.update_order_status, invoice_id, status)
+
+
+async def get_pending_orders() -> List[Order]:
+    """Получает неоплаченные заказы, для которых уже выставлен счет"""
+    return await run(db.get_pending_orders)
+
+
+async def settle_pending_orders(statuses: Dict[int, str]) -> List[Order]:
+    """Переводит ожидающие заказы в новые статусы одной транзакцией"""
+    return await run(db.settle_pending_orders, statuses)
+
+
+async def get_due_deliveries(now: float, limit: int) -> List[Tuple]:
+    """Получает недоставленные заказы, время попытки доставки которых наступило"""
+    return await run(db.get_due_deliveries, now, limit)
+
+
+async def get_delivery_queue_stats(now: float) -> Tuple[int, int, int]:
+    """Число недоставленных заказов: (ждут времени попытки, готовы к доставке, попытки прекращены)"""
+    return await run(db.get_delivery_queue_stats, now)
+
+
+async def mark_delivered(order_id: int) -> bool:
+    """Отмечает заказ доставленным"""
+    return await run(db.mark_delivered, order_id)
+
+
+async def reschedule_delivery(order_id: int, next_attempt_at: Optional[float], error: str) -> None:
+    """Записывает неудачную попытку доставки"""
+    await run(db.reschedule_delivery, order_id, next_attempt_at, error)
+
+
+async def get_order_by_id(order_id: int) -> Optional[Order]:
+    """Получает заказ по его ID"""
+    return await run(db.get_order_by_id, order_id)
+
+
+async def get_order_by_invoice_id(invoice_id: int) -> Optional[Order]:
+    """Получает заказ по ID счета"""
+    return await run(db.get_order_by_invoice_id, invoice_id)
+
+
+async def add_product(name: str, description: str, price_rub: float, image_url: str,
+                      available_currencies: List[str], category: Optional[str] = None) -> int:
+    """Добавляет новый товар в базу данных и возвращает его ID"""
+    return await run(db.add_product, name, description, price_rub, image_url, available_currencies, category)
+
+
+async def update_product(product_id: int, name: str, description: str, price_rub: float,
+                         image_url: str, available_currencies: List[str], category: Optional[str] = None) -> bool:
+    """Обновляет существующий товар; category=None - категория не меняется, "" - убрать из категории"""
+    return await run(db.update_product, product_id, name, description, price_rub, image_url,
+                     available_currencies, category)
+
+
+async def delete_product(product_id: int) -> bool:
+    """Удаляет товар по его ID"""
+    return await run(db.delete_product, product_id)
+
+
+async def get_media_file_id(file_path: str, content_hash: str) -> Optional[str]:
+    """Получает file_id Telegram для файла с указанным содержимым"""
+    return await run(db.get_media_file_id, file_path, content_hash)
+
+
+async def save_media_file_id(file_path: str, content_hash: str, file_id: str) -> None:
+    """Сохраняет file_id Telegram для файла"""
+    await run(db.save_media_file_id, file_path, content_hash, file_id)
+
+
+async def delete_media_file_id(file_path: str, content_hash: str) -> None:
+    """Удаляет file_id из кэша"""
+    await run(db.delete_media_file_id, file_path, content_hash)
+
+
+async def get_fsm_record(key: str) -> Optional[Tuple[Optional[str], Optional[str], float]]:
+    """Получает состояние FSM по ключу в виде (состояние, JSON данных, время изменения)"""
+    return await run(db.get_fsm_record, key)
+
+
+async def save_fsm_records(records: List[Tuple[str, Optional[str], Optional[str], float]]) -> None:
+    """Сохраняет состояния FSM одной транзакцией"""
+    await run(db.save_fsm_records, records)
+
+
+async def delete_expired_fsm_records(updated_before: float) -> int:
+    """Удаляет состояния FSM, не менявшиеся с указанного времени; возвращает их число"""
+    return await run(db.delete_expired_fsm_records, updated_before)
+
+
+async def save_rates_snapshot(data: Dict[str, Any]) -> int:
+    """Сохраняет снимок курсов для других процессов; возвращает его версию"""
+    return await run(db.save_rates_snapshot, data)
+
+
+async def get_rates_snapshot(newer_than: int = 0) -> Optional[Tuple[int, Dict[str, Any]]]:
+    """Получает снимок курсов (версия, данные), если он новее указанной версии"""
+    return await run(db.get_rates_snapshot, newer_than)
@@ -0,0 +1,108 @@
+"""
+Кэш каталога товаров
+
+Товары читаются из базы целиком и хранятся в памяти с уже разобранным и
+отфильтрованным по SUPPORTED_CURRENCIES списком валют, поэтому просмотр
+каталога, карточка товара, покупка и доставка не обращаются к SQLite.
+
+Кэш сбрасывается сразу после add_product/update_product/delete_product в
+этом процессе (db.get_catalog_writes), а изменения из других процессов,
+например из add_product.py, замечаются по счетчику catalog_version,
+который увеличивают триггеры на таблице products. Счетчик проверяется не
+чаще раза в CATALOG_CHECK_INTERVAL секунд.
+
+Кэшам страниц каталога и результатов поиска нужна только версия, а не
+сами товары: get_db_version читает одну строку catalog_version с той же
+периодичностью и не загружает каталог.
+"""
+
+import time
+from typing import Dict, List, Optional
+
+from bot.config import SUPPORTED_CURRENCIES, CATALOG_CHECK_INTERVAL
+from bot.database import async_db, db
+from bot.database.models import Product
+from bot.utils.singleflight import SingleFlight
+
+_products: Optional[List[Product]] = None
+_products_by_id: Dict[int, Product] = {}
+_version = -1
+_writes = -1
+_checked_at = 0.0
+
+# Версия в базе для get_db_version, отслеживается независимо от загрузки товаров
+_db_version = -1
+_db_writes = -1
+_db_checked_at = 0.0
+
+_load_flight = SingleFlight()
+
+
+def filter_currencies(currencies: List[str]) -> List[str]:
+    """Оставить валюты, поддерживаемые в текущей сети"""
+    supported = [c for c in currencies if c in SUPPORTED_CURRENCIES]
+    # Если нет доступных валют, используем все поддерживаемые
+    return supported or list(SUPPORTED_CURRENCIES)
+
+
+async def _load() -> None:
+    global _products, _products_by_id, _version, _writes, _checked_at
+    writes = db.get_catalog_writes()
+    version, rows = await async_db.get_catalog()
+    products = [row.with_currencies(filter_currencies(row.currencies)) for row in rows]
+    _products = products
+    _products_by_id = {product.id: product for product in products}
+    _version = version
+    _writes = writes
+    _checked_at = time.monotonic()
+
+
+async def _ensure_loaded() -> None:
+    global _checked_at
+    if _products is None or _writes != db.get_catalog_writes():
+        await _load_flight.do("catalog", _load)
+        return
+
+    now = time.monotonic()
+    if now - _checked_at < CATALOG_CHECK_INTERVAL:
+        return
+    _checked_at = now
+    if await async_db.get_catalog_version() != _version:
+        await _load_flight.do("catalog", _load)
+
+
+def get_version() -> int:
+    """Версия загруженного каталога (значение catalog_version при загрузке)"""
+    return _version
+
+
+async def _read_db_version() -> None:
+    global _db_version, _db_writes, _db_checked_at
+    writes = db.get_catalog_writes()
+    _db_version = await async_db.get_catalog_version()
+    _db_writes = writes
+    _db_checked_at = time.monotonic()
+
+
+async def get_db_version() -> int:
+    """
+    Версия каталога в базе без загрузки товаров
+
+    Изменения этого процесса видны сразу, изменения других процессов - не
+    позже чем через CATALOG_CHECK_INTERVAL секунд.
+    """
+    if _db_writes != db.get_catalog_writes() or time.monotonic() - _db_checked_at >= CATALOG_CHECK_INTERVAL:
+        await _load_flight.do("version", _read_db_version)
+    return _db_version
+
+
+async def get_products() -> List[Product]:
+    """Получить все товары"""
+    await _ensure_loaded()
+    return _products
+
+
+async def get_product(product_id: int) -> Optional[Product]:
+    """Получить товар по ID или None"""
+    await _ensure_loaded()
+    return _products_by_id.get(product_id)
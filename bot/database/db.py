@@ -1,164 +1,423 @@
 import sqlite3
+import threading
+import time
 from typing import List, Dict, Any, Tuple, Optional
 import os
 import json
+import re
 from datetime import datetime
 
-from bot.config import DATABASE_FILE, TESTNET, SUPPORTED_CURRENCIES
+from bot.config import DATABASE_FILE, TESTNET
+from bot.database import migrations
+from bot.database.models import Order, Product, order_factory, product_factory
+
+# Размер кэша подготовленных выражений для каждого соединения
+STATEMENT_CACHE_SIZE = 256
+
+# Прагмы, применяемые к каждому новому соединению
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Соединения живут в пределах потока: sqlite3.Connection нельзя
+# безопасно использовать из нескольких потоков одновременно
+_local = threading.local()
+_connections: List[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+_generation = 0
+
+# Число изменений товаров через этот процесс; по нему кэш каталога сбрасывается сразу,
+# а изменения из других процессов он замечает по таблице catalog_version.
+# Увеличивается из потоков пула async_db, поэтому под блокировкой
+_catalog_writes = 0
+_catalog_writes_lock = threading.Lock()
+
+def _query(conn: sqlite3.Connection, row_factory, sql: str, params: Tuple = ()) -> sqlite3.Cursor:
+    """Выполняет запрос, строки результата которого строит row_factory"""
+    cursor = conn.cursor()
+    cursor.row_factory = row_factory
+    return cursor.execute(sql, params)
 
 def get_db_path() -> str:
     """Возвращает путь к файлу базы данных"""
     return DATABASE_FILE
 
-def init_db() -> None:
-    """Инициализирует базу данных с необходимыми таблицами"""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    
-    # Таблица товаров с ценой в рублях
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            description TEXT,
-            price_rub REAL NOT NULL,
-            image_url TEXT,
-            available_currencies TEXT
-        )
-    ''')
-    
-    # Таблица заказов
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS orders (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            product_id INTEGER NOT NULL,
-            invoice_id INTEGER,
-            currency TEXT NOT NULL,
-            amount REAL NOT NULL,
-            status TEXT DEFAULT 'pending',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (product_id) REFERENCES products (id)
-        )
-    ''')
-    
-    # Добавляем тестовые товары, если таблица пуста
-    cursor.execute('SELECT COUNT(*) FROM products')
-    if cursor.fetchone()[0] == 0:
-        # Используем валюты из конфигурации для тестовых товаров
-        test_products = [
-            ("То, без чего не сдать программирование", "Супер секретно", 100.0, "https://example.com/course.jpg", json.dumps(SUPPORTED_CURRENCIES)),
-            ("Секретная nft", "Невероятно секретно",100.0, "https://example.com/book.jpg", json.dumps(SUPPORTED_CURRENCIES)),
-        ]
-        cursor.executemany(
-            'INSERT INTO products (name, description, price_rub, image_url, available_currencies) VALUES (?, ?, ?, ?, ?)',
-            test_products
-        )
-    else:
-        # Обновляем существующие товары, чтобы они поддерживали все валюты
-        cursor.execute('UPDATE products SET available_currencies = ?', (json.dumps(SUPPORTED_CURRENCIES),))
+def _open_connection(path: str) -> sqlite3.Connection:
+    """Открывает новое соединение и настраивает его прагмы"""
+    # Соединение закрепляется за потоком в get_connection(), поэтому проверку
+    # потока отключаем только ради закрытия в close_connections()
+    conn = sqlite3.connect(path, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Возвращает долгоживущее соединение текущего потока
+
+    Соединение создается при первом обращении и переиспользуется всеми
+    последующими запросами этого потока вместе с кэшем подготовленных выражений.
+    """
+    path = get_db_path()
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == path and _local.generation == _generation:
+        return conn
     
-    conn.commit()
-    conn.close()
+    conn = _open_connection(path)
+    with _connections_lock:
+        _connections.append(conn)
+        _local.generation = _generation
+    _local.conn = conn
+    _local.path = path
+    return conn
+
+def close_connections() -> None:
+    """Закрывает все открытые соединения (вызывается при остановке бота)"""
+    global _generation
+    with _connections_lock:
+        connections = list(_connections)
+        _connections.clear()
+        # Потоки увидят новое поколение и откроют свежие соединения
+        _generation += 1
+    for conn in connections:
+        conn.close()
 
-def get_products() -> List[Tuple]:
+def init_db() -> None:
+    """Инициализирует базу данных: применяет недостающие миграции схемы"""
+    migrations.migrate(get_connection())
+
+def get_products() -> List[Product]:
     """Получает все товары из базы данных"""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM products')
-    products = cursor.fetchall()
-    conn.close()
-    return products
+    conn = get_connection()
+    return _query(conn, product_factory, 'SELECT * FROM products').fetchall()
+
+def _count_catalog_write() -> None:
+    """Учитывает изменение товаров, сделанное этим процессом"""
+    global _catalog_writes
+    with _catalog_writes_lock:
+        _catalog_writes += 1
+
+def get_catalog_writes() -> int:
+    """Возвращает число изменений товаров, сделанных этим процессом"""
+    return _catalog_writes
 
-def get_product_by_id(product_id: int) -> Optional[Tuple]:
+def get_catalog_version() -> int:
+    """Получает счетчик изменений товаров (увеличивается триггерами на products)"""
+    conn = get_connection()
+    return conn.execute('SELECT version FROM catalog_version WHERE id = 1').fetchone()[0]
+
+def get_catalog() -> Tuple[int, List[Product]]:
+    """Получает счетчик изменений и все товары одним согласованным чтением"""
+    conn = get_connection()
+    with conn:
+        conn.execute('BEGIN')
+        version = conn.execute('SELECT version FROM catalog_version WHERE id = 1').fetchone()[0]
+        products = _query(conn, product_factory, 'SELECT * FROM products ORDER BY id').fetchall()
+    return version, products
+
+def get_products_page(category_id: Optional[int] = None, after_id: int = 0, before_id: Optional[int] = None,
+                      limit: int = 10) -> Tuple[List[Product], bool]:
+    """
+    Получает страницу товаров по ключу id (keyset-пагинация)
+
+    Если задан before_id, возвращает товары перед ним, иначе - после after_id.
+    Товары всегда упорядочены по id. Второй элемент результата - есть ли
+    товары дальше в направлении обхода. category_id=None - все товары.
+    """
+    conn = get_connection()
+    where = 'category_id = ? AND ' if category_id is not None else ''
+    params: Tuple = (category_id,) if category_id is not None else ()
+    if before_id is not None:
+        sql = f'SELECT * FROM products WHERE {where}id < ? ORDER BY id DESC LIMIT ?'
+        params += (before_id, limit + 1)
+    else:
+        sql = f'SELECT * FROM products WHERE {where}id > ? ORDER BY id LIMIT ?'
+        params += (after_id, limit + 1)
+    products = _query(conn, product_factory, sql, params).fetchall()
+    has_more = len(products) > limit
+    products = products[:limit]
+    if before_id is not None:
+        products.reverse()
+    return products, has_more
+
+def get_categories() -> List[Tuple[int, str]]:
+    """Получает категории, в которых есть товары, в виде (id, название)"""
+    conn = get_connection()
+    return conn.execute(
+        '''SELECT id, name FROM categories
+           WHERE EXISTS (SELECT 1 FROM products WHERE products.category_id = categories.id)
+           ORDER BY name'''
+    ).fetchall()
+
+def _fts_query(text: str) -> str:
+    """Строит запрос FTS5: все слова текста, последнее - как префикс"""
+    words = re.findall(r'\w+', text)
+    if not words:
+        return ''
+    # Слова берутся в кавычки, чтобы операторы FTS5 в тексте пользователя не разбирались
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+def search_products(text: str, limit: int = 20) -> List[Product]:
+    """Ищет товары по названию и описанию; возвращает товары в порядке релевантности"""
+    query = _fts_query(text)
+    if not query:
+        return []
+    conn = get_connection()
+    return _query(
+        conn, product_factory,
+        '''SELECT products.* FROM products_fts JOIN products ON products.id = products_fts.rowid
+           WHERE products_fts MATCH ? ORDER BY products_fts.rank LIMIT ?''',
+        (query, limit)
+    ).fetchall()
+
+def _get_category_id(conn: sqlite3.Connection, category: Optional[str]) -> Optional[int]:
+    """Возвращает ID категории по названию, создавая ее при необходимости"""
+    if not category:
+        return None
+    conn.execute('INSERT OR IGNORE INTO categories (name) VALUES (?)', (category,))
+    return conn.execute('SELECT id FROM categories WHERE name = ?', (category,)).fetchone()[0]
+
+def get_product_by_id(product_id: int) -> Optional[Product]:
     """Получает товар по его ID"""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM products WHERE id = ?', (product_id,))
-    product = cursor.fetchone()
-    conn.close()
-    return product
+    conn = get_connection()
+    return _query(conn, product_factory, 'SELECT * FROM products WHERE id = ?', (product_id,)).fetchone()
 
 def create_order(user_id: int, product_id: int, currency: str, amount: float) -> int:
     """Создает новый заказ и возвращает его ID"""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute(
-        'INSERT INTO orders (user_id, product_id, currency, amount) VALUES (?, ?, ?, ?)',
-        (user_id, product_id, currency, amount)
-    )
-    order_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return order_id
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(
+            'INSERT INTO orders (user_id, product_id, currency, amount) VALUES (?, ?, ?, ?)',
+            (user_id, product_id, currency, amount)
+        )
+    return cursor.lastrowid
 
 def update_order_invoice(order_id: int, invoice_id: int) -> None:
     """Обновляет заказ, добавляя ID счета"""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute(
-        'UPDATE orders SET invoice_id = ? WHERE id = ?',
-        (invoice_id, order_id)
-    )
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            'UPDATE orders SET invoice_id = ? WHERE id = ?',
+            (invoice_id, order_id)
+        )
 
 def update_order_status(invoice_id: int, status: str) -> None:
     """Обновляет статус заказа по ID счета"""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute(
-        'UPDATE orders SET status = ? WHERE invoice_id = ?',
-        (status, invoice_id)
-    )
-    conn.commit()
-    conn.close()
-
-def get_order_by_invoice_id(invoice_id: int) -> Optional[Tuple]:
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            'UPDATE orders SET status = ? WHERE invoice_id = ?',
+            (status, invoice_id)
+        )
+
+def get_pending_orders() -> List[Order]:
+    """Получает неоплаченные заказы, для которых уже выставлен счет"""
+    conn = get_connection()
+    return _query(
+        conn, order_factory,
+        "SELECT * FROM orders WHERE status = 'pending' AND invoice_id IS NOT NULL"
+    ).fetchall()
+
+def settle_pending_orders(statuses: Dict[int, str]) -> List[Order]:
+    """
+    Переводит ожидающие заказы в новые статусы одной транзакцией
+
+    statuses - соответствие ID счета новому статусу заказа. Меняются только
+    заказы в статусе pending, поэтому повторный вызов для того же счета ничего
+    не делает. Оплаченные заказы в той же транзакции ставятся в очередь
+    доставки. Возвращает заказы, статус которых был изменен.
+    """
+    conn = get_connection()
+    changed = []
+    now = time.time()
+    with conn:
+        for invoice_id, status in statuses.items():
+            cursor = conn.execute(
+                "UPDATE orders SET status = ? WHERE invoice_id = ? AND status = 'pending'",
+                (status, invoice_id)
+            )
+            if not cursor.rowcount:
+                continue
+            orders = _query(conn, order_factory, 'SELECT * FROM orders WHERE invoice_id = ?', (invoice_id,)).fetchall()
+            if status == 'paid':
+                conn.executemany(
+                    'INSERT OR IGNORE INTO deliveries (order_id, user_id, next_attempt_at) VALUES (?, ?, ?)',
+                    [(order.id, order.user_id, now) for order in orders]
+                )
+            changed.extend(orders)
+    return changed
+
+def get_due_deliveries(now: float, limit: int) -> List[Tuple]:
+    """Получает недоставленные заказы, время попытки доставки которых наступило"""
+    conn = get_connection()
+    return conn.execute(
+        '''SELECT order_id, user_id, attempts FROM deliveries
+           WHERE delivered_at IS NULL AND next_attempt_at <= ?
+           ORDER BY next_attempt_at LIMIT ?''',
+        (now, limit)
+    ).fetchall()
+
+def get_delivery_queue_stats(now: float) -> Tuple[int, int, int]:
+    """Число недоставленных заказов: (ждут времени попытки, готовы к доставке, попытки прекращены)"""
+    conn = get_connection()
+    scheduled, due, failed = conn.execute(
+        '''SELECT COUNT(CASE WHEN next_attempt_at > ? THEN 1 END),
+                  COUNT(CASE WHEN next_attempt_at <= ? THEN 1 END),
+                  COUNT(CASE WHEN next_attempt_at IS NULL THEN 1 END)
+           FROM deliveries WHERE delivered_at IS NULL''',
+        (now, now)
+    ).fetchone()
+    return scheduled, due, failed
+
+def mark_delivered(order_id: int) -> bool:
+    """Отмечает заказ доставленным; False, если он уже был отмечен"""
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(
+            'UPDATE deliveries SET delivered_at = CURRENT_TIMESTAMP WHERE order_id = ? AND delivered_at IS NULL',
+            (order_id,)
+        )
+    return cursor.rowcount > 0
+
+def reschedule_delivery(order_id: int, next_attempt_at: Optional[float], error: str) -> None:
+    """Записывает неудачную попытку доставки; next_attempt_at=None - попытки прекращены"""
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            '''UPDATE deliveries SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?
+               WHERE order_id = ? AND delivered_at IS NULL''',
+            (next_attempt_at, error, order_id)
+        )
+
+def get_order_by_id(order_id: int) -> Optional[Order]:
+    """Получает заказ по его ID"""
+    conn = get_connection()
+    return _query(conn, order_factory, 'SELECT * FROM orders WHERE id = ?', (order_id,)).fetchone()
+
+def get_order_by_invoice_id(invoice_id: int) -> Optional[Order]:
     """Получает заказ по ID счета"""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM orders WHERE invoice_id = ?', (invoice_id,))
-    order = cursor.fetchone()
-    conn.close()
-    return order
+    conn = get_connection()
+    return _query(conn, order_factory, 'SELECT * FROM orders WHERE invoice_id = ?', (invoice_id,)).fetchone()
 
 def add_product(name: str, description: str, price_rub: float, image_url: str, 
-                available_currencies: List[str]) -> int:
+                available_currencies: List[str], category: Optional[str] = None) -> int:
     """Добавляет новый товар в базу данных и возвращает его ID"""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute(
-        'INSERT INTO products (name, description, price_rub, image_url, available_currencies) VALUES (?, ?, ?, ?, ?)',
-        (name, description, price_rub, image_url, json.dumps(available_currencies))
-    )
-    product_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return product_id
+    conn = get_connection()
+    with conn:
+        category_id = _get_category_id(conn, category)
+        cursor = conn.execute(
+            '''INSERT INTO products (name, description, price_rub, image_url, available_currencies, category_id)
+               VALUES (?, ?, ?, ?, ?, ?)''',
+            (name, description, price_rub, image_url, json.dumps(available_currencies), category_id)
+        )
+    _count_catalog_write()
+    return cursor.lastrowid
 
 def update_product(product_id: int, name: str, description: str, price_rub: float, 
-                  image_url: str, available_currencies: List[str]) -> bool:
-    """Обновляет существующий товар"""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute(
-        '''UPDATE products SET 
-           name = ?, description = ?, price_rub = ?, image_url = ?, available_currencies = ?
-           WHERE id = ?''',
-        (name, description, price_rub, image_url, json.dumps(available_currencies), product_id)
-    )
-    success = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return success
+                  image_url: str, available_currencies: List[str], category: Optional[str] = None) -> bool:
+    """
+    Обновляет существующий товар
+
+    category=None оставляет категорию товара без изменений, пустая строка
+    убирает товар из категории.
+    """
+    conn = get_connection()
+    columns = 'name = ?, description = ?, price_rub = ?, image_url = ?, available_currencies = ?'
+    params: Tuple = (name, description, price_rub, image_url, json.dumps(available_currencies))
+    with conn:
+        if category is not None:
+            columns += ', category_id = ?'
+            params += (_get_category_id(conn, category),)
+        cursor = conn.execute(f'UPDATE products SET {columns} WHERE id = ?', params + (product_id,))
+    _count_catalog_write()
+    return cursor.rowcount > 0
 
 def delete_product(product_id: int) -> bool:
     """Удаляет товар по его ID"""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM products WHERE id = ?', (product_id,))
-    success = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return success 
\ No newline at end of file
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute('DELETE FROM products WHERE id = ?', (product_id,))
+    _count_catalog_write()
+    return cursor.rowcount > 0
+
+def get_fsm_record(key: str) -> Optional[Tuple[Optional[str], Optional[str], float]]:
+    """Получает состояние FSM по ключу в виде (состояние, JSON данных, время изменения)"""
+    conn = get_connection()
+    return conn.execute('SELECT state, data, updated_at FROM fsm_states WHERE key = ?', (key,)).fetchone()
+
+def save_fsm_records(records: List[Tuple[str, Optional[str], Optional[str], float]]) -> None:
+    """
+    Сохраняет состояния FSM одной транзакцией
+
+    records - список (ключ, состояние, JSON данных, время изменения). Запись
+    без состояния и данных удаляется.
+    """
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            '''INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+               ON CONFLICT (key) DO UPDATE SET state = excluded.state, data = excluded.data,
+               updated_at = excluded.updated_at''',
+            [record for record in records if record[1] is not None or record[2] is not None]
+        )
+        conn.executemany(
+            'DELETE FROM fsm_states WHERE key = ?',
+            [(record[0],) for record in records if record[1] is None and record[2] is None]
+        )
+
+def delete_expired_fsm_records(updated_before: float) -> int:
+    """Удаляет состояния FSM, не менявшиеся с указанного времени; возвращает их число"""
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute('DELETE FROM fsm_states WHERE updated_at < ?', (updated_before,))
+    return cursor.rowcount
+
+def save_rates_snapshot(data: Dict[str, Any]) -> int:
+    """Сохраняет снимок курсов для других процессов; возвращает его версию"""
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            '''INSERT INTO rates_snapshot (id, version, data) VALUES (1, 1, ?)
+               ON CONFLICT (id) DO UPDATE SET version = version + 1, data = excluded.data''',
+            (json.dumps(data),)
+        )
+        return conn.execute('SELECT version FROM rates_snapshot WHERE id = 1').fetchone()[0]
+
+def get_rates_snapshot(newer_than: int = 0) -> Optional[Tuple[int, Dict[str, Any]]]:
+    """Получает снимок курсов (версия, данные), если он новее указанной версии"""
+    conn = get_connection()
+    row = conn.execute('SELECT version, data FROM rates_snapshot WHERE id = 1 AND version > ?', (newer_than,)).fetchone()
+    if row is None:
+        return None
+    return row[0], json.loads(row[1])
+
+def get_media_file_id(file_path: str, content_hash: str) -> Optional[str]:
+    """Получает file_id Telegram для файла с указанным содержимым"""
+    conn = get_connection()
+    row = conn.execute(
+        'SELECT file_id FROM media_cache WHERE file_path = ? AND content_hash = ?',
+        (file_path, content_hash)
+    ).fetchone()
+    return row[0] if row else None
+
+def save_media_file_id(file_path: str, content_hash: str, file_id: str) -> None:
+    """Сохраняет file_id Telegram для файла; записи для старого содержимого удаляются"""
+    conn = get_connection()
+    with conn:
+        conn.execute('DELETE FROM media_cache WHERE file_path = ? AND content_hash != ?', (file_path, content_hash))
+        conn.execute(
+            'INSERT OR REPLACE INTO media_cache (file_path, content_hash, file_id) VALUES (?, ?, ?)',
+            (file_path, content_hash, file_id)
+        )
+
+def delete_media_file_id(file_path: str, content_hash: str) -> None:
+    """Удаляет file_id из кэша (например, если Telegram его больше не принимает)"""
+    conn = get_connection()
+    with conn:
+        conn.execute('DELETE FROM media_cache WHERE file_path = ? AND content_hash = ?', (file_path, content_hash))
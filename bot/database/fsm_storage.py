@@ -0,0 +1,161 @@
+"""
+Хранилище состояний FSM в SQLite
+
+Состояния диалогов (например, SupportStates.waiting_for_message) хранятся
+в таблице fsm_states базы бота и переживают перезапуск. Чтения и записи
+обслуживаются из памяти, а измененные записи сбрасываются в базу одной
+транзакцией раз в FSM_FLUSH_INTERVAL секунд (write-behind), поэтому
+частые update_data не стоят по одному коммиту. При остановке
+(close) несохраненные изменения записываются сразу.
+
+Состояние, не менявшееся FSM_STATE_TTL секунд, считается сброшенным и
+удаляется из базы. Записи хранятся в памяти процесса, поэтому состояние
+одного пользователя должен обслуживать один процесс.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Mapping, Optional, Set
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from bot.config import FSM_STATE_TTL, FSM_FLUSH_INTERVAL
+from bot.database import async_db
+
+# Как часто удалять устаревшие состояния и неиспользуемые записи из памяти, в секундах
+_CLEANUP_INTERVAL = 300
+# Через сколько секунд без обращений запись выгружается из памяти (в базе она остается)
+_MEMORY_IDLE_TIMEOUT = 600
+
+
+class _Record:
+    __slots__ = ("state", "data", "updated_at", "used_at")
+
+    def __init__(self, state: Optional[str] = None, data: Optional[Dict[str, Any]] = None, updated_at: float = 0.0):
+        self.state = state
+        self.data = data or {}
+        self.updated_at = updated_at
+        self.used_at = time.monotonic()
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище aiogram в таблице fsm_states с отложенной записью"""
+
+    def __init__(self, state_ttl: float = FSM_STATE_TTL, flush_interval: float = FSM_FLUSH_INTERVAL):
+        self.state_ttl = state_ttl
+        self.flush_interval = flush_interval
+        self._records: Dict[str, _Record] = {}
+        self._dirty: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._cleaned_at = time.monotonic()
+
+    @staticmethod
+    def _make_key(key: StorageKey) -> str:
+        return ":".join(str(part) if part is not None else "" for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+        ))
+
+    @property
+    def active_states(self) -> int:
+        """Число диалогов с установленным состоянием среди записей в памяти"""
+        return sum(1 for record in self._records.values() if record.state is not None)
+
+    def _is_expired(self, record: _Record) -> bool:
+        has_state = record.state is not None or bool(record.data)
+        return has_state and time.time() - record.updated_at >= self.state_ttl
+
+    async def _get_record(self, key: StorageKey) -> _Record:
+        record_key = self._make_key(key)
+        record = self._records.get(record_key)
+        if record is None:
+            row = await async_db.get_fsm_record(record_key)
+            loaded = _Record()
+            if row and time.time() - row[2] < self.state_ttl:
+                loaded = _Record(row[0], json.loads(row[1]) if row[1] else {}, row[2])
+            # Пока шло чтение, запись могла появиться из другого обработчика
+            record = self._records.setdefault(record_key, loaded)
+        elif self._is_expired(record):
+            record.state = None
+            record.data = {}
+            self._dirty.add(record_key)
+        record.used_at = time.monotonic()
+        return record
+
+    async def _mark_dirty(self, key: StorageKey, record: _Record) -> None:
+        record.updated_at = time.time()
+        self._dirty.add(self._make_key(key))
+        if self.flush_interval <= 0:
+            await self.flush()
+        elif self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get_record(key)
+        record.state = state.state if isinstance(state, State) else state
+        await self._mark_dirty(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get_record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise DataNotDictLikeError(msg)
+        record = await self._get_record(key)
+        record.data = data.copy()
+        await self._mark_dirty(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._get_record(key)).data.copy()
+
+    async def flush(self) -> None:
+        """Записать накопленные изменения в базу"""
+        if not self._dirty:
+            return
+        keys, self._dirty = self._dirty, set()
+        records = []
+        for record_key in keys:
+            record = self._records[record_key]
+            records.append((
+                record_key, record.state, json.dumps(record.data) if record.data else None, record.updated_at
+            ))
+        try:
+            await async_db.save_fsm_records(records)
+        except BaseException:
+            # Повторим вместе со следующей пачкой (в том числе если запись прервана остановкой)
+            self._dirty |= keys
+            raise
+
+    async def cleanup(self) -> None:
+        """Удалить устаревшие состояния из базы и неиспользуемые записи из памяти"""
+        deleted = await async_db.delete_expired_fsm_records(time.time() - self.state_ttl)
+        if deleted:
+            logging.info(f"Expired {deleted} idle FSM states")
+        idle_before = time.monotonic() - _MEMORY_IDLE_TIMEOUT
+        for record_key in [k for k, r in self._records.items() if r.used_at < idle_before and k not in self._dirty]:
+            del self._records[record_key]
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - self._cleaned_at >= _CLEANUP_INTERVAL:
+                    self._cleaned_at = time.monotonic()
+                    await self.cleanup()
+            except Exception as e:
+                logging.error(f"Failed to save FSM states: {e}", exc_info=True)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
@@ -0,0 +1,194 @@
+"""
+Версионированные миграции схемы базы данных
+
+Каждая миграция применяется один раз, а ее номер записывается в таблицу
+schema_version. Если схема уже актуальна, migrate() выполняет один
+SELECT и ничего не меняет. Миграции применяются под BEGIN IMMEDIATE,
+поэтому бот и add_product.py, запущенные одновременно, не применят одну
+миграцию дважды.
+"""
+
+import json
+import logging
+import sqlite3
+from typing import Callable, List, Tuple, Union
+
+from bot.config import SUPPORTED_CURRENCIES
+
+
+def _create_base_tables(conn: sqlite3.Connection) -> None:
+    # Таблица товаров с ценой в рублях
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            description TEXT,
+            price_rub REAL NOT NULL,
+            image_url TEXT,
+            available_currencies TEXT
+        )
+    ''')
+
+    # Таблица заказов
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            invoice_id INTEGER,
+            currency TEXT NOT NULL,
+            amount REAL NOT NULL,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (product_id) REFERENCES products (id)
+        )
+    ''')
+
+    if conn.execute('SELECT COUNT(*) FROM products').fetchone()[0] == 0:
+        # Используем валюты из конфигурации для тестовых товаров
+        test_products = [
+            ("То, без чего не сдать программирование", "Супер секретно", 100.0, "https://example.com/course.jpg", json.dumps(SUPPORTED_CURRENCIES)),
+            ("Секретная nft", "Невероятно секретно", 100.0, "https://example.com/book.jpg", json.dumps(SUPPORTED_CURRENCIES)),
+        ]
+        conn.executemany(
+            'INSERT INTO products (name, description, price_rub, image_url, available_currencies) VALUES (?, ?, ?, ?, ?)',
+            test_products
+        )
+    else:
+        # Раньше это выполнялось при каждом запуске; теперь - один раз для существующих баз
+        conn.execute('UPDATE products SET available_currencies = ?', (json.dumps(SUPPORTED_CURRENCIES),))
+
+
+Migration = Union[str, Callable[[sqlite3.Connection], None]]
+
+# (версия, описание, шаги); новые миграции добавляются только в конец
+MIGRATIONS: List[Tuple[int, str, List[Migration]]] = [
+    (1, "products and orders tables", [_create_base_tables]),
+    (2, "delivery queue", [
+        '''CREATE TABLE IF NOT EXISTS deliveries (
+            order_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL,
+            last_error TEXT,
+            delivered_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (order_id) REFERENCES orders (id)
+        )''',
+    ]),
+    (3, "telegram file_id cache", [
+        '''CREATE TABLE IF NOT EXISTS media_cache (
+            file_path TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (file_path, content_hash)
+        )''',
+    ]),
+    (4, "order and delivery indexes", [
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_invoice_id ON orders (invoice_id)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_user_status ON orders (user_id, status)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders (status, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_deliveries_due ON deliveries (next_attempt_at) WHERE delivered_at IS NULL',
+    ]),
+    (5, "catalog change counter", [
+        'CREATE TABLE IF NOT EXISTS catalog_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)',
+        'INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)',
+        # Счетчик увеличивается при любом изменении товаров, в том числе из add_product.py
+        '''CREATE TRIGGER IF NOT EXISTS products_changed_insert AFTER INSERT ON products
+           BEGIN UPDATE catalog_version SET version = version + 1 WHERE id = 1; END''',
+        '''CREATE TRIGGER IF NOT EXISTS products_changed_update AFTER UPDATE ON products
+           BEGIN UPDATE catalog_version SET version = version + 1 WHERE id = 1; END''',
+        '''CREATE TRIGGER IF NOT EXISTS products_changed_delete AFTER DELETE ON products
+           BEGIN UPDATE catalog_version SET version = version + 1 WHERE id = 1; END''',
+    ]),
+    (6, "product categories", [
+        'CREATE TABLE IF NOT EXISTS categories (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)',
+        'ALTER TABLE products ADD COLUMN category_id INTEGER REFERENCES categories (id)',
+        # Страница каталога выбирается по ключу (category_id, id), а не через OFFSET
+        'CREATE INDEX IF NOT EXISTS idx_products_category ON products (category_id, id)',
+    ]),
+    (7, "product full-text search", [
+        # Индекс хранит только токены, сами строки читаются из products
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            name, description, content='products', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )''',
+        '''CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts (rowid, name, description) VALUES (new.id, new.name, new.description);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, description ON products BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO products_fts (rowid, name, description) VALUES (new.id, new.name, new.description);
+        END''',
+        "INSERT INTO products_fts (products_fts) VALUES ('rebuild')",
+    ]),
+    (8, "fsm storage", [
+        '''CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            updated_at REAL NOT NULL
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states (updated_at)',
+    ]),
+    (9, "shared exchange rates", [
+        '''CREATE TABLE IF NOT EXISTS rates_snapshot (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            data TEXT NOT NULL
+        )''',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(conn: sqlite3.Connection) -> int:
+    """Получить версию схемы (0 - база еще не размечена)"""
+    try:
+        row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Применить недостающие миграции; возвращает итоговую версию схемы"""
+    if get_version(conn) >= LATEST_VERSION:
+        return LATEST_VERSION
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        # Перечитываем версию под блокировкой: другой процесс мог успеть мигрировать
+        current = get_version(conn)
+        for version, description, steps in MIGRATIONS:
+            if version <= current:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(
+                'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                (version, description)
+            )
+            logging.info(f"Applied schema migration {version}: {description}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return LATEST_VERSION
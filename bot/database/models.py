@@ -0,0 +1,69 @@
+"""
+Записи товаров и заказов
+
+Строки таблиц products и orders превращаются в эти объекты фабриками
+строк (product_factory, order_factory) прямо при чтении курсора, поэтому
+вызывающий код обращается к полям по имени, а JSON со списком валют
+разбирается один раз. Классы используют __slots__: у записей нет
+__dict__, что экономит память в кэше каталога.
+"""
+
+import json
+import sqlite3
+from typing import Any, List, Optional, Tuple
+
+
+class Product:
+    """Товар каталога"""
+
+    __slots__ = ("id", "name", "description", "price_rub", "image_url", "currencies", "category_id")
+
+    def __init__(self, id: int, name: str, description: Optional[str], price_rub: float,
+                 image_url: Optional[str], currencies: List[str], category_id: Optional[int] = None):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.price_rub = price_rub
+        self.image_url = image_url
+        self.currencies = currencies
+        self.category_id = category_id
+
+    def with_currencies(self, currencies: List[str]) -> "Product":
+        """Копия товара с другим списком валют"""
+        return Product(self.id, self.name, self.description, self.price_rub, self.image_url, currencies,
+                       self.category_id)
+
+    def __repr__(self) -> str:
+        return f"Product(id={self.id}, name={self.name!r}, price_rub={self.price_rub})"
+
+
+class Order:
+    """Заказ"""
+
+    __slots__ = ("id", "user_id", "product_id", "invoice_id", "currency", "amount", "status", "created_at")
+
+    def __init__(self, id: int, user_id: int, product_id: int, invoice_id: Optional[int], currency: str,
+                 amount: float, status: str, created_at: Any):
+        self.id = id
+        self.user_id = user_id
+        self.product_id = product_id
+        self.invoice_id = invoice_id
+        self.currency = currency
+        self.amount = amount
+        self.status = status
+        self.created_at = created_at
+
+    def __repr__(self) -> str:
+        return f"Order(id={self.id}, invoice_id={self.invoice_id}, status={self.status!r})"
+
+
+def product_factory(cursor: sqlite3.Cursor, row: Tuple) -> Product:
+    """Фабрика строк для SELECT * FROM products"""
+    product_id, name, description, price_rub, image_url, currencies, category_id = row
+    return Product(product_id, name, description, price_rub, image_url,
+                   json.loads(currencies) if currencies else [], category_id)
+
+
+def order_factory(cursor: sqlite3.Cursor, row: Tuple) -> Order:
+    """Фабрика строк для SELECT * FROM orders"""
+    return Order(*row)
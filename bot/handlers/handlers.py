@@ -1,22 +1,37 @@
+import html
 import logging
-import json
 from aiogram import Router, F, Bot
-from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery
+from aiogram.filters import Command, CommandObject
+from aiogram.types import (
+    Message, CallbackQuery, InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+)
 from aiogram.fsm.context import FSMContext
 
-from bot.database import db
-from bot.services import crypto_service
-from bot.keyboards import keyboards
-from bot.utils.product_manager import deliver_digital_product
-from bot.config import TESTNET, SUPPORTED_CURRENCIES, SUPPORT_ENABLED, SUPPORT_WELCOME_MESSAGE
+from bot.database import async_db, catalog
+from bot.services import crypto_service, metrics, payments, price_table, rates_store, search
+from bot.keyboards import keyboards, views
+from bot.utils import latency
+from bot.config import (
+    TESTNET, SUPPORTED_CURRENCIES, SUPPORT_ENABLED, SUPPORT_WELCOME_MESSAGE, RATES_MANUAL_REFRESH_MIN_INTERVAL,
+    SEARCH_INLINE_CACHE_TIME, SUPPORT_ADMIN_IDS
+)
 
 # Инициализируем роутер
 router = Router()
 
 @router.message(Command("start"))
-async def cmd_start(message: Message):
+async def cmd_start(message: Message, command: CommandObject):
     """Обработка команды /start"""
+    # Ссылка из результата inline-поиска: /start product_<ID>
+    product_id = command.args.removeprefix("product_") if command.args else ""
+    # Некорректный ID в ссылке - показываем обычное приветствие
+    if command.args and command.args.startswith("product_") and product_id.isdecimal():
+        product = await catalog.get_product(int(product_id))
+        if product:
+            product_text, reply_markup = views.product_view(product)
+            await message.answer(product_text, reply_markup=reply_markup, parse_mode="Markdown")
+            return
+    
     # Определяем текст с учетом текущей сети
     network_text = "тестовой" if TESTNET else "основной"
     currencies_text = ", ".join(SUPPORTED_CURRENCIES)
@@ -29,17 +44,58 @@ async def cmd_start(message: Message):
         reply_markup=keyboards.main_menu_keyboard()
     )
 
+@router.message(Command("search"))
+async def cmd_search(message: Message, command: CommandObject):
+    """Обработка команды /search для поиска товаров"""
+    if not command.args:
+        await message.answer("🔎 Укажите запрос, например: /search курс")
+        return
+    
+    products = await search.search(command.args)
+    if not products:
+        await message.answer("Ничего не найдено")
+        return
+    
+    prices = [search.format_prices(product) for product in products]
+    await message.answer(
+        f"🔎 Результаты поиска по запросу «{command.args}»:",
+        reply_markup=keyboards.search_results_keyboard(products, prices)
+    )
+
+@router.inline_query()
+async def inline_search(inline_query: InlineQuery):
+    """Поиск товаров в inline-режиме"""
+    products = await search.search(inline_query.query)
+    bot_username = crypto_service.get_bot_username()
+    
+    results = []
+    for product in products:
+        prices = search.format_prices(product)
+        results.append(InlineQueryResultArticle(
+            id=str(product.id),
+            title=product.name,
+            description=prices,
+            input_message_content=InputTextMessageContent(message_text=f"📦 {product.name}\n💰 {prices}"),
+            reply_markup=keyboards.open_product_keyboard(bot_username, product.id) if bot_username else None,
+        ))
+    
+    # Результаты одинаковы для всех пользователей, поэтому Telegram может их кэшировать
+    await inline_query.answer(results, cache_time=SEARCH_INLINE_CACHE_TIME, is_personal=False)
+
 @router.message(Command("update_rates"))
 async def cmd_update_rates(message: Message):
     """Обработка команды /update_rates для обновления курсов валют"""
     # Проверяем, является ли пользователь администратором (можно добавить проверку ID)
     try:
         await message.answer("🔄 Обновление курсов валют...")
-        await crypto_service.initialize_exchange_rates()
+        # Слишком частые запросы обслуживаются из кэша, параллельные - одним обновлением
+        await crypto_service.refresh_exchange_rates(max_age=RATES_MANUAL_REFRESH_MIN_INTERVAL)
+        await rates_store.publish()
         
         # Получаем текущие курсы для отображения
         usd_rate = crypto_service._usd_rate_cache
         crypto_rates = crypto_service._crypto_prices_cache
+        rates_age = crypto_service.get_rates_age()
         
         rates_info = f"✅ Курсы валют обновлены:\n\n"
         rates_info += f"💵 USD/RUB: {1/usd_rate:.2f} ₽\n\n"
@@ -47,11 +103,46 @@ async def cmd_update_rates(message: Message):
         for currency, price in crypto_rates.items():
             rates_info += f"💰 {currency}/USD: ${price:.2f}\n"
         
+        if rates_age != float("inf"):
+            rates_info += f"\n🕒 Возраст данных: {int(rates_age)} сек."
+        
         await message.answer(rates_info)
     except Exception as e:
         logging.error(f"Error updating rates: {e}")
         await message.answer("❌ Ошибка при обновлении курсов валют")
 
+@router.message(Command("perf"))
+async def cmd_perf(message: Message, command: CommandObject):
+    """Отчет о задержках обработчиков, БД и внешних API (только для администраторов); /perf reset - сбросить"""
+    if message.from_user.id not in SUPPORT_ADMIN_IDS:
+        return
+    
+    if command.args == "reset":
+        latency.reset()
+        await message.answer("🧹 Замеры задержек сброшены")
+        return
+    
+    histograms = latency.get_histograms()
+    if not histograms:
+        await message.answer("📊 Замеров пока нет")
+        return
+    
+    # Время в миллисекундах
+    lines = [f"{'':<36}{'count':>8}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}"]
+    for name, histogram in histograms:
+        summary = histogram.summary()
+        lines.append(f"{name:<36}{summary['count']:>8}" + "".join(
+            f"{summary[key] * 1000:>8.1f}" for key in ("p50", "p95", "p99", "max")
+        ))
+    
+    # Сообщение Telegram ограничено 4096 символами
+    text = ""
+    for line in lines:
+        if len(text) + len(line) + 12 > 4096:
+            break
+        text += html.escape(line) + "\n"
+    await message.answer(f"<pre>{text}</pre>", parse_mode="HTML")
+
 @router.message(Command("test_invoice"))
 async def cmd_test_invoice(message: Message, bot: Bot):
     """Тестовая команда для создания счета напрямую"""
@@ -60,10 +151,9 @@ async def cmd_test_invoice(message: Message, bot: Bot):
         currency = SUPPORTED_CURRENCIES[0]
         amount = str(crypto_service.MIN_AMOUNTS.get(currency, 1.0))
         
-        # Получаем имя бота для отладки
-        bot_info = await bot.get_me()
-        bot_username = bot_info.username
-        callback_url = f"https://t.me/{bot_username}"
+        # Имя бота берется из кэша, getMe выполняется только если его там нет
+        await crypto_service.ensure_bot_username(bot)
+        callback_url = crypto_service.get_callback_url()
         
         await message.answer(
             f"Создаю тестовый счет:\n"
@@ -74,7 +164,7 @@ async def cmd_test_invoice(message: Message, bot: Bot):
         )
         
         # Создаем счет напрямую через API
-        invoice_data = crypto_service.create_invoice(
+        invoice_data = await crypto_service.create_invoice(
             currency,
             amount,
             "Тестовый счет",
@@ -112,15 +202,32 @@ async def cmd_test_invoice(message: Message, bot: Bot):
 @router.callback_query(F.data == "catalog")
 async def show_catalog(callback_query: CallbackQuery):
     """Показать каталог товаров"""
-    products = db.get_products()
+    text, reply_markup = await views.catalog_view()
     
-    if not products:
-        await callback_query.message.edit_text("Каталог пуст")
+    if reply_markup is None:
+        await callback_query.message.edit_text(text)
         return
     
     await callback_query.message.edit_text(
-        "🛍 **Каталог товаров:**\n\nВыберите товар для покупки:",
-        reply_markup=keyboards.catalog_keyboard(products),
+        text,
+        reply_markup=reply_markup,
+        parse_mode="Markdown"
+    )
+
+@router.callback_query(F.data.startswith("page_"))
+async def show_catalog_page(callback_query: CallbackQuery):
+    """Показать страницу каталога"""
+    # page_<категория>_<n|p>_<ID крайнего товара>
+    _, category_id, direction, cursor = callback_query.data.split("_")
+    text, reply_markup = await views.catalog_page_view(int(category_id), direction, int(cursor))
+    
+    if reply_markup is None:
+        await callback_query.message.edit_text(text)
+        return
+    
+    await callback_query.message.edit_text(
+        text,
+        reply_markup=reply_markup,
         parse_mode="Markdown"
     )
 
@@ -128,41 +235,16 @@ async def show_catalog(callback_query: CallbackQuery):
 async def show_product(callback_query: CallbackQuery):
     """Показать детали товара"""
     product_id = int(callback_query.data.split("_")[1])
-    product = db.get_product_by_id(product_id)
+    product = await catalog.get_product(product_id)
     
     if not product:
         await callback_query.answer("Товар не найден")
         return
     
-    # Получаем цены в USD и криптовалюте для отображения
-    usd_rate = crypto_service._usd_rate_cache
-    price_usd = product[3] * usd_rate  # price_rub * usd_rate
-    
-    # Парсим доступные валюты
-    available_currencies_raw = json.loads(product[5]) if product[5] else []
-    
-    # Фильтруем валюты, чтобы показывать только те, которые поддерживаются в текущей сети
-    available_currencies = [c for c in available_currencies_raw if c in SUPPORTED_CURRENCIES]
-    
-    if not available_currencies:
-        # Если нет доступных валют, используем все поддерживаемые
-        available_currencies = SUPPORTED_CURRENCIES
-    
-    # Создаем текст с ценами
-    price_text = f"💰 Цена: {product[3]} ₽ ({price_usd:.2f} USD)\n\n"
-    for currency in available_currencies:
-        crypto_amount = await crypto_service.calculate_crypto_amount(product[3], currency)
-        price_text += f"• {crypto_amount} {currency}\n"
-    
-    product_text = (
-        f"📦 **{product[1]}**\n\n"
-        f"📝 {product[2]}\n\n"
-        f"{price_text}"
-    )
-    
+    product_text, reply_markup = views.product_view(product)
     await callback_query.message.edit_text(
         product_text,
-        reply_markup=keyboards.product_keyboard(product_id),
+        reply_markup=reply_markup,
         parse_mode="Markdown"
     )
 
@@ -170,29 +252,23 @@ async def show_product(callback_query: CallbackQuery):
 async def select_currency(callback_query: CallbackQuery):
     """Показать выбор валюты для покупки"""
     product_id = int(callback_query.data.split("_")[1])
-    product = db.get_product_by_id(product_id)
+    product = await catalog.get_product(product_id)
     
     if not product:
         await callback_query.answer("Товар не найден")
         return
     
-    # Парсим доступные валюты
-    available_currencies_raw = json.loads(product[5]) if product[5] else []
-    
-    # Фильтруем валюты, чтобы показывать только те, которые поддерживаются в текущей сети
-    available_currencies = [c for c in available_currencies_raw if c in SUPPORTED_CURRENCIES]
-    
-    if not available_currencies:
-        # Если нет доступных валют, используем все поддерживаемые
-        available_currencies = SUPPORTED_CURRENCIES
+    # Валюты в кэше каталога уже отфильтрованы по текущей сети
+    available_currencies = product.currencies
     
     if not available_currencies:
         await callback_query.answer("Нет доступных валют для оплаты")
         return
     
+    text, reply_markup = views.currency_selection_view(product)
     await callback_query.message.edit_text(
-        f"🔄 Выберите криптовалюту для оплаты товара **{product[1]}**:",
-        reply_markup=keyboards.currency_selection_keyboard(product_id, available_currencies),
+        text,
+        reply_markup=reply_markup,
         parse_mode="Markdown"
     )
 
@@ -208,7 +284,7 @@ async def process_purchase(callback_query: CallbackQuery, bot: Bot):
         await callback_query.answer(f"Валюта {selected_currency} не поддерживается в текущей сети")
         return
     
-    product = db.get_product_by_id(product_id)
+    product = await catalog.get_product(product_id)
     user_id = callback_query.from_user.id
     
     if not product:
@@ -216,9 +292,14 @@ async def process_purchase(callback_query: CallbackQuery, bot: Bot):
         return
     
     try:
-        # Calculate crypto amount
-        crypto_amount = await crypto_service.calculate_crypto_amount(product[3], selected_currency)
-        logging.info(f"Calculated amount: {crypto_amount} {selected_currency} for {product[3]} RUB")
+        # Если курсы валюты счета сильно устарели, дожидаемся обновления перед выставлением счета
+        await crypto_service.ensure_fresh_rates(currencies=[selected_currency])
+        
+        # Берем сумму из таблицы цен (пересчитывается при смене курсов)
+        crypto_amount = price_table.get_amount(product_id, product.price_rub, selected_currency)
+        if crypto_amount is None:
+            crypto_amount = await crypto_service.calculate_crypto_amount(product.price_rub, selected_currency)
+        logging.info(f"Calculated amount: {crypto_amount} {selected_currency} for {product.price_rub} RUB")
         
         # Проверяем минимальную сумму
         min_amount = crypto_service.MIN_AMOUNTS.get(selected_currency, 0)
@@ -227,22 +308,21 @@ async def process_purchase(callback_query: CallbackQuery, bot: Bot):
             logging.info(f"Adjusted to minimum amount: {crypto_amount} {selected_currency}")
         
         # Create order in DB
-        order_id = db.create_order(user_id, product_id, selected_currency, crypto_amount)
+        order_id = await async_db.create_order(user_id, product_id, selected_currency, crypto_amount)
+        metrics.ORDERS_CREATED.inc(selected_currency)
         logging.info(f"Created order ID: {order_id}")
         
-        # Получаем имя пользователя бота для callback URL
-        bot_info = await bot.get_me()
-        bot_username = bot_info.username
-        await crypto_service.set_bot_username(bot_username)
+        # Имя бота для callback URL берется из кэша, заполненного при запуске
+        await crypto_service.ensure_bot_username(bot)
         
         # Формируем payload
         payload = f"order_{order_id}"
         
         # Create invoice in Crypto Pay
-        invoice_data = crypto_service.create_invoice(
+        invoice_data = await crypto_service.create_invoice(
             selected_currency,
             str(crypto_amount),
-            f"Покупка: {product[1]}",
+            f"Покупка: {product.name}",
             payload
         )
         
@@ -252,17 +332,17 @@ async def process_purchase(callback_query: CallbackQuery, bot: Bot):
             pay_url = invoice['pay_url']
             
             # Update order with invoice ID
-            db.update_order_invoice(order_id, invoice_id)
+            await async_db.update_order_invoice(order_id, invoice_id)
             
             # Show payment info
             usd_rate = crypto_service._usd_rate_cache
-            price_usd = product[3] * usd_rate
+            price_usd = product.price_rub * usd_rate
             
             await callback_query.message.edit_text(
                 f"💳 **Счет создан!**\n\n"
-                f"📦 Товар: {product[1]}\n"
+                f"📦 Товар: {product.name}\n"
                 f"💰 К оплате: {crypto_amount} {selected_currency}\n"
-                f"💵 Эквивалент: {product[3]} ₽ / {price_usd:.2f} USD\n"
+                f"💵 Эквивалент: {product.price_rub} ₽ / {price_usd:.2f} USD\n"
                 f"🆔 Счет: `{invoice_id}`\n\n"
                 f"Нажмите кнопку \"Оплатить\" для перехода к оплате.\n"
                 f"После оплаты используйте \"Проверить оплату\".",
@@ -311,19 +391,28 @@ async def check_payment(callback_query: CallbackQuery, bot: Bot):
     logging.info(f"Checking payment for invoice_id: {invoice_id}")
     
     try:
-        # Проверяем статус счета
-        invoice_data = crypto_service.check_invoice(invoice_id)
-        logging.info(f"Invoice data: {invoice_data}")
+        # Заказ мог быть уже подтвержден фоновой проверкой - тогда API не нужен;
+        # доставка идет через очередь и может быть еще не выполнена
+        order = await async_db.get_order_by_invoice_id(int(invoice_id))
+        if order and order.status == "paid":
+            await callback_query.message.edit_text(
+                "✅ **Оплата успешно получена!**\n\n"
+                "📦 Ваш товар будет доставлен в ближайшее время.\n"
+                "Спасибо за покупку! 🎉",
+                reply_markup=keyboards.back_to_catalog_keyboard(),
+                parse_mode="Markdown"
+            )
+            return
+        
+        # Проверяем статус счета; оплаченный счет тут же подтверждается и ставится
+        # в очередь доставки. Повторные нажатия используют тот же запрос к API
+        invoice_data = await payments.check_invoice(int(invoice_id))
         
         if invoice_data.get('ok') and invoice_data['result']['items']:
             invoice = invoice_data['result']['items'][0]
             logging.info(f"Invoice status: {invoice['status']}, payload: {invoice['payload']}")
             
             if invoice['status'] == 'paid':
-                # Обновляем статус заказа
-                db.update_order_status(int(invoice_id), "paid")
-                logging.info(f"Updated order status to paid for invoice_id: {invoice_id}")
-                
                 await callback_query.message.edit_text(
                     "✅ **Оплата успешно получена!**\n\n"
                     "📦 Ваш товар будет доставлен в ближайшее время.\n"
@@ -332,9 +421,6 @@ async def check_payment(callback_query: CallbackQuery, bot: Bot):
                     parse_mode="Markdown"
                 )
                 
-                # Доставляем цифровой товар
-                await deliver_digital_product(bot, callback_query.from_user.id, invoice['payload'])
-                
             else:
                 await callback_query.answer("⏳ Платеж еще не поступил")
         else:
@@ -349,7 +435,7 @@ async def check_payment(callback_query: CallbackQuery, bot: Bot):
 async def show_balance(callback_query: CallbackQuery):
     """Показать баланс аккаунта Crypto Pay"""
     try:
-        balance_data = crypto_service.get_balance()
+        balance_data = await crypto_service.get_balance()
         
         if balance_data.get('ok'):
             balances = balance_data['result']
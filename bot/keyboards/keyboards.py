@@ -1,6 +1,8 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+
+from bot.database.models import Product
 
 def main_menu_keyboard() -> InlineKeyboardMarkup:
     """Generate the main menu keyboard"""
@@ -10,18 +12,55 @@ def main_menu_keyboard() -> InlineKeyboardMarkup:
     ])
     return keyboard
 
-def catalog_keyboard(products: List[tuple]) -> InlineKeyboardMarkup:
-    """Generate the catalog keyboard with products"""
+def catalog_keyboard(products: List[Product], category_id: int = 0, has_prev: bool = False,
+                     has_next: bool = False, back_callback: str = "back_to_main") -> InlineKeyboardMarkup:
+    """Generate the catalog page keyboard with products and page navigation"""
     buttons = [
         [InlineKeyboardButton(
-            text=f"{product[1]} - {product[3]} ₽", 
-            callback_data=f"product_{product[0]}"
+            text=f"{product.name} - {product.price_rub} ₽", 
+            callback_data=f"product_{product.id}"
         )] for product in products
     ]
+    # Курсор страницы - ID крайнего товара, поэтому кнопки не зависят от размера каталога
+    navigation = []
+    if has_prev and products:
+        navigation.append(InlineKeyboardButton(text="⬅️", callback_data=f"page_{category_id}_p_{products[0].id}"))
+    if has_next and products:
+        navigation.append(InlineKeyboardButton(text="➡️", callback_data=f"page_{category_id}_n_{products[-1].id}"))
+    if navigation:
+        buttons.append(navigation)
+    buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data=back_callback)])
+    
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+def categories_keyboard(categories: List[Tuple[int, str]]) -> InlineKeyboardMarkup:
+    """Generate the catalog categories keyboard"""
+    buttons = [
+        [InlineKeyboardButton(text=name, callback_data=f"page_{category_id}_n_0")]
+        for category_id, name in categories
+    ]
+    buttons.append([InlineKeyboardButton(text="📋 Все товары", callback_data="page_0_n_0")])
     buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_main")])
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+def search_results_keyboard(products: List[Product], prices: List[str]) -> InlineKeyboardMarkup:
+    """Generate the search results keyboard"""
+    buttons = [
+        [InlineKeyboardButton(text=f"{product.name} - {price}", callback_data=f"product_{product.id}")]
+        for product, price in zip(products, prices)
+    ]
+    buttons.append([InlineKeyboardButton(text="🛍 К каталогу", callback_data="catalog")])
+    
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+def open_product_keyboard(bot_username: str, product_id: int) -> InlineKeyboardMarkup:
+    """Generate keyboard with a deep link opening the product in the bot"""
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🛍 Открыть в боте", url=f"https://t.me/{bot_username}?start=product_{product_id}")]
+    ])
+    return keyboard
+
 def product_keyboard(product_id: int) -> InlineKeyboardMarkup:
     """Generate the product details keyboard"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -30,11 +69,13 @@ def product_keyboard(product_id: int) -> InlineKeyboardMarkup:
     ])
     return keyboard
 
-def currency_selection_keyboard(product_id: int, available_currencies: List[str]) -> InlineKeyboardMarkup:
+def currency_selection_keyboard(product_id: int, available_currencies: List[str],
+                                amounts: Optional[Dict[str, float]] = None) -> InlineKeyboardMarkup:
     """Generate keyboard for selecting cryptocurrency"""
+    amounts = amounts or {}
     buttons = [
         [InlineKeyboardButton(
-            text=f"{currency}", 
+            text=f"{currency} - {amounts[currency]}" if currency in amounts else f"{currency}", 
             callback_data=f"currency_{product_id}_{currency}"
         )] for currency in available_currencies
     ]
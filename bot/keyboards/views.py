@@ -0,0 +1,121 @@
+"""
+Закэшированные экраны каталога
+
+Текст и клавиатура экранов каталога, его страниц, карточки товара и
+выбора валюты полностью определяются версией каталога и версией курсов,
+поэтому собираются один раз и хранятся в RenderCache с ключом
+(экран, товар или страница, версия каталога, версия курсов). После
+изменения товаров или обновления курсов ключ меняется, а старые записи
+вытесняются по LRU.
+"""
+
+from typing import Optional, Tuple
+
+from aiogram.types import InlineKeyboardMarkup
+
+from bot.config import CATALOG_PAGE_SIZE, RENDER_CACHE_SIZE
+from bot.database import async_db, catalog
+from bot.database.models import Product
+from bot.keyboards import keyboards
+from bot.services import crypto_service, price_table
+from bot.utils.render_cache import RenderCache
+
+View = Tuple[str, Optional[InlineKeyboardMarkup]]
+
+render_cache = RenderCache(RENDER_CACHE_SIZE)
+
+
+async def _render_catalog_page(category_id: int, direction: str, cursor: int) -> View:
+    filter_id = category_id or None
+    if direction == "p":
+        products, has_prev = await async_db.get_products_page(filter_id, before_id=cursor, limit=CATALOG_PAGE_SIZE)
+        has_next = True
+        if not has_prev:
+            # Дошли до начала: показываем полную первую страницу
+            direction, cursor = "n", 0
+    if direction != "p":
+        products, has_next = await async_db.get_products_page(filter_id, after_id=cursor, limit=CATALOG_PAGE_SIZE)
+        has_prev = cursor > 0
+
+    if not products:
+        return "Каталог пуст", None
+
+    # Без категорий первая страница и есть экран каталога
+    has_categories = bool(category_id) or bool(await async_db.get_categories())
+    back_callback = "catalog" if has_categories else "back_to_main"
+    return (
+        "🛍 **Каталог товаров:**\n\nВыберите товар для покупки:",
+        keyboards.catalog_keyboard(products, category_id, has_prev, has_next, back_callback),
+    )
+
+
+def _render_product(product: Product) -> View:
+    # Получаем цены в USD и криптовалюте для отображения
+    usd_rate = crypto_service._usd_rate_cache
+    price_usd = product.price_rub * usd_rate  # price_rub * usd_rate
+
+    # Создаем текст с ценами
+    price_text = f"💰 Цена: {product.price_rub} ₽ ({price_usd:.2f} USD)\n\n"
+    crypto_amounts = price_table.get_amounts(product.id, product.price_rub, product.currencies)
+    for currency, crypto_amount in crypto_amounts.items():
+        price_text += f"• {crypto_amount} {currency}\n"
+
+    product_text = (
+        f"📦 **{product.name}**\n\n"
+        f"📝 {product.description}\n\n"
+        f"{price_text}"
+    )
+    return product_text, keyboards.product_keyboard(product.id)
+
+
+def _render_currency_selection(product: Product) -> View:
+    crypto_amounts = price_table.get_amounts(product.id, product.price_rub, product.currencies)
+    return (
+        f"🔄 Выберите криптовалюту для оплаты товара **{product.name}**:",
+        keyboards.currency_selection_keyboard(product.id, product.currencies, crypto_amounts),
+    )
+
+
+async def catalog_view() -> View:
+    """Первый экран каталога: список категорий или первая страница товаров"""
+    version = await catalog.get_db_version()
+    key = ("catalog", None, version, None)
+    view = render_cache.get(key)
+    if view is None:
+        categories = await async_db.get_categories()
+        if categories:
+            view = ("🛍 **Каталог товаров:**\n\nВыберите категорию:", keyboards.categories_keyboard(categories))
+        else:
+            view = await _render_catalog_page(0, "n", 0)
+        render_cache.put(key, view)
+    return view
+
+
+async def catalog_page_view(category_id: int, direction: str, cursor: int) -> View:
+    """
+    Страница каталога
+
+    category_id=0 - все товары; direction "n" - товары после cursor,
+    "p" - товары перед cursor. Страница читается из базы одним запросом
+    по индексу, поэтому ее стоимость не зависит от размера каталога.
+    """
+    version = await catalog.get_db_version()
+    # Каталог не зависит от курсов
+    key = ("page", category_id, (direction, cursor), version, None)
+    view = render_cache.get(key)
+    if view is None:
+        view = await _render_catalog_page(category_id, direction, cursor)
+        render_cache.put(key, view)
+    return view
+
+
+def product_view(product: Product) -> View:
+    """Карточка товара с ценами в рублях, USD и криптовалютах"""
+    key = ("product", product.id, catalog.get_version(), crypto_service.get_rates_version())
+    return render_cache.get_or_render(key, _render_product, product)
+
+
+def currency_selection_view(product: Product) -> View:
+    """Выбор валюты для оплаты товара"""
+    key = ("currency", product.id, catalog.get_version(), crypto_service.get_rates_version())
+    return render_cache.get_or_render(key, _render_currency_selection, product)
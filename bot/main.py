@@ -1,44 +1,218 @@
 import asyncio
 import logging
+import multiprocessing
+import secrets
+import signal
+import time
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import web
 
-from bot.config import TELEGRAM_BOT_TOKEN
-from bot.database import db
+from bot.config import (
+    TELEGRAM_BOT_TOKEN, TELEGRAM_API_URL, INVOICE_POLL_ENABLED, CRYPTO_PAY_WEBHOOK_ENABLED, TELEGRAM_RUN_MODE,
+    TELEGRAM_WEBHOOK_BASE_URL, TELEGRAM_WEBHOOK_PATH, TELEGRAM_WEBHOOK_SECRET, TELEGRAM_WEBHOOK_HOST,
+    TELEGRAM_WEBHOOK_PORT, TELEGRAM_WEBHOOK_MAX_CONNECTIONS, WORKER_PROCESSES, WORKER_QUEUE_SIZE, WORKER_CONCURRENCY,
+    WORKER_STOP_TIMEOUT, METRICS_ENABLED, METRICS_PORT
+)
+from bot.database import async_db, catalog
+from bot.database.fsm_storage import SQLiteStorage
 from bot.handlers.handlers import router
 from bot.handlers.support_handlers import support_router
-from bot.services import crypto_service
+from bot.middlewares import throttling, timing
+from bot.services import (
+    crypto_service, cryptopay_webhook, delivery_queue, http_client, invoice_poller, metrics, price_table,
+    rate_refresher, rates_store, sharding, telegram_webhook
+)
 
 # Настраиваем логирование
 logging.basicConfig(level=logging.INFO)
 
 # Инициализируем бота и диспетчер
-bot = Bot(token=TELEGRAM_BOT_TOKEN)
-dp = Dispatcher()
+bot = Bot(
+    token=TELEGRAM_BOT_TOKEN,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+)
+# Состояния диалогов хранятся в базе и переживают перезапуск
+dp = Dispatcher(storage=SQLiteStorage())
+
+# Замеряем задержки обработчиков и запросов к Bot API (отчет - команда /perf)
+timing.setup(dp, bot, router, support_router)
+
+# Ограничиваем частоту запросов пользователей и сбрасываем нагрузку при перегрузке
+throttling.setup(dp)
 
 # Регистрируем роутеры
 dp.include_router(router)
 dp.include_router(support_router)
 
+# Датчики метрик вычисляются при каждом запросе Prometheus
+async def _delivery_queue_depth():
+    scheduled, due, failed = await async_db.get_delivery_queue_stats(time.time())
+    return {("scheduled",): scheduled, ("due",): due, ("failed",): failed}
+
+metrics.register_gauge("store_exchange_rates_age_seconds", "Age of the oldest cached exchange rate",
+                       crypto_service.get_rates_age)
+metrics.register_gauge("store_delivery_queue_depth", "Undelivered paid orders", _delivery_queue_depth, ("state",))
+metrics.register_gauge("store_fsm_states", "Dialogs with an active FSM state", lambda: dp.storage.active_states)
+
+def _stop_on_signals() -> asyncio.Event:
+    """Событие, которое устанавливается по SIGINT/SIGTERM, как и в start_polling"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+    return stop_event
+
+async def _serve_webhook(app: web.Application, secret_token: str) -> None:
+    """Запустить веб-сервер, зарегистрировать вебхук и работать до сигнала остановки"""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, TELEGRAM_WEBHOOK_HOST, TELEGRAM_WEBHOOK_PORT).start()
+    stop_event = _stop_on_signals()
+    
+    try:
+        await bot.set_webhook(
+            f"{TELEGRAM_WEBHOOK_BASE_URL.rstrip('/')}{TELEGRAM_WEBHOOK_PATH}",
+            secret_token=secret_token,
+            max_connections=TELEGRAM_WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+        logging.info(f"Webhook server listening on {TELEGRAM_WEBHOOK_HOST}:{TELEGRAM_WEBHOOK_PORT}{TELEGRAM_WEBHOOK_PATH}")
+        await stop_event.wait()
+    finally:
+        # Перестаем принимать запросы и дорабатываем уже принятые обновления
+        await runner.cleanup()
+
+async def run_webhook():
+    """Принимать обновления через вебхук до сигнала остановки"""
+    secret_token = TELEGRAM_WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    await _serve_webhook(telegram_webhook.create_app(dp, bot, secret_token=secret_token), secret_token)
+
+def run_worker(index: int, queue) -> None:
+    """Точка входа рабочего процесса в многопроцессном режиме"""
+    # Остановкой управляет основной процесс: он закрывает очереди, а рабочие дорабатывают их
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_worker_main(index, queue))
+
+async def _worker_main(index: int, queue) -> None:
+    await http_client.start()
+    await crypto_service.ensure_bot_username(bot)
+    if METRICS_ENABLED:
+        await metrics.start(port=METRICS_PORT + 1 + index)
+    
+    # Курсы запрашивает основной процесс; если его снимка еще нет, загружаем сами
+    rates_store.enable()
+    if not await rates_store.sync():
+        await crypto_service.initialize_exchange_rates()
+    price_table.load_products(await catalog.get_products())
+    rates_store.start_sync()
+    
+    logging.info(f"Worker {index} started")
+    try:
+        await sharding.run_worker(dp, bot, queue, WORKER_CONCURRENCY)
+    finally:
+        await rates_store.stop_sync()
+        await metrics.stop()
+        await dp.storage.close()
+        await bot.session.close()
+        await http_client.close()
+        async_db.shutdown()
+        logging.info(f"Worker {index} stopped")
+
+async def run_sharded():
+    """Получать обновления и распределять их между WORKER_PROCESSES рабочими процессами"""
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue(WORKER_QUEUE_SIZE) for _ in range(WORKER_PROCESSES)]
+    workers = [
+        context.Process(target=run_worker, args=(index, queue), name=f"bot-worker-{index}")
+        for index, queue in enumerate(queues)
+    ]
+    for worker in workers:
+        worker.start()
+    router = sharding.ShardRouter(queues)
+    
+    try:
+        if TELEGRAM_RUN_MODE == "webhook":
+            secret_token = TELEGRAM_WEBHOOK_SECRET or secrets.token_urlsafe(32)
+            await _serve_webhook(sharding.create_webhook_app(router, secret_token), secret_token)
+        else:
+            stop_event = _stop_on_signals()
+            polling = asyncio.create_task(
+                sharding.poll_updates(bot, router, dp.resolve_used_update_types(), stop_event)
+            )
+            await stop_event.wait()
+            polling.cancel()
+            try:
+                await polling
+            except asyncio.CancelledError:
+                pass
+    finally:
+        # Рабочие процессы дорабатывают свои очереди и завершаются
+        await router.close()
+        loop = asyncio.get_running_loop()
+        for worker in workers:
+            await loop.run_in_executor(None, worker.join, WORKER_STOP_TIMEOUT)
+            if worker.is_alive():
+                logging.warning(f"{worker.name} did not stop in time, terminating")
+                worker.terminate()
+
 async def main():
     # Инициализируем базу данных
-    db.init_db()
+    await async_db.init_db()
     
-    # Получаем и устанавливаем имя бота
-    try:
-        bot_info = await bot.get_me()
-        bot_username = bot_info.username
-        logging.info(f"Bot username: {bot_username}")
-        await crypto_service.set_bot_username(bot_username)
-    except Exception as e:
-        logging.error(f"Failed to get bot username: {e}")
+    # Получаем и кэшируем имя бота (при неудаче повторим при первой покупке)
+    await crypto_service.ensure_bot_username(bot)
+    
+    # Открываем общий пул HTTP-соединений
+    await http_client.start()
     
     # Инициализируем обменные курсы
     logging.info("Initializing exchange rates...")
     await crypto_service.initialize_exchange_rates()
+    price_table.load_products(await catalog.get_products())
+    if WORKER_PROCESSES > 1:
+        # Рабочие процессы берут курсы из общего снимка вместо запросов к API
+        rates_store.enable()
+        await rates_store.publish()
+    rate_refresher.start()
+    
+    # Запускаем доставку оплаченных заказов (в том числе оставшихся с прошлого запуска)
+    delivery_queue.start(bot)
+    
+    # Запускаем фоновую проверку оплаты счетов
+    if INVOICE_POLL_ENABLED:
+        invoice_poller.start()
     
-    # Запускаем поллинг
-    logging.info("Starting bot...")
-    await dp.start_polling(bot)
+    # Принимаем уведомления об оплате от Crypto Pay
+    if CRYPTO_PAY_WEBHOOK_ENABLED:
+        await cryptopay_webhook.start()
+    
+    # Отдаем метрики для Prometheus
+    if METRICS_ENABLED:
+        await metrics.start()
+    
+    # Запускаем получение обновлений
+    logging.info(f"Starting bot in {TELEGRAM_RUN_MODE} mode...")
+    try:
+        if WORKER_PROCESSES > 1:
+            await run_sharded()
+        elif TELEGRAM_RUN_MODE == "webhook":
+            await run_webhook()
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await metrics.stop()
+        await cryptopay_webhook.stop()
+        await invoice_poller.stop()
+        await delivery_queue.stop()
+        await rate_refresher.stop()
+        await http_client.close()
+        await dp.storage.close()
+        async_db.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
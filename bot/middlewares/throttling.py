@@ -0,0 +1,131 @@
+"""
+Ограничение частоты запросов и сброс нагрузки
+
+Для каждого пользователя и маршрута (префикса callback_data, сообщений,
+inline-запросов) ведется корзина токенов: маршрут задает скорость
+пополнения и размер корзины, поэтому короткий всплеск нажатий
+допускается, а устойчивый поток - нет. Кроме того, ограничено число
+одновременно выполняемых обработчиков - всего и для отдельных маршрутов.
+
+Отклоненный колбэк сразу получает callback_query.answer с объяснением,
+сообщения и inline-запросы отбрасываются без ответа, чтобы сброс нагрузки
+сам не тратил запросы к Bot API.
+"""
+
+import logging
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, InlineQuery, TelegramObject
+
+from bot.config import THROTTLE_DEFAULT, THROTTLE_MAX_IN_FLIGHT, THROTTLE_ROUTES
+
+THROTTLED_TEXT = "⏳ Слишком много запросов, подождите немного"
+OVERLOADED_TEXT = "⏳ Бот перегружен, попробуйте через несколько секунд"
+
+# Корзины, не использованные дольше этого времени, удаляются (они уже полные)
+_BUCKET_IDLE_TIMEOUT = 600
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Внешний middleware диспетчера: корзины токенов и лимиты одновременных обработчиков"""
+
+    def __init__(self, routes: Optional[Dict[str, Dict[str, Any]]] = None,
+                 default: Optional[Dict[str, Any]] = None,
+                 max_in_flight: int = THROTTLE_MAX_IN_FLIGHT):
+        self.routes = THROTTLE_ROUTES if routes is None else routes
+        self.default = THROTTLE_DEFAULT if default is None else default
+        self.max_in_flight = max_in_flight
+        # Длинные префиксы проверяются первыми
+        self._prefixes = sorted(self.routes, key=len, reverse=True)
+        # (ID пользователя, маршрут) -> [токены, время последнего пополнения]
+        self._buckets: Dict[Tuple[int, str], List[float]] = {}
+        self._in_flight = 0
+        self._route_in_flight: Counter = Counter()
+        self._pruned_at = time.monotonic()
+        self.rejected: Counter = Counter()
+
+    @property
+    def in_flight(self) -> int:
+        """Число выполняющихся сейчас обработчиков"""
+        return self._in_flight
+
+    def get_route(self, event: TelegramObject) -> str:
+        """Маршрут события: префикс callback_data из настроек, "message" или "inline" """
+        if isinstance(event, CallbackQuery):
+            data = event.data or ""
+            for prefix in self._prefixes:
+                if data.startswith(prefix):
+                    return prefix
+            return "callback"
+        if isinstance(event, InlineQuery):
+            return "inline"
+        return "message"
+
+    def _take_token(self, user_id: int, route: str, limits: Dict[str, Any], now: float) -> bool:
+        rate, burst = limits["rate"], limits["burst"]
+        bucket = self._buckets.get((user_id, route))
+        if bucket is None:
+            self._buckets[(user_id, route)] = [burst - 1, now]
+            return True
+        bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+    def _prune(self, now: float) -> None:
+        if now - self._pruned_at < _BUCKET_IDLE_TIMEOUT:
+            return
+        self._pruned_at = now
+        idle = [key for key, (_, updated_at) in self._buckets.items() if now - updated_at > _BUCKET_IDLE_TIMEOUT]
+        for key in idle:
+            del self._buckets[key]
+
+    async def _reject(self, event: TelegramObject, route: str, reason: str, text: str) -> None:
+        self.rejected[(route, reason)] += 1
+        logging.debug(f"Shedding {route} update: {reason}")
+        if isinstance(event, CallbackQuery):
+            try:
+                await event.answer(text)
+            except Exception as e:
+                logging.debug(f"Failed to answer shed callback: {e}")
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        route = self.get_route(event)
+        limits = self.routes.get(route, self.default)
+        user = data.get("event_from_user")
+        now = time.monotonic()
+        self._prune(now)
+
+        if user is not None and not self._take_token(user.id, route, limits, now):
+            return await self._reject(event, route, "rate", THROTTLED_TEXT)
+
+        route_limit = limits.get("max_in_flight")
+        if self._in_flight >= self.max_in_flight or (route_limit and self._route_in_flight[route] >= route_limit):
+            return await self._reject(event, route, "overload", OVERLOADED_TEXT)
+
+        self._in_flight += 1
+        self._route_in_flight[route] += 1
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight -= 1
+            self._route_in_flight[route] -= 1
+
+
+def setup(dispatcher, middleware: Optional[ThrottlingMiddleware] = None) -> ThrottlingMiddleware:
+    """Подключить middleware к сообщениям, колбэкам и inline-запросам диспетчера"""
+    middleware = middleware or ThrottlingMiddleware()
+    dispatcher.message.outer_middleware(middleware)
+    dispatcher.callback_query.outer_middleware(middleware)
+    dispatcher.inline_query.outer_middleware(middleware)
+    return middleware
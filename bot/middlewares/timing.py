@@ -0,0 +1,70 @@
+"""
+Замер задержек обработки обновлений и запросов к Bot API
+
+TimingMiddleware подключается дважды: внешним middleware к обновлениям
+диспетчера (время обработки всего обновления, включая фильтры и
+ограничение частоты, гистограмма "update.<тип>") и внутренним middleware
+к сообщениям, колбэкам и inline-запросам роутеров (время конкретного
+обработчика, "handler.<имя функции>"). BotApiTimingMiddleware замеряет
+каждый запрос к Bot API ("bot_api.<метод>").
+"""
+
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot, Dispatcher, Router
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, Update
+
+from bot.utils import latency
+
+
+class TimingMiddleware(BaseMiddleware):
+    """Записывает время обработки события в гистограмму обработчика или типа обновления"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.perf_counter() - start
+            if isinstance(event, Update):
+                latency.record(f"update.{event.event_type}", elapsed)
+            else:
+                handler_object = data.get("handler")
+                name = handler_object.callback.__name__ if handler_object else type(event).__name__
+                latency.record(f"handler.{name}", elapsed)
+
+
+class BotApiTimingMiddleware(BaseRequestMiddleware):
+    """Записывает время каждого запроса к Bot API"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            latency.record(f"bot_api.{method.__api_method__}", time.perf_counter() - start)
+
+
+def setup(dispatcher: Dispatcher, bot: Bot, *routers: Router) -> None:
+    """Подключить замеры к диспетчеру, обработчикам роутеров и сессии бота"""
+    middleware = TimingMiddleware()
+    dispatcher.update.outer_middleware(middleware)
+    for router in routers:
+        router.message.middleware(middleware)
+        router.callback_query.middleware(middleware)
+        router.inline_query.middleware(middleware)
+    bot.session.middleware(BotApiTimingMiddleware())
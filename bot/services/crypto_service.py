@@ -1,13 +1,25 @@
-import aiohttp
 import logging
 import time
 from typing import Dict, Any, Optional, List, Tuple
-from crypto_pay_api_sdk import cryptopay
 
-from bot.config import CRYPTO_PAY_TOKEN, TESTNET, EXCHANGE_RATE_API_URL, CRYPTO_PRICE_API_URL, CRYPTO_ID_MAPPING, TELEGRAM_BOT_TOKEN
+from bot.config import (
+    CRYPTO_PAY_TOKEN, TESTNET, EXCHANGE_RATE_API_URL, CRYPTO_PRICE_API_URL, CRYPTO_ID_MAPPING, TELEGRAM_BOT_TOKEN,
+    CRYPTO_PAY_API_URL, CRYPTO_PAY_TIMEOUT, CRYPTO_PAY_CONNECTION_LIMIT, RATES_TTL, RATES_MAX_STALENESS,
+    RATES_RETRY_INTERVAL, INVOICE_POLL_BATCH_SIZE
+)
+from bot.services import http_client, metrics
+from bot.services.cryptopay_client import CryptoPayClient
+from bot.utils import latency
+from bot.utils.singleflight import SingleFlight
 
 # Инициализируем клиент Crypto Pay
-crypto = cryptopay.Crypto(CRYPTO_PAY_TOKEN, testnet=TESTNET)
+crypto = CryptoPayClient(
+    CRYPTO_PAY_TOKEN,
+    testnet=TESTNET,
+    base_url=CRYPTO_PAY_API_URL,
+    timeout=CRYPTO_PAY_TIMEOUT,
+    connection_limit=CRYPTO_PAY_CONNECTION_LIMIT
+)
 
 # Переменная для хранения имени бота
 _bot_username = None
@@ -28,45 +40,187 @@ _usd_rate_cache = 0.01  # Курс USD/RUB (по умолчанию 0.01)
 _crypto_prices_cache = {}  # Кэш для курсов криптовалют
 _cache_initialized = False  # Флаг инициализации кэша
 
+# Время последнего успешного получения каждого курса (ключ "USD" - курс RUB/USD)
+_rates_updated_at: Dict[str, float] = {}
+# Версия снимка курсов, увеличивается после каждого обновления
+_rates_version = 0
+# Время последней попытки обновления (успешной или нет)
+_last_refresh_attempt = 0.0
+
+# Резервные значения для курсов, которые ни разу не удалось получить
+FALLBACK_CRYPTO_PRICES = {
+    'TON': 5.0,
+    'TONCOIN': 5.0,
+    'BTC': 60000.0,
+    'ETH': 3000.0,  # Примерная цена ETH
+    'USDT': 1.0,
+    'USDC': 1.0,
+    'BUSD': 1.0
+}
+
+# Одновременные запросы на обновление курсов (и имени бота) объединяются в один
+_refresh_flight = SingleFlight()
+
 async def set_bot_username(username: str) -> None:
     """Установить имя бота для использования в URL"""
     global _bot_username
     _bot_username = username
     logging.info(f"Bot username set to: {_bot_username}")
 
+def get_bot_username() -> Optional[str]:
+    """Получить закэшированное имя бота (None, если его еще не удалось получить)"""
+    return _bot_username
+
+async def _fetch_bot_username(bot) -> Optional[str]:
+    try:
+        bot_info = await bot.get_me()
+    except Exception as e:
+        logging.error(f"Failed to get bot username: {e}")
+        return None
+    await set_bot_username(bot_info.username)
+    return bot_info.username
+
+async def ensure_bot_username(bot) -> Optional[str]:
+    """
+    Получить имя бота, запросив getMe только если его еще нет в кэше
+
+    Имя заполняется при запуске; повторный запрос выполняется, только если
+    тот завершился неудачей. Одновременные запросы объединяются в один.
+    """
+    if _bot_username:
+        return _bot_username
+    return await _refresh_flight.do("bot_username", _fetch_bot_username, bot)
+
 def get_callback_url() -> str:
     """Получить URL для возврата после оплаты"""
     if _bot_username:
         return f"https://t.me/{_bot_username}"
     return "https://t.me/"  # Резервный URL
 
-async def initialize_exchange_rates():
-    """Инициализация курсов валют при запуске бота"""
-    global _usd_rate_cache, _crypto_prices_cache, _cache_initialized
+def get_rates_version() -> int:
+    """Получить версию текущего снимка курсов"""
+    return _rates_version
+
+def get_rates_age(currencies: Optional[List[str]] = None) -> float:
+    """
+    Получить возраст курсов в секундах
     
+    Возраст считается по самому старому из курса RUB/USD и курсов указанных
+    валют. По умолчанию учитываются курсы, полученные при последнем успешном
+    запросе цен: валюта, которую API перестал возвращать, не делает все
+    курсы устаревшими. Если нужного курса нет, возвращается бесконечность.
+    """
+    if currencies is None:
+        currencies = [key for key in _rates_updated_at if key != "USD"]
+        if not currencies:
+            return float("inf")
+    timestamps = [_rates_updated_at.get(key) for key in ["USD", *currencies]]
+    if any(timestamp is None for timestamp in timestamps):
+        return float("inf")
+    return max(0.0, time.time() - min(timestamps))
+
+def is_rates_stale(max_age: float = RATES_TTL, currencies: Optional[List[str]] = None) -> bool:
+    """Проверить, старше ли курсы указанного возраста"""
+    return get_rates_age(currencies) > max_age
+
+async def _refresh_rates() -> None:
+    """Загрузить все курсы; неудачно загруженные курсы сохраняют прежние значения"""
+    global _usd_rate_cache, _crypto_prices_cache, _cache_initialized, _rates_version, _last_refresh_attempt
+    
+    _last_refresh_attempt = time.time()
+    # Версия меняется, только если получен хотя бы один курс или кэш заполняется впервые
+    updated = not _cache_initialized
     try:
-        # Получаем курс RUB/USD
-        _usd_rate_cache = await get_exchange_rate_rub_to_usd(use_cache=False)
-        
-        # Получаем курсы криптовалют
-        currencies = list(CRYPTO_ID_MAPPING.keys())
-        _crypto_prices_cache = await get_crypto_prices(currencies, use_cache=False)
-        
-        _cache_initialized = True
-        logging.info(f"Exchange rates initialized: USD={_usd_rate_cache}, Crypto={_crypto_prices_cache}")
+        _usd_rate_cache = await _fetch_usd_rate()
+        _rates_updated_at["USD"] = time.time()
+        updated = True
+    except Exception as e:
+        metrics.RATE_REFRESH_ERRORS.inc("exchangerate")
+        logging.error(f"Failed to refresh RUB/USD rate: {e}")
+    
+    currencies = list(CRYPTO_ID_MAPPING.keys())
+    try:
+        prices = await _fetch_crypto_prices(currencies)
+        _crypto_prices_cache.update(prices)
+        now = time.time()
+        for currency in prices:
+            _rates_updated_at[currency] = now
+        # Цены, которые API больше не возвращает, остаются в кэше, но не учитываются в возрасте
+        for currency in [key for key in _rates_updated_at if key != "USD" and key not in prices]:
+            del _rates_updated_at[currency]
+        updated = updated or bool(prices)
     except Exception as e:
-        logging.error(f"Failed to initialize exchange rates: {e}")
-        # Устанавливаем резервные значения
-        _usd_rate_cache = 0.01  # ~100 рублей за доллар
-        _crypto_prices_cache = {
-            'TON': 5.0,
-            'TONCOIN': 5.0,
-            'BTC': 60000.0,
-            'ETH': 3000.0,  # Примерная цена ETH
-            'USDT': 1.0,
-            'USDC': 1.0,
-            'BUSD': 1.0
-        }
+        metrics.RATE_REFRESH_ERRORS.inc("coingecko")
+        logging.error(f"Failed to refresh crypto prices: {e}")
+    
+    if not _cache_initialized:
+        # Устанавливаем резервные значения для курсов, которые не удалось получить
+        for currency, price in FALLBACK_CRYPTO_PRICES.items():
+            _crypto_prices_cache.setdefault(currency, price)
+        _cache_initialized = True
+    
+    if updated:
+        _rates_version += 1
+
+async def refresh_exchange_rates(max_age: float = 0) -> None:
+    """
+    Обновить курсы валют
+    
+    Если все курсы моложе max_age, запрос не выполняется. Одновременные
+    вызовы ожидают одно и то же обновление.
+    """
+    if max_age and not is_rates_stale(max_age):
+        return
+    await _refresh_flight.do("rates", _refresh_rates)
+
+async def ensure_fresh_rates(max_age: float = RATES_MAX_STALENESS, currencies: Optional[List[str]] = None) -> float:
+    """
+    Дождаться обновления курсов, только если они старше max_age
+    
+    currencies - валюты, которые нужны вызывающему (например, валюта
+    счета); по умолчанию - как в get_rates_age. Возвращает возраст этих
+    курсов после проверки. Более свежие данные
+    отдаются из кэша без ожидания, как и любые данные в течение
+    RATES_RETRY_INTERVAL после неудачной попытки обновления.
+    """
+    recently_attempted = time.time() - _last_refresh_attempt < RATES_RETRY_INTERVAL
+    if is_rates_stale(max_age, currencies) and not recently_attempted:
+        await refresh_exchange_rates()
+    return get_rates_age(currencies)
+
+async def initialize_exchange_rates():
+    """Инициализация курсов валют при запуске бота"""
+    await refresh_exchange_rates()
+    logging.info(f"Exchange rates initialized: USD={_usd_rate_cache}, Crypto={_crypto_prices_cache}")
+
+@latency.timed("rates.exchangerate")
+async def _fetch_usd_rate() -> float:
+    """Запросить курс RUB к USD; исключение при неудаче"""
+    session = http_client.get_session()
+    async with session.get(EXCHANGE_RATE_API_URL) as response:
+        if response.status != 200:
+            raise RuntimeError(f"Exchange rate API returned HTTP {response.status}")
+        data = await response.json()
+        return data['rates']['USD']
+
+@latency.timed("rates.coingecko")
+async def _fetch_crypto_prices(currencies: List[str]) -> Dict[str, float]:
+    """Запросить цены криптовалют в USD; возвращает только полученные цены"""
+    crypto_ids = [CRYPTO_ID_MAPPING.get(currency, currency.lower()) for currency in currencies]
+    crypto_ids_str = ','.join(dict.fromkeys(crypto_ids))
+    
+    session = http_client.get_session()
+    async with session.get(f"{CRYPTO_PRICE_API_URL}?ids={crypto_ids_str}&vs_currencies=usd") as response:
+        if response.status != 200:
+            raise RuntimeError(f"Crypto price API returned HTTP {response.status}")
+        data = await response.json()
+    
+    result = {}
+    for currency in currencies:
+        crypto_id = CRYPTO_ID_MAPPING.get(currency, currency.lower())
+        if crypto_id in data and 'usd' in data[crypto_id]:
+            result[currency] = data[crypto_id]['usd']
+    return result
 
 async def get_exchange_rate_rub_to_usd(use_cache=True) -> float:
     """Получить текущий обменный курс RUB к USD"""
@@ -77,83 +231,89 @@ async def get_exchange_rate_rub_to_usd(use_cache=True) -> float:
         return _usd_rate_cache
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(EXCHANGE_RATE_API_URL) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    rate = data['rates']['USD']
-                    # Обновляем кэш
-                    _usd_rate_cache = rate
-                    return rate
-                else:
-                    logging.error(f"Failed to get exchange rate: {response.status}")
-                    return _usd_rate_cache  # Возвращаем кэшированное значение в случае ошибки
+        _usd_rate_cache = await _fetch_usd_rate()
+        _rates_updated_at["USD"] = time.time()
+        return _usd_rate_cache
     except Exception as e:
         logging.error(f"Error getting exchange rate: {e}")
         return _usd_rate_cache  # Возвращаем кэшированное значение в случае ошибки
 
 async def get_crypto_prices(currencies: List[str], use_cache=True) -> Dict[str, float]:
     """Получить текущие цены криптовалют в USD"""
-    global _crypto_prices_cache
-    
     # Возвращаем кэшированные значения, если они доступны и запрошены
     if use_cache and _cache_initialized:
         return {currency: _crypto_prices_cache.get(currency, 1.0) for currency in currencies}
     
-    crypto_ids = [CRYPTO_ID_MAPPING.get(currency, currency.lower()) for currency in currencies]
-    crypto_ids_str = ','.join(crypto_ids)
-    
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{CRYPTO_PRICE_API_URL}?ids={crypto_ids_str}&vs_currencies=usd") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    result = {}
-                    for currency in currencies:
-                        crypto_id = CRYPTO_ID_MAPPING.get(currency, currency.lower())
-                        if crypto_id in data and 'usd' in data[crypto_id]:
-                            result[currency] = data[crypto_id]['usd']
-                        else:
-                            # Используем кэшированное или резервное значение
-                            result[currency] = _crypto_prices_cache.get(currency, 1.0)
-                    
-                    # Обновляем кэш
-                    _crypto_prices_cache.update(result)
-                    return result
-                else:
-                    logging.error(f"Failed to get crypto prices: {response.status}")
-                    return {currency: _crypto_prices_cache.get(currency, 1.0) for currency in currencies}
+        prices = await _fetch_crypto_prices(currencies)
+        _crypto_prices_cache.update(prices)
+        now = time.time()
+        for currency in prices:
+            _rates_updated_at[currency] = now
+        # Цены, которые API больше не возвращает, остаются в кэше, но не учитываются в возрасте
+        for currency in [key for key in _rates_updated_at if key != "USD" and key not in prices]:
+            del _rates_updated_at[currency]
     except Exception as e:
         logging.error(f"Error getting crypto prices: {e}")
-        return {currency: _crypto_prices_cache.get(currency, 1.0) for currency in currencies}
-
-async def calculate_crypto_amount(price_rub: float, currency: str) -> float:
-    """Рассчитать сумму в криптовалюте на основе цены в рублях"""
-    # Используем кэшированные значения курсов
-    usd_rate = _usd_rate_cache
-    price_usd = price_rub * usd_rate
     
-    # Получаем курс криптовалюты из кэша
-    crypto_price_usd = _crypto_prices_cache.get(currency, 1.0)
-    
-    # Рассчитываем сумму в криптовалюте
-    crypto_amount = price_usd / crypto_price_usd
+    # Для недоступных цен используем кэшированное или резервное значение
+    return {currency: _crypto_prices_cache.get(currency, 1.0) for currency in currencies}
+
+def get_amount_decimals(currency: str) -> int:
+    """Получить число десятичных знаков суммы для валюты"""
+    if currency in ['BTC']:
+        return 8  # BTC обычно использует 8 десятичных знаков
+    elif currency in ['TON', 'TONCOIN', 'ETH']:
+        return 6  # TON и ETH обычно используют 6 десятичных знаков
+    else:
+        return 2  # Стейблкоины обычно используют 2 десятичных знака
+
+def get_cached_rates() -> Tuple[float, Dict[str, float], int]:
+    """Получить кэшированные курсы: RUB/USD, цены криптовалют в USD и версию снимка"""
+    return _usd_rate_cache, dict(_crypto_prices_cache), _rates_version
+
+def export_rates() -> Dict[str, Any]:
+    """Снимок кэша курсов для передачи в другой процесс (см. rates_store)"""
+    return {
+        "usd_rate": _usd_rate_cache,
+        "crypto_prices": dict(_crypto_prices_cache),
+        "updated_at": dict(_rates_updated_at),
+    }
+
+def apply_rates(snapshot: Dict[str, Any]) -> None:
+    """Заменить кэш курсов снимком, полученным из другого процесса"""
+    global _usd_rate_cache, _cache_initialized, _rates_version
+    _usd_rate_cache = snapshot["usd_rate"]
+    _crypto_prices_cache.update(snapshot["crypto_prices"])
+    _rates_updated_at.clear()
+    _rates_updated_at.update(snapshot["updated_at"])
+    _cache_initialized = True
+    _rates_version += 1
+
+def convert_rub_amount(price_rub: float, currency: str, usd_rate: float, crypto_price_usd: float) -> float:
+    """Перевести цену в рублях в сумму криптовалюты по заданным курсам"""
+    crypto_amount = price_rub * usd_rate / crypto_price_usd
     
     # Проверяем, что сумма не меньше минимальной
     min_amount = MIN_AMOUNTS.get(currency, 0)
     if crypto_amount < min_amount:
-        logging.warning(f"Calculated amount {crypto_amount} {currency} is less than minimum {min_amount}. Using minimum amount.")
         crypto_amount = min_amount
     
     # Форматируем с нужной точностью
-    if currency in ['BTC']:
-        return round(crypto_amount, 8)  # BTC обычно использует 8 десятичных знаков
-    elif currency in ['TON', 'TONCOIN', 'ETH']:
-        return round(crypto_amount, 6)  # TON и ETH обычно используют 6 десятичных знаков
-    else:
-        return round(crypto_amount, 2)  # Стейблкоины обычно используют 2 десятичных знака
+    return round(crypto_amount, get_amount_decimals(currency))
 
-def create_invoice(currency: str, amount: str, description: str, payload: str) -> Dict[str, Any]:
+async def calculate_crypto_amount(price_rub: float, currency: str) -> float:
+    """Рассчитать сумму в криптовалюте на основе цены в рублях"""
+    # Используем кэшированные значения курсов
+    crypto_price_usd = _crypto_prices_cache.get(currency, 1.0)
+    
+    min_amount = MIN_AMOUNTS.get(currency, 0)
+    if price_rub * _usd_rate_cache / crypto_price_usd < min_amount:
+        logging.warning(f"Calculated amount for {price_rub} RUB in {currency} is less than minimum {min_amount}. Using minimum amount.")
+    
+    return convert_rub_amount(price_rub, currency, _usd_rate_cache, crypto_price_usd)
+
+async def create_invoice(currency: str, amount: str, description: str, payload: str) -> Dict[str, Any]:
     """Создать счет на оплату с использованием Crypto Pay API"""
     try:
         # Логируем параметры запроса
@@ -164,12 +324,7 @@ def create_invoice(currency: str, amount: str, description: str, payload: str) -
             # Убедимся, что amount - это строка с правильным форматом
             float_amount = float(amount)
             # Округляем до нужного количества знаков в зависимости от валюты
-            if currency == 'BTC':
-                float_amount = round(float_amount, 8)
-            elif currency in ['TON', 'TONCOIN', 'ETH']:
-                float_amount = round(float_amount, 6)
-            else:
-                float_amount = round(float_amount, 2)
+            float_amount = round(float_amount, get_amount_decimals(currency))
             
             # Преобразуем обратно в строку
             amount_str = str(float_amount)
@@ -181,16 +336,14 @@ def create_invoice(currency: str, amount: str, description: str, payload: str) -
         callback_url = get_callback_url()
         
         # Создаем счет
-        invoice_data = crypto.createInvoice(
+        invoice_data = await crypto.create_invoice(
             currency,
             amount_str,
-            params={
-                "description": description,
-                "payload": payload,
-                "paid_btn_name": "callback",
-                "paid_btn_url": callback_url,  # URL для возврата после оплаты
-                "expires_in": 1800  # 30 минут
-            }
+            description=description,
+            payload=payload,
+            paid_btn_name="callback",
+            paid_btn_url=callback_url,  # URL для возврата после оплаты
+            expires_in=1800  # 30 минут
         )
         
         # Логируем ответ API
@@ -204,18 +357,41 @@ def create_invoice(currency: str, amount: str, description: str, payload: str) -
         logging.error(f"Error creating invoice: {e}")
         return {"ok": False, "error": str(e)}
 
-def check_invoice(invoice_id: str) -> Dict[str, Any]:
+async def check_invoice(invoice_id: str) -> Dict[str, Any]:
     """Проверить статус счета по его ID"""
     try:
-        return crypto.getInvoices(params={"invoice_ids": [invoice_id]})
+        return await crypto.get_invoices(invoice_ids=[invoice_id])
     except Exception as e:
         logging.error(f"Error checking invoice: {e}")
         return {"ok": False, "error": str(e)}
 
-def get_balance() -> Dict[str, Any]:
+async def get_invoices_by_ids(invoice_ids: List[int], batch_size: int = INVOICE_POLL_BATCH_SIZE) -> List[Dict[str, Any]]:
+    """
+    Получить счета по списку ID пачками через параметр invoice_ids
+
+    Каждая пачка запрашивается постранично (offset/count), пока не будут
+    получены все ее счета. При ошибке API выбрасывается исключение, чтобы
+    вызывающий код не принял отсутствие ответа за неоплаченные счета.
+    """
+    invoices = []
+    for start in range(0, len(invoice_ids), batch_size):
+        batch = invoice_ids[start:start + batch_size]
+        offset = 0
+        while offset < len(batch):
+            data = await crypto.get_invoices(invoice_ids=batch, offset=offset, count=batch_size)
+            if not data.get('ok'):
+                raise RuntimeError(f"getInvoices failed: {data}")
+            items = data['result']['items']
+            invoices.extend(items)
+            if len(items) < batch_size:
+                break
+            offset += len(items)
+    return invoices
+
+async def get_balance() -> Dict[str, Any]:
     """Получить баланс аккаунта Crypto Pay"""
     try:
-        return crypto.getBalance()
+        return await crypto.get_balance()
     except Exception as e:
         logging.error(f"Error getting balance: {e}")
-        return {"ok": False, "error": str(e)} 
\ No newline at end of file
+        return {"ok": False, "error": str(e)}
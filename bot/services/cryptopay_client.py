@@ -0,0 +1,83 @@
+"""
+Асинхронный клиент Crypto Pay API на aiohttp
+
+Возвращает ответы API в исходном виде ({"ok": ..., "result": ...}),
+как и синхронный crypto_pay_api_sdk, поэтому вызывающий код не зависит
+от способа доставки запроса.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Iterable, Optional
+
+import aiohttp
+
+from bot.services import http_client, metrics
+from bot.utils import latency
+
+MAINNET_API_URL = "https://pay.crypt.bot/api"
+TESTNET_API_URL = "https://testnet-pay.crypt.bot/api"
+
+
+class CryptoPayClient:
+    """
+    Клиент Crypto Pay поверх общей keep-alive сессии http_client
+
+    Число одновременных запросов к Crypto Pay ограничено connection_limit,
+    чтобы всплеск покупок не занимал весь общий пул соединений.
+    """
+
+    def __init__(self, token: str, testnet: bool = False, base_url: Optional[str] = None,
+                 timeout: float = 10.0, connection_limit: int = 20):
+        self.base_url = (base_url or (TESTNET_API_URL if testnet else MAINNET_API_URL)).rstrip("/")
+        self._headers = {"Crypto-Pay-API-Token": str(token)}
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._connection_limit = connection_limit
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._connection_limit)
+        return self._semaphore
+
+    async def request(self, method: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Вызвать метод API и вернуть разобранный JSON-ответ"""
+        session = http_client.get_session()
+        start = time.perf_counter()
+        try:
+            async with self._get_semaphore():
+                async with session.post(
+                    f"{self.base_url}/{method}",
+                    json=params or {},
+                    headers=self._headers,
+                    timeout=self._timeout
+                ) as response:
+                    data = await response.json(content_type=None)
+        except Exception as e:
+            metrics.INVOICE_API_ERRORS.inc(method, type(e).__name__)
+            raise
+        finally:
+            latency.record(f"cryptopay.{method}", time.perf_counter() - start)
+        if response.status != 200:
+            logging.warning(f"Crypto Pay {method} returned HTTP {response.status}: {data}")
+        if not data.get("ok"):
+            # Ошибка API: {"ok": false, "error": {"code": 400, "name": "..."}}
+            error = data.get("error")
+            code = error.get("name") or error.get("code") if isinstance(error, dict) else response.status
+            metrics.INVOICE_API_ERRORS.inc(method, code)
+        return data
+
+    async def create_invoice(self, asset: str, amount: str, **params: Any) -> Dict[str, Any]:
+        """Создать счет (createInvoice)"""
+        return await self.request("createInvoice", {"asset": asset, "amount": amount, **params})
+
+    async def get_invoices(self, invoice_ids: Optional[Iterable[Any]] = None, **params: Any) -> Dict[str, Any]:
+        """Получить счета (getInvoices), в том числе пачкой по списку ID"""
+        if invoice_ids is not None:
+            params["invoice_ids"] = ",".join(str(invoice_id) for invoice_id in invoice_ids)
+        return await self.request("getInvoices", params)
+
+    async def get_balance(self) -> Dict[str, Any]:
+        """Получить баланс приложения (getBalance)"""
+        return await self.request("getBalance")
@@ -0,0 +1,147 @@
+"""
+Прием вебхуков Crypto Pay
+
+Веб-сервер на aiohttp принимает обновления invoice_paid, проверяет
+подпись crypto-pay-api-signature (HMAC-SHA256 тела запроса с ключом
+SHA256(CRYPTO_PAY_TOKEN)) и передает счет в payments, который ставит
+заказ в очередь доставки. Статус заказа меняется только из pending,
+поэтому повторно доставленный вебхук ничего не делает.
+
+Ответ 500 (Crypto Pay повторит доставку) дается только при временной
+ошибке обработки. Подписанное обновление с некорректным телом получает
+400: повтор того же тела ничего не исправит.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+
+from bot.config import (
+    CRYPTO_PAY_TOKEN, CRYPTO_PAY_WEBHOOK_HOST, CRYPTO_PAY_WEBHOOK_PORT, CRYPTO_PAY_WEBHOOK_PATH
+)
+from bot.database import async_db
+from bot.services import payments
+
+SIGNATURE_HEADER = "crypto-pay-api-signature"
+
+_runner: Optional[web.AppRunner] = None
+
+
+def sign_body(body: bytes, token: str = CRYPTO_PAY_TOKEN) -> str:
+    """Вычислить подпись тела запроса так же, как это делает Crypto Pay"""
+    secret = hashlib.sha256(token.encode()).digest()
+    return hmac.new(secret, body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(body: bytes, signature: Optional[str], token: str = CRYPTO_PAY_TOKEN) -> bool:
+    """Проверить подпись обновления"""
+    if not signature:
+        return False
+    return hmac.compare_digest(sign_body(body, token), signature)
+
+
+def _parse_order_id(payload: Any) -> Optional[int]:
+    if isinstance(payload, str) and payload.startswith("order_"):
+        order_id = payload.removeprefix("order_")
+        if order_id.isdecimal():
+            return int(order_id)
+    return None
+
+
+def _parse_invoice(invoice: Any) -> Optional[Dict[str, Any]]:
+    """Счет из обновления invoice_paid с целым invoice_id или None, если тело некорректно"""
+    if not isinstance(invoice, dict) or not isinstance(invoice.get('status'), str):
+        return None
+    invoice_id = invoice.get('invoice_id')
+    if isinstance(invoice_id, str) and invoice_id.isdecimal():
+        invoice_id = int(invoice_id)
+    if not isinstance(invoice_id, int) or isinstance(invoice_id, bool):
+        return None
+    return {**invoice, 'invoice_id': invoice_id}
+
+
+async def handle_invoice_paid(invoice: Dict[str, Any]) -> None:
+    """
+    Подтвердить оплату заказа из payload счета и поставить его в очередь доставки
+
+    invoice - счет, уже проверенный _parse_invoice.
+    """
+    invoice_id = invoice['invoice_id']
+    order_id = _parse_order_id(invoice.get('payload'))
+    if order_id is None:
+        logging.warning(f"Webhook invoice {invoice_id} has no order payload: {invoice.get('payload')}")
+        return
+
+    order = await async_db.get_order_by_id(order_id)
+    if not order:
+        logging.error(f"Webhook invoice {invoice_id} refers to unknown order {order_id}")
+        return
+    if order.invoice_id is None:
+        # Оплата пришла раньше, чем ID счета был сохранен в заказе
+        await async_db.update_order_invoice(order_id, invoice_id)
+    elif order.invoice_id != invoice_id:
+        logging.error(f"Webhook invoice {invoice_id} does not match invoice {order.invoice_id} of order {order_id}")
+        return
+
+    paid = await payments.settle_invoices([invoice])
+    if not paid:
+        logging.info(f"Webhook invoice {invoice_id}: order {order_id} already settled")
+
+
+async def handle(request: web.Request) -> web.Response:
+    """Обработать запрос Crypto Pay"""
+    body = await request.read()
+    if not verify_signature(body, request.headers.get(SIGNATURE_HEADER)):
+        logging.warning("Rejected Crypto Pay webhook with invalid signature")
+        return web.Response(status=401)
+
+    try:
+        update = json.loads(body)
+    except ValueError:
+        update = None
+    if not isinstance(update, dict):
+        logging.warning("Rejected Crypto Pay webhook with a malformed body")
+        return web.Response(status=400)
+
+    if update.get('update_type') == 'invoice_paid':
+        invoice = _parse_invoice(update.get('payload'))
+        if invoice is None:
+            logging.warning(f"Rejected Crypto Pay invoice_paid update with malformed invoice: {update.get('payload')}")
+            return web.Response(status=400)
+        # При ошибке отвечаем 500, чтобы Crypto Pay повторил доставку
+        await handle_invoice_paid(invoice)
+    else:
+        logging.info(f"Ignoring Crypto Pay update of type {update.get('update_type')}")
+    return web.json_response({"ok": True})
+
+
+def setup_routes(app: web.Application, path: str = CRYPTO_PAY_WEBHOOK_PATH) -> None:
+    """Зарегистрировать обработчик вебхуков в приложении aiohttp"""
+    app.router.add_post(path, handle)
+
+
+async def start(host: str = CRYPTO_PAY_WEBHOOK_HOST, port: int = CRYPTO_PAY_WEBHOOK_PORT) -> None:
+    """Запустить веб-сервер для вебхуков Crypto Pay"""
+    global _runner
+    if _runner is not None:
+        return
+    app = web.Application()
+    setup_routes(app)
+    _runner = web.AppRunner(app)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+    logging.info(f"Crypto Pay webhook server listening on {host}:{port}{CRYPTO_PAY_WEBHOOK_PATH}")
+
+
+async def stop() -> None:
+    """Остановить веб-сервер"""
+    global _runner
+    if _runner is None:
+        return
+    await _runner.cleanup()
+    _runner = None
+    logging.info("Crypto Pay webhook server stopped")
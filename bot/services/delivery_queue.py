@@ -0,0 +1,166 @@
+"""
+Очередь доставки оплаченных заказов
+
+Оплата только ставит заказ в таблицу deliveries (в той же транзакции,
+что и смена статуса), а доставкой занимаются фоновые обработчики, не
+больше DELIVERY_WORKERS одновременно. При TelegramRetryAfter, сетевых и
+прочих временных ошибках доставка откладывается с экспоненциальной
+паузой. Ошибки, которые не исправит повтор (пользователь заблокировал
+бота, неверный запрос, нет заказа, товара или файла), и исчерпание
+DELIVERY_MAX_ATTEMPTS прекращают попытки, и пользователь получает
+сообщение с просьбой обратиться в поддержку. После успеха заказ получает
+отметку delivered_at и больше не доставляется. Очередь хранится в базе,
+поэтому недоставленные заказы переживают перезапуск.
+"""
+
+import asyncio
+import logging
+import time
+from typing import List, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter
+)
+
+from bot.config import (
+    DELIVERY_WORKERS, DELIVERY_POLL_INTERVAL, DELIVERY_BATCH_SIZE, DELIVERY_RETRY_BASE_DELAY,
+    DELIVERY_RETRY_MAX_DELAY, DELIVERY_MAX_ATTEMPTS, DELIVERY_DRAIN_TIMEOUT
+)
+from bot.database import async_db
+from bot.services import metrics
+from bot.utils.product_manager import DeliveryError, deliver_digital_product, notify_delivery_failed
+
+_feeder: Optional[asyncio.Task] = None
+_workers: List[asyncio.Task] = []
+_queue: Optional[asyncio.Queue] = None
+_wakeup: Optional[asyncio.Event] = None
+# Заказы, которые уже в очереди обработчиков или доставляются сейчас
+_in_flight: Set[int] = set()
+
+
+def notify() -> None:
+    """Сообщить, что в очереди появились новые доставки"""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+def get_retry_delay(attempts: int, retry_after: float = 0) -> float:
+    """Пауза перед следующей попыткой после attempts неудачных"""
+    delay = min(DELIVERY_RETRY_BASE_DELAY * 2 ** attempts, DELIVERY_RETRY_MAX_DELAY)
+    return max(delay, retry_after)
+
+
+async def _deliver(bot: Bot, delivery: Tuple) -> None:
+    order_id, user_id, attempts = delivery
+    try:
+        await deliver_digital_product(bot, user_id, f"order_{order_id}")
+    except TelegramRetryAfter as e:
+        await _retry_later(bot, delivery, f"RetryAfter {e.retry_after}s", e.retry_after)
+        return
+    except TelegramNetworkError as e:
+        await _retry_later(bot, delivery, f"Network error: {e}")
+        return
+    except (DeliveryError, TelegramForbiddenError, TelegramBadRequest) as e:
+        # Повтор не поможет
+        await _give_up(bot, delivery, attempts + 1, f"{type(e).__name__}: {e}")
+        return
+    except Exception as e:
+        logging.error(f"Error delivering order {order_id}: {e}", exc_info=True)
+        await _retry_later(bot, delivery, f"{type(e).__name__}: {e}")
+        return
+    await async_db.mark_delivered(order_id)
+    metrics.DELIVERIES.inc("delivered")
+    logging.info(f"Order {order_id} delivered")
+
+
+async def _retry_later(bot: Bot, delivery: Tuple, error: str, retry_after: float = 0) -> None:
+    order_id, _, attempts = delivery
+    attempts += 1
+    if attempts >= DELIVERY_MAX_ATTEMPTS:
+        await _give_up(bot, delivery, attempts, error)
+        return
+    metrics.DELIVERIES.inc("retry")
+    delay = get_retry_delay(attempts - 1, retry_after)
+    logging.warning(f"Delivery of order {order_id} failed ({error}), retrying in {delay:.0f}s")
+    await async_db.reschedule_delivery(order_id, time.time() + delay, error)
+
+
+async def _give_up(bot: Bot, delivery: Tuple, attempts: int, error: str) -> None:
+    order_id, user_id, _ = delivery
+    metrics.DELIVERIES.inc("failed")
+    logging.error(f"Giving up delivery of order {order_id} after {attempts} attempts: {error}")
+    await async_db.reschedule_delivery(order_id, None, error)
+    try:
+        await notify_delivery_failed(bot, user_id)
+    except Exception as e:
+        # Например, пользователь заблокировал бота
+        logging.warning(f"Failed to notify user {user_id} about failed delivery of order {order_id}: {e}")
+
+
+async def _work(bot: Bot) -> None:
+    while True:
+        delivery = await _queue.get()
+        try:
+            await _deliver(bot, delivery)
+        except Exception as e:
+            metrics.DELIVERIES.inc("error")
+            logging.error(f"Error delivering order {delivery[0]}: {e}", exc_info=True)
+        finally:
+            _in_flight.discard(delivery[0])
+            _queue.task_done()
+
+
+async def _feed() -> None:
+    while True:
+        # Сбрасываем флаг до чтения, чтобы не пропустить оплату, пришедшую во время чтения
+        _wakeup.clear()
+        try:
+            deliveries = await async_db.get_due_deliveries(time.time(), DELIVERY_BATCH_SIZE)
+        except Exception as e:
+            logging.error(f"Failed to read delivery queue: {e}")
+            deliveries = []
+
+        new = [delivery for delivery in deliveries if delivery[0] not in _in_flight]
+        for delivery in new:
+            _in_flight.add(delivery[0])
+            # Очередь ограничена числом обработчиков, поэтому put ждет свободного
+            await _queue.put(delivery)
+
+        if not new:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=DELIVERY_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+
+def start(bot: Bot) -> None:
+    """Запустить обработчики очереди доставки"""
+    global _feeder, _workers, _queue, _wakeup
+    if _feeder is not None and not _feeder.done():
+        return
+    _queue = asyncio.Queue(maxsize=DELIVERY_WORKERS)
+    _wakeup = asyncio.Event()
+    _in_flight.clear()
+    _workers = [asyncio.create_task(_work(bot)) for _ in range(DELIVERY_WORKERS)]
+    _feeder = asyncio.create_task(_feed())
+    logging.info(f"Delivery queue started with {DELIVERY_WORKERS} workers")
+
+
+async def stop() -> None:
+    """Остановить обработчики; недоставленные заказы останутся в базе"""
+    global _feeder, _workers, _queue, _wakeup
+    if _feeder is None:
+        return
+    _feeder.cancel()
+    # Даем начатым доставкам завершиться, чтобы не отправить товар повторно после перезапуска
+    try:
+        await asyncio.wait_for(_queue.join(), timeout=DELIVERY_DRAIN_TIMEOUT)
+    except asyncio.TimeoutError:
+        logging.warning(f"Delivery queue drain timed out, {len(_in_flight)} deliveries left for the next start")
+    tasks = [_feeder, *_workers]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _feeder, _workers, _queue, _wakeup = None, [], None, None
+    logging.info("Delivery queue stopped")
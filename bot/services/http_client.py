@@ -0,0 +1,61 @@
+"""
+Общий HTTP-клиент процесса
+
+Одна aiohttp-сессия с пулом keep-alive соединений и кэшем DNS
+используется всеми исходящими запросами (курсы валют, Crypto Pay).
+Сессия создается при запуске бота и закрывается при остановке.
+"""
+
+import logging
+from typing import Optional
+
+import aiohttp
+
+from bot.config import (
+    HTTP_TIMEOUT, HTTP_CONNECT_TIMEOUT, HTTP_CONNECTION_LIMIT, HTTP_CONNECTION_LIMIT_PER_HOST,
+    HTTP_KEEPALIVE_TIMEOUT, HTTP_DNS_CACHE_TTL
+)
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def _create_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_CONNECTION_LIMIT,
+        limit_per_host=HTTP_CONNECTION_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        use_dns_cache=True
+    )
+    timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT, sock_connect=HTTP_CONNECT_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+async def start() -> None:
+    """Создать общую сессию (вызывается при запуске бота)"""
+    global _session
+    if _session is None or _session.closed:
+        _session = _create_session()
+        logging.info("HTTP client session started")
+
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    Получить общую сессию
+
+    Если start() еще не вызывался (например, в отдельных скриптах),
+    сессия создается при первом обращении.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = _create_session()
+    return _session
+
+
+async def close() -> None:
+    """Закрыть общую сессию и все соединения пула"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logging.info("HTTP client session closed")
+    _session = None
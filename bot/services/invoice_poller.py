@@ -0,0 +1,61 @@
+"""
+Фоновая проверка оплаты счетов
+
+Раз в INVOICE_POLL_INTERVAL секунд задача берет из таблицы orders все
+ожидающие заказы со счетом, запрашивает их счета пачками по
+INVOICE_POLL_BATCH_SIZE через getInvoices и передает результат в
+payments.settle_invoices. Если ожидающих заказов нет, к API не обращается.
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+from bot.config import INVOICE_POLL_INTERVAL
+from bot.database import async_db
+from bot.services import crypto_service, payments
+
+_task: Optional[asyncio.Task] = None
+
+
+async def poll_once() -> int:
+    """Проверить все ожидающие счета; возвращает число новых оплат"""
+    orders = await async_db.get_pending_orders()
+    if not orders:
+        return 0
+
+    invoice_ids = [order.invoice_id for order in orders]
+    invoices = await crypto_service.get_invoices_by_ids(invoice_ids)
+    paid = await payments.settle_invoices(invoices)
+    return len(paid)
+
+
+async def _run() -> None:
+    while True:
+        try:
+            await poll_once()
+        except Exception as e:
+            logging.error(f"Invoice polling failed: {e}")
+        await asyncio.sleep(INVOICE_POLL_INTERVAL)
+
+
+def start() -> None:
+    """Запустить фоновую проверку счетов"""
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_run())
+        logging.info("Invoice poller started")
+
+
+async def stop() -> None:
+    """Остановить фоновую проверку счетов"""
+    global _task
+    if _task is None:
+        return
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = None
+    logging.info("Invoice poller stopped")
@@ -0,0 +1,173 @@
+"""
+Метрики магазина в формате Prometheus
+
+Счетчики (созданные и оплаченные заказы по валютам, ошибки Crypto Pay
+API по кодам, доставки, ошибки обновления курсов) увеличиваются прямо в
+коде покупки, проверки оплаты, доставки и обновления курсов. Значения
+датчиков (возраст курсов, глубина очереди доставки, число состояний FSM)
+вычисляются функциями, зарегистрированными через register_gauge, в момент
+запроса метрик. Задержки запросов к базе и внешним API берутся из
+гистограмм bot.utils.latency.
+
+Метрики отдает небольшой aiohttp-сервер на METRICS_HOST:METRICS_PORT
+(путь METRICS_PATH). Значения хранятся в памяти процесса: в многопроцессном
+режиме каждый рабочий процесс отдает свои метрики на собственном порту.
+"""
+
+import inspect
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from bot.config import METRICS_HOST, METRICS_PORT, METRICS_PATH
+from bot.utils import latency
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Перцентили задержек, которые выводятся как quantile сводок
+_QUANTILES = (50, 95, 99)
+
+_runner: Optional[web.AppRunner] = None
+_metrics: List[Any] = []
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    """Число в формате Prometheus (бесконечность - +Inf, например возраст еще не загруженных курсов)"""
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[Any, ...]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    """Монотонный счетчик с метками"""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: Dict[Tuple[Any, ...], float] = {}
+        _metrics.append(self)
+
+    def inc(self, *labels: Any, value: float = 1) -> None:
+        labels = tuple(str(label) for label in labels)
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def get(self, *labels: Any) -> float:
+        return self.values.get(tuple(str(label) for label in labels), 0)
+
+    async def collect(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in sorted(self.values.items())]
+
+
+class Gauge:
+    """Датчик, значения которого вычисляет функция при каждом запросе метрик"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, func: Callable[[], Any], labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.func = func
+
+    async def collect(self) -> List[str]:
+        """Функция возвращает число или, для датчика с метками, словарь {метки: значение}"""
+        value = self.func()
+        if inspect.isawaitable(value):
+            value = await value
+        if not self.labelnames:
+            return [f"{self.name} {_format_value(value)}"]
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(item)}"
+                for labels, item in sorted(value.items())]
+
+
+ORDERS_CREATED = Counter("store_orders_created_total", "Orders created", ("currency",))
+ORDERS_PAID = Counter("store_orders_paid_total", "Orders confirmed as paid", ("currency",))
+INVOICE_API_ERRORS = Counter("store_invoice_api_errors_total", "Failed Crypto Pay API calls", ("method", "code"))
+DELIVERIES = Counter("store_deliveries_total", "Delivery attempts by result", ("result",))
+RATE_REFRESH_ERRORS = Counter("store_rate_refresh_errors_total", "Failed exchange rate requests", ("source",))
+
+
+def register_gauge(name: str, documentation: str, func: Callable[[], Any], labelnames: Tuple[str, ...] = ()) -> None:
+    """Зарегистрировать датчик; func может быть синхронной или асинхронной"""
+    _metrics.append(Gauge(name, documentation, func, labelnames))
+
+
+def _latency_lines(name: str, documentation: str, label: str, histograms: List[Tuple[str, Any]]) -> List[str]:
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} summary"]
+    for key, histogram in histograms:
+        summary = histogram.summary()
+        labels = _format_labels((label,), (key,))
+        for percent in _QUANTILES:
+            quantile_labels = _format_labels((label, "quantile"), (key, percent / 100))
+            lines.append(f"{name}{quantile_labels} {_format_value(summary[f'p{percent}'])}")
+        lines.append(f"{name}_sum{labels} {_format_value(histogram.total / 1_000_000)}")
+        lines.append(f"{name}_count{labels} {histogram.count}")
+    return lines
+
+
+async def render() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    lines = []
+    for metric in _metrics:
+        try:
+            samples = await metric.collect()
+        except Exception as e:
+            logging.error(f"Failed to collect metric {metric.name}: {e}")
+            continue
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(samples)
+
+    db_histograms, other_histograms = [], []
+    for name, histogram in latency.get_histograms():
+        if name.startswith("db."):
+            db_histograms.append((name[len("db."):], histogram))
+        else:
+            other_histograms.append((name, histogram))
+    lines.extend(_latency_lines("store_db_query_seconds", "SQLite query latency", "query", db_histograms))
+    lines.extend(_latency_lines(
+        "store_operation_seconds", "Handler, Bot API and external API latency", "operation", other_histograms
+    ))
+    return "\n".join(lines) + "\n"
+
+
+async def handle(request: web.Request) -> web.Response:
+    return web.Response(body=(await render()).encode(), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def start(host: str = METRICS_HOST, port: int = METRICS_PORT) -> None:
+    """Запустить сервер метрик"""
+    global _runner
+    if _runner is not None:
+        return
+    app = web.Application()
+    app.router.add_get(METRICS_PATH, handle)
+    _runner = web.AppRunner(app)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+    logging.info(f"Metrics server listening on {host}:{port}{METRICS_PATH}")
+
+
+async def stop() -> None:
+    """Остановить сервер метрик"""
+    global _runner
+    if _runner is None:
+        return
+    await _runner.cleanup()
+    _runner = None
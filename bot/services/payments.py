@@ -0,0 +1,79 @@
+"""
+Подтверждение оплаты счетов
+
+Общая логика для кнопки "Проверить оплату", фоновой проверки счетов и
+вебхуков Crypto Pay: статусы счетов переносятся в заказы одной
+транзакцией, и в той же транзакции заказы, впервые переведенные из
+pending в paid, ставятся в очередь доставки (delivery_queue). Поэтому
+один заказ не ставится в очередь дважды.
+"""
+
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Tuple
+
+from bot.config import CHECK_PAYMENT_CACHE_TTL
+from bot.database import async_db
+from bot.database.models import Order
+from bot.services import crypto_service, delivery_queue, metrics
+from bot.utils.singleflight import SingleFlight
+
+# Соответствие статусов счета Crypto Pay статусам заказа
+ORDER_STATUS_BY_INVOICE_STATUS = {
+    'paid': 'paid',
+    'expired': 'expired',
+}
+
+# Ответы getInvoices по ID счета для кнопки "Проверить оплату": (время получения, ответ)
+_check_results: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+_check_flight = SingleFlight()
+
+
+async def settle_invoices(invoices: Iterable[Dict[str, Any]]) -> List[Order]:
+    """
+    Обновить заказы по полученным счетам и поставить оплаченные в очередь доставки
+
+    Возвращает заказы, которые были переведены в статус paid этим вызовом.
+    """
+    statuses = {
+        int(invoice['invoice_id']): ORDER_STATUS_BY_INVOICE_STATUS[invoice['status']]
+        for invoice in invoices
+        if invoice.get('status') in ORDER_STATUS_BY_INVOICE_STATUS
+    }
+    if not statuses:
+        return []
+
+    changed = await async_db.settle_pending_orders(statuses)
+    paid = [order for order in changed if order.status == 'paid']
+    for order in paid:
+        metrics.ORDERS_PAID.inc(order.currency)
+    if changed:
+        logging.info(f"Settled {len(changed)} orders, {len(paid)} paid")
+    if paid:
+        delivery_queue.notify()
+    return paid
+
+
+async def _fetch_invoice(invoice_id: int) -> Dict[str, Any]:
+    invoice_data = await crypto_service.check_invoice(str(invoice_id))
+    if invoice_data.get('ok') and invoice_data['result']['items']:
+        await settle_invoices(invoice_data['result']['items'])
+        now = time.monotonic()
+        for cached_id in [i for i, (at, _) in _check_results.items() if now - at >= CHECK_PAYMENT_CACHE_TTL]:
+            del _check_results[cached_id]
+        _check_results[invoice_id] = (now, invoice_data)
+    return invoice_data
+
+
+async def check_invoice(invoice_id: int) -> Dict[str, Any]:
+    """
+    Проверить счет по нажатию "Проверить оплату" и подтвердить оплату
+
+    Одновременные проверки одного счета ждут один запрос к API, а
+    повторные нажатия в течение CHECK_PAYMENT_CACHE_TTL секунд получают
+    его ответ без запроса. Возвращает ответ getInvoices как есть.
+    """
+    cached = _check_results.get(invoice_id)
+    if cached and time.monotonic() - cached[0] < CHECK_PAYMENT_CACHE_TTL:
+        return cached[1]
+    return await _check_flight.do(invoice_id, _fetch_invoice, invoice_id)
@@ -0,0 +1,122 @@
+"""
+Таблица цен товаров в криптовалютах
+
+Суммы для всех пар (товар, валюта) рассчитываются одним проходом по
+каталогу и хранятся в словаре, поэтому карточка товара, выбор валюты и
+создание счета получают сумму за O(1). Таблица пересчитывается целиком
+только при смене версии курсов (crypto_service.get_rates_version), а
+отдельная строка - когда цена товара отличается от сохраненной.
+
+Для больших каталогов (от PRICE_TABLE_NUMPY_THRESHOLD товаров) расчет
+выполняется векторно через NumPy, если он установлен.
+"""
+
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bot.config import SUPPORTED_CURRENCIES, PRICE_TABLE_NUMPY_THRESHOLD
+from bot.database.models import Product
+from bot.services import crypto_service
+
+try:
+    import numpy as np
+except ImportError:  # NumPy не обязателен: без него таблица считается в цикле
+    np = None
+
+# Суммы по ключу (product_id, currency)
+_amounts: Dict[Tuple[int, str], float] = {}
+# Цены товаров в рублях, по которым построена таблица
+_product_prices: Dict[int, float] = {}
+# Версия курсов, по которой построена таблица (-1 - таблица не построена)
+_built_version = -1
+
+
+def _compute_python(prices: List[float], currency: str, usd_rate: float, crypto_price_usd: float) -> List[float]:
+    return [crypto_service.convert_rub_amount(price, currency, usd_rate, crypto_price_usd) for price in prices]
+
+
+def _compute_numpy(prices: "np.ndarray", currency: str, usd_rate: float, crypto_price_usd: float) -> List[float]:
+    amounts = prices * usd_rate / crypto_price_usd
+    amounts = np.maximum(amounts, crypto_service.MIN_AMOUNTS.get(currency, 0))
+    # np.round округляет через умножение на 10**n и расходится со встроенным round
+    # на половинных значениях, поэтому округляем так же, как calculate_crypto_amount
+    decimals = crypto_service.get_amount_decimals(currency)
+    return [round(amount, decimals) for amount in amounts.tolist()]
+
+
+def _build(product_prices: Dict[int, float]) -> None:
+    """Пересчитать всю таблицу по текущим курсам"""
+    global _amounts, _built_version
+
+    usd_rate, crypto_prices, version = crypto_service.get_cached_rates()
+    product_ids = list(product_prices)
+    prices = list(product_prices.values())
+
+    if np is not None and len(prices) >= PRICE_TABLE_NUMPY_THRESHOLD:
+        compute = _compute_numpy
+        prices = np.asarray(prices, dtype=np.float64)
+    else:
+        compute = _compute_python
+
+    amounts: Dict[Tuple[int, str], float] = {}
+    for currency in SUPPORTED_CURRENCIES:
+        column = compute(prices, currency, usd_rate, crypto_prices.get(currency, 1.0))
+        amounts.update(zip(((product_id, currency) for product_id in product_ids), column))
+
+    # Подменяем таблицу целиком, чтобы читатели не видели наполовину пересчитанные суммы
+    _amounts = amounts
+    _built_version = version
+    logging.info(f"Price table rebuilt: {len(product_ids)} products x {len(SUPPORTED_CURRENCIES)} currencies, rates version {version}")
+
+
+def _ensure_current() -> None:
+    if _built_version != crypto_service.get_rates_version():
+        _build(_product_prices)
+
+
+def load_products(products: Iterable[Product]) -> None:
+    """Построить таблицу для переданных товаров (заменяет прежний каталог)"""
+    global _product_prices
+    _product_prices = {product.id: product.price_rub for product in products}
+    _build(_product_prices)
+
+
+def refresh() -> None:
+    """Пересчитать таблицу, если курсы изменились с момента построения"""
+    _ensure_current()
+
+
+def _put_product(product_id: int, price_rub: float) -> None:
+    """Пересчитать строку одного товара по курсам, из которых построена таблица"""
+    usd_rate, crypto_prices, _ = crypto_service.get_cached_rates()
+    _product_prices[product_id] = price_rub
+    for currency in SUPPORTED_CURRENCIES:
+        _amounts[(product_id, currency)] = crypto_service.convert_rub_amount(
+            price_rub, currency, usd_rate, crypto_prices.get(currency, 1.0)
+        )
+
+
+def get_amount(product_id: int, price_rub: float, currency: str) -> Optional[float]:
+    """
+    Получить сумму в криптовалюте для товара
+
+    price_rub - текущая цена товара из базы: если она отличается от цены,
+    по которой построена строка, строка пересчитывается. Для валют вне
+    SUPPORTED_CURRENCIES возвращается None.
+    """
+    _ensure_current()
+    if _product_prices.get(product_id) != price_rub:
+        _put_product(product_id, price_rub)
+    return _amounts.get((product_id, currency))
+
+
+def get_amounts(product_id: int, price_rub: float, currencies: Iterable[str]) -> Dict[str, float]:
+    """Получить суммы товара сразу для нескольких валют"""
+    _ensure_current()
+    if _product_prices.get(product_id) != price_rub:
+        _put_product(product_id, price_rub)
+    return {
+        currency: _amounts[(product_id, currency)]
+        for currency in currencies
+        if (product_id, currency) in _amounts
+    }
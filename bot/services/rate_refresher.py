@@ -0,0 +1,58 @@
+"""
+Фоновое обновление курсов валют
+
+Задача просыпается, когда курсы становятся старше RATES_TTL (со случайной
+добавкой RATES_REFRESH_JITTER), и обновляет их через
+crypto_service.refresh_exchange_rates, поэтому ручное /update_rates и
+фоновое обновление никогда не запрашивают API параллельно.
+"""
+
+import asyncio
+import logging
+import random
+from typing import Optional
+
+from bot.config import RATES_TTL, RATES_REFRESH_JITTER, RATES_RETRY_INTERVAL
+from bot.services import crypto_service, price_table, rates_store
+
+_task: Optional[asyncio.Task] = None
+
+
+async def _run() -> None:
+    while True:
+        age = crypto_service.get_rates_age()
+        if age >= RATES_TTL:
+            try:
+                await crypto_service.refresh_exchange_rates()
+                # Пересчитываем таблицу цен сразу, а не на первом просмотре товара
+                price_table.refresh()
+                await rates_store.publish()
+            except Exception as e:
+                logging.error(f"Background rate refresh failed: {e}")
+            age = crypto_service.get_rates_age()
+
+        # Если обновление не удалось, курсы остаются старыми и повтор будет через RATES_RETRY_INTERVAL
+        delay = max(RATES_TTL - age, RATES_RETRY_INTERVAL) + random.uniform(0, RATES_REFRESH_JITTER)
+        await asyncio.sleep(delay)
+
+
+def start() -> None:
+    """Запустить фоновое обновление курсов"""
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_run())
+        logging.info("Rate refresher started")
+
+
+async def stop() -> None:
+    """Остановить фоновое обновление курсов"""
+    global _task
+    if _task is None:
+        return
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = None
+    logging.info("Rate refresher stopped")
@@ -0,0 +1,81 @@
+"""
+Общий снимок курсов для нескольких процессов
+
+В многопроцессном режиме (WORKER_PROCESSES > 1) курсы по расписанию
+запрашивает только основной процесс: после каждого обновления снимок
+кэша crypto_service записывается в таблицу rates_snapshot (publish).
+Рабочие процессы раз в RATES_SYNC_INTERVAL секунд проверяют версию
+снимка и подставляют новые курсы в свой кэш, пересчитывая таблицу цен.
+В однопроцессном режиме модуль ничего не делает.
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+from bot.config import RATES_SYNC_INTERVAL
+from bot.database import async_db
+from bot.services import crypto_service, price_table
+
+_enabled = False
+_version = 0
+# Версия курсов crypto_service, записанная последним publish
+_published_rates_version: Optional[int] = None
+_task: Optional[asyncio.Task] = None
+
+
+def enable() -> None:
+    """Включить публикацию курсов (вызывается в многопроцессном режиме)"""
+    global _enabled
+    _enabled = True
+
+
+async def publish() -> None:
+    """Записать текущие курсы для других процессов, если они изменились с прошлой публикации"""
+    global _version, _published_rates_version
+    rates_version = crypto_service.get_rates_version()
+    if not _enabled or rates_version == _published_rates_version:
+        return
+    _version = await async_db.save_rates_snapshot(crypto_service.export_rates())
+    _published_rates_version = rates_version
+
+
+async def sync() -> bool:
+    """Подставить курсы из общего снимка, если он новее; True - курсы обновлены"""
+    global _version
+    snapshot = await async_db.get_rates_snapshot(_version)
+    if snapshot is None:
+        return False
+    _version, rates = snapshot
+    crypto_service.apply_rates(rates)
+    price_table.refresh()
+    return True
+
+
+async def _run() -> None:
+    while True:
+        await asyncio.sleep(RATES_SYNC_INTERVAL)
+        try:
+            await sync()
+        except Exception as e:
+            logging.error(f"Failed to sync exchange rates: {e}")
+
+
+def start_sync() -> None:
+    """Запустить периодическое чтение общего снимка курсов"""
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_run())
+
+
+async def stop_sync() -> None:
+    """Остановить чтение снимка курсов"""
+    global _task
+    if _task is None:
+        return
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = None
@@ -0,0 +1,53 @@
+"""
+Поиск товаров
+
+Запрос пользователя ищется в FTS5-индексе products_fts (название и
+описание), последнее слово - как префикс, поэтому результаты появляются
+уже по мере набора inline-запроса. Тем же запросом читаются только
+найденные товары (не больше SEARCH_RESULTS_LIMIT), а суммы в
+криптовалютах берутся из таблицы цен.
+
+Результаты кэшируются по нормализованному тексту запроса и версии
+каталога в базе (catalog.get_db_version, без загрузки всего каталога):
+набор "sna", "snak", "snake" дает три записи, и повтор любого из этих
+префиксов другим пользователем не обращается к базе.
+"""
+
+import re
+from typing import List
+
+from bot.config import SEARCH_CACHE_SIZE, SEARCH_RESULTS_LIMIT
+from bot.database import async_db, catalog
+from bot.database.models import Product
+from bot.services import price_table
+from bot.utils.render_cache import RenderCache
+
+_results = RenderCache(SEARCH_CACHE_SIZE)
+
+
+def normalize_query(text: str) -> str:
+    """Привести запрос к виду, по которому кэшируются результаты"""
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+
+async def search(text: str) -> List[Product]:
+    """Найти товары, самые релевантные первыми"""
+    query = normalize_query(text)
+    if not query:
+        return []
+
+    key = (query, await catalog.get_db_version())
+    products = _results.get(key)
+    if products is None:
+        rows = await async_db.search_products(query, SEARCH_RESULTS_LIMIT)
+        products = [row.with_currencies(catalog.filter_currencies(row.currencies)) for row in rows]
+        _results.put(key, products)
+    return products
+
+
+def format_prices(product: Product) -> str:
+    """Цена товара в рублях и суммы в доступных криптовалютах"""
+    amounts = price_table.get_amounts(product.id, product.price_rub, product.currencies)
+    parts = [f"{product.price_rub} ₽"]
+    parts.extend(f"{amount} {currency}" for currency, amount in amounts.items())
+    return " · ".join(parts)
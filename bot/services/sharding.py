@@ -0,0 +1,174 @@
+"""
+Распределение обновлений Telegram между рабочими процессами
+
+Основной процесс получает обновления (long polling через getUpdates или
+вебхук) и раскладывает их по очередям рабочих процессов по ID
+пользователя: все обновления одного пользователя попадают в один процесс,
+поэтому его состояние FSM и корзины ограничения частоты живут в одном
+месте. Рабочий процесс обрабатывает обновления разных пользователей
+параллельно (не больше WORKER_CONCURRENCY одновременно), а обновления
+одного пользователя - строго по порядку.
+
+Общие данные процессы берут из SQLite: товары и заказы, состояния FSM
+(fsm_states) и снимок курсов (rates_snapshot, см. rates_store). Доставка,
+фоновая проверка счетов и вебхуки Crypto Pay работают только в основном
+процессе.
+"""
+
+import asyncio
+import logging
+from queue import Empty, Full
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+
+from bot.config import TELEGRAM_WEBHOOK_PATH, WORKER_CONCURRENCY
+from bot.services import http_client
+
+# Сколько секунд Telegram держит запрос getUpdates без новых обновлений
+POLLING_TIMEOUT = 30
+# Пауза после ошибки getUpdates, в секундах
+POLLING_RETRY_DELAY = 5
+
+
+def get_update_user_id(update: Dict[str, Any]) -> Optional[int]:
+    """ID пользователя (или чата), от которого пришло обновление"""
+    for field, event in update.items():
+        if field == "update_id" or not isinstance(event, dict):
+            continue
+        user = event.get("from") or event.get("user")
+        if user:
+            return user["id"]
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+    return None
+
+
+def get_shard(update: Dict[str, Any], shards: int) -> int:
+    """Номер рабочего процесса для обновления"""
+    user_id = get_update_user_id(update)
+    if user_id is None:
+        # Обновления без пользователя (например, опросы) распределяем по их ID
+        user_id = update.get("update_id", 0)
+    return user_id % shards
+
+
+class ShardRouter:
+    """Раскладывает обновления по очередям рабочих процессов (multiprocessing.Queue)"""
+
+    def __init__(self, queues: List[Any]):
+        self.queues = queues
+        self.dispatched = 0
+
+    async def dispatch(self, update: Dict[str, Any]) -> None:
+        """Передать обновление рабочему процессу; ждет, если его очередь заполнена"""
+        queue = self.queues[get_shard(update, len(self.queues))]
+        try:
+            queue.put_nowait(update)
+        except Full:
+            # Очередь заполнена: ждем в отдельном потоке, не блокируя цикл событий
+            await asyncio.get_running_loop().run_in_executor(None, queue.put, update)
+        self.dispatched += 1
+
+    async def close(self) -> None:
+        """Сообщить рабочим процессам, что обновлений больше не будет"""
+        loop = asyncio.get_running_loop()
+        for queue in self.queues:
+            await loop.run_in_executor(None, queue.put, None)
+
+
+async def poll_updates(bot: Bot, router: ShardRouter, allowed_updates: List[str], stop_event: asyncio.Event) -> None:
+    """
+    Получать обновления через getUpdates и передавать их рабочим процессам
+
+    Ответ getUpdates не превращается в объекты aiogram: основному процессу
+    нужен только ID пользователя, а разбор выполняют рабочие процессы.
+    """
+    url = bot.session.api.api_url(token=bot.token, method="getUpdates")
+    timeout = aiohttp.ClientTimeout(total=POLLING_TIMEOUT + 10)
+    offset = 0
+    while not stop_event.is_set():
+        payload = {"offset": offset, "timeout": POLLING_TIMEOUT, "allowed_updates": allowed_updates}
+        try:
+            async with http_client.get_session().post(url, json=payload, timeout=timeout) as response:
+                data = await response.json()
+            if not data.get("ok"):
+                raise RuntimeError(data.get("description"))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"getUpdates failed: {e}")
+            await asyncio.sleep(POLLING_RETRY_DELAY)
+            continue
+
+        for update in data["result"]:
+            await router.dispatch(update)
+            offset = update["update_id"] + 1
+
+
+def create_webhook_app(router: ShardRouter, secret_token: Optional[str] = None,
+                       path: str = TELEGRAM_WEBHOOK_PATH) -> web.Application:
+    """Приложение aiohttp, принимающее вебхук Telegram и передающее обновления рабочим процессам"""
+
+    async def handle(request: web.Request) -> web.Response:
+        if secret_token and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret_token:
+            return web.Response(status=401)
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        await router.dispatch(update)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(path, handle)
+    return app
+
+
+async def run_worker(dispatcher: Dispatcher, bot: Bot, queue: Any, concurrency: int = WORKER_CONCURRENCY) -> None:
+    """
+    Обрабатывать обновления из очереди рабочего процесса до получения None
+
+    Следующее обновление пользователя ждет завершения предыдущего. Когда
+    выполняется concurrency обработчиков, чтение очереди приостанавливается,
+    и основной процесс упирается в заполненную очередь.
+    """
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(concurrency)
+    tails: Dict[Any, asyncio.Task] = {}
+
+    async def process(update: Dict[str, Any], previous: Optional[asyncio.Task]) -> None:
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            await dispatcher.feed_raw_update(bot, update)
+        except Exception as e:
+            logging.error(f"Failed to process update {update.get('update_id')}: {e}", exc_info=True)
+        finally:
+            slots.release()
+
+    def forget(user_id: Any, task: asyncio.Task) -> None:
+        if tails.get(user_id) is task:
+            del tails[user_id]
+
+    while True:
+        # Уже пришедшие обновления забираем без переключения на поток
+        try:
+            update = queue.get_nowait()
+        except Empty:
+            update = await loop.run_in_executor(None, queue.get)
+        if update is None:
+            break
+        await slots.acquire()
+        user_id = get_update_user_id(update)
+        if user_id is None:
+            user_id = ("update", update.get("update_id"))
+        task = asyncio.create_task(process(update, tails.get(user_id)))
+        tails[user_id] = task
+        task.add_done_callback(lambda done, user_id=user_id: forget(user_id, done))
+
+    if tails:
+        await asyncio.wait(list(tails.values()))
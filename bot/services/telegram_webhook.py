@@ -0,0 +1,92 @@
+"""
+Прием обновлений Telegram через вебхук
+
+Используется интеграция aiogram с aiohttp: запрос проверяется по
+секрету X-Telegram-Bot-Api-Secret-Token, обновление кладется в
+ограниченную очередь, и Telegram сразу получает ответ. Очередь разбирает
+фиксированный пул обработчиков, поэтому число одновременно выполняемых
+хендлеров не превышает TELEGRAM_WEBHOOK_WORKERS. Когда очередь заполнена,
+запрос ждет свободного места, и Telegram притормаживает отправку.
+
+При остановке сервер перестает принимать запросы, а уже принятые
+обновления обрабатываются в течение TELEGRAM_WEBHOOK_DRAIN_TIMEOUT секунд.
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from bot.config import (
+    TELEGRAM_WEBHOOK_PATH, TELEGRAM_WEBHOOK_WORKERS, TELEGRAM_WEBHOOK_QUEUE_SIZE, TELEGRAM_WEBHOOK_DRAIN_TIMEOUT
+)
+
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    """Обработчик вебхука aiogram с ограниченной очередью и пулом обработчиков"""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: Optional[str] = None,
+                 workers: int = TELEGRAM_WEBHOOK_WORKERS, queue_size: int = TELEGRAM_WEBHOOK_QUEUE_SIZE,
+                 drain_timeout: float = TELEGRAM_WEBHOOK_DRAIN_TIMEOUT, **data: Any):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token, **data)
+        self._workers_count = workers
+        self._queue_size = queue_size
+        self._drain_timeout = drain_timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    def register(self, app: web.Application, /, path: str, **kwargs: Any) -> None:
+        app.on_startup.append(self._start_workers)
+        super().register(app, path=path, **kwargs)
+
+    async def _start_workers(self, *args: Any, **kwargs: Any) -> None:
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self._workers_count)]
+        logging.info(f"Webhook workers started: {self._workers_count}, queue size {self._queue_size}")
+
+    async def _work(self) -> None:
+        while True:
+            update = await self._queue.get()
+            try:
+                await self._background_feed_update(bot=self.bot, update=update)
+            except Exception as e:
+                logging.error(f"Error processing webhook update: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update: Dict[str, Any] = await request.json(loads=bot.session.json_loads)
+        await self._queue.put(update)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def drain(self) -> None:
+        """Дождаться обработки принятых обновлений и остановить обработчики"""
+        if self._queue is not None and self._queue.qsize():
+            logging.info(f"Draining {self._queue.qsize()} webhook updates...")
+        try:
+            if self._queue is not None:
+                await asyncio.wait_for(self._queue.join(), timeout=self._drain_timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Webhook drain timed out, {self._queue.qsize()} updates dropped")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def close(self) -> None:
+        # aiohttp вызывает close при остановке приложения, уже после закрытия
+        # слушающего сокета: сначала разбираем очередь, затем закрываем сессию бота
+        await self.drain()
+        await super().close()
+
+
+def create_app(dispatcher: Dispatcher, bot: Bot, secret_token: Optional[str] = None,
+               path: str = TELEGRAM_WEBHOOK_PATH, **kwargs: Any) -> web.Application:
+    """Создать приложение aiohttp, принимающее обновления Telegram"""
+    app = web.Application()
+    QueuedRequestHandler(dispatcher, bot, secret_token=secret_token, **kwargs).register(app, path=path)
+    setup_application(app, dispatcher, bot=bot)
+    return app
@@ -0,0 +1,130 @@
+"""
+Гистограммы задержек горячих путей
+
+Обработчики, запросы к базе, Crypto Pay, API курсов и Bot API записывают
+время выполнения в гистограммы по имени (например, "handler.process_purchase"
+или "db.get_product"). Гистограмма устроена как HDR Histogram: значения в
+микросекундах раскладываются по корзинам с относительной точностью около 1%,
+поэтому запись - это несколько целочисленных операций и инкремент в словаре,
+а перцентили считаются только при выводе отчета.
+
+Гистограммы живут в памяти процесса и заполняются из цикла событий, поэтому
+блокировки не нужны. Сбор отключается настройкой LATENCY_METRICS_ENABLED.
+"""
+
+import functools
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from bot.config import LATENCY_METRICS_ENABLED
+
+# 128 корзин на значения до 128 мкс, дальше по 64 корзины на каждую степень двойки
+_SUB_BUCKET_BITS = 7
+_SUB_BUCKETS = 1 << _SUB_BUCKET_BITS
+_HALF_SUB_BUCKETS = _SUB_BUCKETS >> 1
+
+T = TypeVar("T")
+
+
+def _bucket_index(value: int) -> int:
+    if value < _SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - _SUB_BUCKET_BITS
+    return shift * _HALF_SUB_BUCKETS + (value >> shift)
+
+
+def _bucket_value(index: int) -> int:
+    """Середина диапазона значений корзины, в микросекундах"""
+    if index < _SUB_BUCKETS:
+        return index
+    shift = index // _HALF_SUB_BUCKETS - 1
+    low = (index - shift * _HALF_SUB_BUCKETS) << shift
+    return low + ((1 << shift) - 1) // 2
+
+
+class Histogram:
+    """Гистограмма задержек с логарифмическими корзинами"""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, seconds: float) -> None:
+        """Записать одно измерение"""
+        value = int(seconds * 1_000_000)
+        index = _bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent: float) -> float:
+        """Значение перцентиля в секундах"""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(self.count * percent / 100 + 0.5))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(_bucket_value(index), self.max) / 1_000_000
+        return self.max / 1_000_000
+
+    def summary(self) -> Dict[str, float]:
+        """Число измерений, среднее, p50/p95/p99 и максимум в секундах"""
+        return {
+            "count": self.count,
+            "mean": self.total / self.count / 1_000_000 if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max / 1_000_000,
+        }
+
+
+_histograms: Dict[str, Histogram] = {}
+
+
+def record(name: str, seconds: float) -> None:
+    """Записать время выполнения в гистограмму name"""
+    if not LATENCY_METRICS_ENABLED:
+        return
+    histogram = _histograms.get(name)
+    if histogram is None:
+        histogram = _histograms[name] = Histogram()
+    histogram.record(seconds)
+
+
+def get_histogram(name: str) -> Optional[Histogram]:
+    return _histograms.get(name)
+
+
+def get_histograms() -> List[Tuple[str, Histogram]]:
+    """Все гистограммы, отсортированные по имени"""
+    return sorted(_histograms.items())
+
+
+def reset() -> None:
+    """Удалить все накопленные измерения"""
+    _histograms.clear()
+
+
+def timed(name: str) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """Декоратор асинхронной функции, записывающий время ее выполнения (в том числе с ошибкой)"""
+
+    def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+
+    return decorator
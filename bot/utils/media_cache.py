@@ -0,0 +1,68 @@
+"""
+Кэш file_id файлов товаров
+
+Первая отправка файла загружает его в Telegram, а полученный file_id
+сохраняется в таблице media_cache с ключом (путь, SHA-256 содержимого).
+Следующие отправки используют file_id без повторной загрузки. Если файл
+изменился, меняется хэш, и файл загружается заново.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, Message
+
+from bot.database import async_db
+
+# Хэши файлов по ключу (путь, mtime, размер), чтобы не перечитывать файл на каждую доставку
+_hashes: Dict[Tuple[str, int, int], str] = {}
+
+
+def _hash_file(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def get_content_hash(file_path: str) -> str:
+    """Получить SHA-256 содержимого файла (пересчитывается при изменении файла)"""
+    stat = os.stat(file_path)
+    key = (file_path, stat.st_mtime_ns, stat.st_size)
+    content_hash = _hashes.get(key)
+    if content_hash is None:
+        loop = asyncio.get_running_loop()
+        content_hash = await loop.run_in_executor(None, _hash_file, file_path)
+        _hashes[key] = content_hash
+    return content_hash
+
+
+async def send_document(bot: Bot, chat_id: int, file_path: str, file_name: Optional[str] = None,
+                        caption: Optional[str] = None) -> Message:
+    """Отправить файл по сохраненному file_id или загрузить его и запомнить file_id"""
+    content_hash = await get_content_hash(file_path)
+
+    file_id = await async_db.get_media_file_id(file_path, content_hash)
+    if file_id:
+        try:
+            return await bot.send_document(chat_id, document=file_id, caption=caption)
+        except TelegramBadRequest as e:
+            # file_id мог стать недействительным (например, после смены бота)
+            logging.warning(f"Cached file_id for {file_path} rejected, uploading again: {e}")
+            await async_db.delete_media_file_id(file_path, content_hash)
+
+    message = await bot.send_document(
+        chat_id,
+        document=FSInputFile(file_path, filename=file_name),
+        caption=caption
+    )
+    if message.document:
+        await async_db.save_media_file_id(file_path, content_hash, message.document.file_id)
+        logging.info(f"Cached file_id for {file_path}")
+    return message
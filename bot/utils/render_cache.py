@@ -0,0 +1,51 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class RenderCache:
+    """
+    LRU-кэш готовых текстов сообщений и клавиатур
+
+    Ключ должен включать все, от чего зависит результат (например, версию
+    каталога и версию курсов), поэтому устаревшие записи не сбрасываются
+    явно, а вытесняются, когда кэш заполнен.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: Hashable) -> Any:
+        """Вернуть закэшированный результат или None"""
+        try:
+            value = self._items[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._items.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Сохранить результат, вытеснив самую давнюю запись при переполнении"""
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def get_or_render(self, key: Hashable, render: Callable[..., Any], *args: Any) -> Any:
+        """Вернуть закэшированный результат или вызвать render(*args) и сохранить его"""
+        value = self.get(key)
+        if value is None:
+            value = render(*args)
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        """Удалить все записи"""
+        self._items.clear()
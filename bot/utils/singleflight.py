@@ -0,0 +1,35 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Объединение одновременных вызовов с одинаковым ключом
+
+    Пока вызов для ключа выполняется, остальные вызывающие получают
+    результат того же вызова вместо запуска нового. Отмена одного из
+    ожидающих не отменяет общий вызов.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        """Проверить, выполняется ли сейчас вызов для ключа"""
+        return key in self._calls
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+        """Выполнить func(*args, **kwargs) или присоединиться к уже идущему вызову"""
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(future)
+
+    def _forget(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        # Забираем исключение, чтобы оно не логировалось, если все ожидающие отменены
+        if not future.cancelled():
+            future.exception()
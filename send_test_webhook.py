@@ -0,0 +1,62 @@
+import argparse
+import json
+import sys
+import os
+import time
+import urllib.request
+import urllib.error
+
+# Добавляем текущую директорию в sys.path для импорта модулей bot
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bot.config import CRYPTO_PAY_TOKEN, CRYPTO_PAY_WEBHOOK_PORT, CRYPTO_PAY_WEBHOOK_PATH
+from bot.services.cryptopay_webhook import SIGNATURE_HEADER, sign_body
+
+def build_update(invoice_id: int, order_id: int) -> dict:
+    """Собрать обновление invoice_paid в формате Crypto Pay"""
+    return {
+        "update_id": int(time.time()),
+        "update_type": "invoice_paid",
+        "request_date": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+        "payload": {
+            "invoice_id": invoice_id,
+            "status": "paid",
+            "payload": f"order_{order_id}",
+            "paid_at": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+        }
+    }
+
+def send_update(url: str, update: dict, token: str) -> int:
+    """Отправить подписанное обновление и вернуть HTTP-статус ответа"""
+    body = json.dumps(update).encode()
+    request = urllib.request.Request(
+        url,
+        data=body,
+        headers={"Content-Type": "application/json", SIGNATURE_HEADER: sign_body(body, token)},
+        method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description='Send a signed Crypto Pay invoice_paid webhook to a local bot')
+    parser.add_argument('--invoice-id', '-i', type=int, required=True, help='Invoice ID stored in the order')
+    parser.add_argument('--order-id', '-o', type=int, required=True, help='Order ID from the invoice payload')
+    parser.add_argument('--url', '-u', default=f"http://127.0.0.1:{CRYPTO_PAY_WEBHOOK_PORT}{CRYPTO_PAY_WEBHOOK_PATH}",
+                        help='Webhook URL')
+    parser.add_argument('--repeat', '-r', type=int, default=1, help='Send the same update several times')
+    parser.add_argument('--bad-signature', action='store_true', help='Sign with a wrong token')
+    
+    args = parser.parse_args()
+    
+    update = build_update(args.invoice_id, args.order_id)
+    token = "wrong-token" if args.bad_signature else CRYPTO_PAY_TOKEN
+    for _ in range(args.repeat):
+        print(f"HTTP {send_update(args.url, update, token)}")
+
+if __name__ == "__main__":
+    main()